@@ -0,0 +1,454 @@
+"""
+Bulk NDJSON export and import of conversations.
+
+The format is one JSON object per line, grouped by conversation:
+
+    {"type": "conversation", "conversation_id": ..., "created_at": ..., "updated_at": ...}
+    {"type": "summary", "conversation_id": ..., "summary": ..., "summarized_through_id": ..., "token_count": ...}
+    {"type": "message", "conversation_id": ..., "id": ..., "role": ..., "content": ..., "timestamp": ..., "token_count": ...}
+    ...
+    {"type": "done", "count": ...}
+
+A stream without the trailing `done` record was cut short.
+
+Export walks conversations in primary-key order and their messages in id
+order with keyset queries of at most EXPORT_CHUNK_SIZE rows, so memory stays
+constant and no read transaction (or pooled reader) is held for the length of
+the export. Archived conversations are exported from their archive blob
+without being rehydrated. Each conversation is consistent; the export as a
+whole is not a point-in-time snapshot of a database that is being written.
+
+Import reads the same format and writes IMPORT_BATCH_SIZE records per
+transaction with `executemany`. With `preserve_ids` (the default) message ids
+are kept and an id that the same conversation already has is skipped, so
+re-running an import is harmless. An id held by a different conversation
+stops the import with ImportConflictError before that batch writes anything.
+Otherwise messages get new ids in file order and summaries, which refer to
+message ids, are skipped.
+
+Usage (from the repository root):
+    python -m api.bulk export --db conversations.db --output conversations.ndjson.gz --since 2024-01-01
+    python -m api.bulk import --db copy.db --input conversations.ndjson.gz
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Deque, Iterable, Iterator, List, Optional
+
+from api.context import count_tokens
+from api.db import ConnectionPool
+from api.maintenance import decompress, rehydrate_conversation
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))  # records read per query
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))  # records written per transaction
+
+CONVERSATIONS_PER_QUERY = 100
+IDS_PER_QUERY = 500  # below SQLite's bound-parameter limit
+CONFLICTS_SHOWN = 20
+# Offline (CLI) imports only: preserved ids scatter inserts over the whole table,
+# so a large cache and fewer, larger checkpoints (WAL up to ~256 MiB) pay off
+BULK_LOAD_PRAGMAS = {"cache_size": -256 * 1024, "wal_autocheckpoint": 65536}
+
+
+class InvalidRecordError(ValueError):
+    """Raised for an import line that is not a valid record"""
+
+
+class ImportConflictError(InvalidRecordError):
+    """Raised when preserved message ids already belong to other conversations"""
+
+    def __init__(self, ids: List[int]):
+        self.ids = ids
+        shown = ", ".join(str(message_id) for message_id in ids[:CONFLICTS_SHOWN])
+        more = f" and {len(ids) - CONFLICTS_SHOWN} more" if len(ids) > CONFLICTS_SHOWN else ""
+        super().__init__(
+            f"Message ids already used by other conversations: {shown}{more} "
+            "(import with new ids instead to keep these messages)"
+        )
+
+
+def sqlite_time(value: Optional[str]) -> Optional[str]:
+    """ISO 8601 timestamp (any offset) as the UTC text SQLite's CURRENT_TIMESTAMP stores"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Export
+
+@dataclass
+class ExportCursor:
+    """Where an export stands between chunks"""
+
+    updated_since: Optional[str] = None  # SQLite UTC text, inclusive
+    updated_before: Optional[str] = None  # exclusive
+    last_conversation_id: str = ""
+    pending: Deque[tuple] = field(default_factory=deque)  # conversations fetched but not started
+    current: Optional[str] = None  # conversation whose messages are being exported
+    last_message_id: int = 0
+    archived: List[list] = field(default_factory=list)  # undelivered archive records of `current`
+    done: bool = False
+
+
+def _message_record(conversation_id: str, message_id, role, content, timestamp, token_count) -> dict:
+    return {
+        "type": "message",
+        "conversation_id": conversation_id,
+        "id": message_id,
+        "role": role,
+        "content": content,
+        "timestamp": timestamp,
+        "token_count": token_count,
+    }
+
+
+def export_chunk(pool: ConnectionPool, cursor: ExportCursor, limit: int = EXPORT_CHUNK_SIZE) -> List[dict]:
+    """Up to `limit` further records; an empty list (with `cursor.done`) when the export is complete"""
+    records: List[dict] = []
+    with pool.reader() as conn:
+        while len(records) < limit and not cursor.done:
+            if cursor.current is None:
+                if not cursor.pending:
+                    _fetch_conversations(conn, cursor)
+                    continue
+                conversation_id, created_at, updated_at = cursor.pending.popleft()
+                records.append({
+                    "type": "conversation",
+                    "conversation_id": conversation_id,
+                    "created_at": created_at,
+                    "updated_at": updated_at,
+                })
+                summary = conn.execute(
+                    "SELECT summary, summarized_through_id, token_count FROM conversation_summaries "
+                    "WHERE conversation_id = ?",
+                    (conversation_id,),
+                ).fetchone()
+                if summary:
+                    records.append({
+                        "type": "summary",
+                        "conversation_id": conversation_id,
+                        "summary": summary[0],
+                        "summarized_through_id": summary[1],
+                        "token_count": summary[2],
+                    })
+                archive = conn.execute(
+                    "SELECT codec, payload FROM archived_conversations WHERE conversation_id = ?", (conversation_id,)
+                ).fetchone()
+                cursor.current = conversation_id
+                cursor.last_message_id = 0
+                cursor.archived = json.loads(decompress(archive[1], archive[0])) if archive else []
+                cursor.archived.reverse()  # popped from the end, oldest first
+                continue
+
+            wanted = limit - len(records)
+            # Archived messages predate anything written to the hot table since
+            while cursor.archived and wanted:
+                message_id, role, content, timestamp, token_count = cursor.archived.pop()
+                records.append(_message_record(cursor.current, message_id, role, content, timestamp, token_count))
+                cursor.last_message_id = message_id
+                wanted -= 1
+            if not wanted:
+                break
+            rows = conn.execute(
+                "SELECT id, role, content, timestamp, token_count FROM messages "
+                "WHERE conversation_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (cursor.current, cursor.last_message_id, wanted),
+            ).fetchall()
+            for row in rows:
+                records.append(_message_record(cursor.current, *row))
+            if rows:
+                cursor.last_message_id = rows[-1][0]
+            if len(rows) < wanted:
+                cursor.current = None
+    return records
+
+
+def _fetch_conversations(conn: sqlite3.Connection, cursor: ExportCursor):
+    clauses = ["conversation_id > ?"]
+    params: list = [cursor.last_conversation_id]
+    if cursor.updated_since:
+        clauses.append("updated_at >= ?")
+        params.append(cursor.updated_since)
+    if cursor.updated_before:
+        clauses.append("updated_at < ?")
+        params.append(cursor.updated_before)
+    rows = conn.execute(
+        f"SELECT conversation_id, created_at, updated_at FROM conversations WHERE {' AND '.join(clauses)} "
+        "ORDER BY conversation_id LIMIT ?",
+        params + [CONVERSATIONS_PER_QUERY],
+    ).fetchall()
+    if not rows:
+        cursor.done = True
+        return
+    cursor.pending.extend(tuple(row) for row in rows)
+    cursor.last_conversation_id = rows[-1][0]
+
+
+def export_records(pool: ConnectionPool, cursor: ExportCursor, limit: int = EXPORT_CHUNK_SIZE) -> Iterator[dict]:
+    """Every record of an export, one chunk in memory at a time, then the `done` trailer"""
+    count = 0
+    while not cursor.done:
+        records = export_chunk(pool, cursor, limit)
+        count += len(records)
+        yield from records
+    yield {"type": "done", "count": count}
+
+
+def encode(record: dict) -> str:
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+# Import
+
+REQUIRED_FIELDS = {
+    "conversation": ("conversation_id",),
+    "summary": ("conversation_id", "summary", "summarized_through_id"),
+    "message": ("conversation_id", "role", "content"),
+    "done": (),  # export trailer
+}
+TIMESTAMP_FIELDS = ("created_at", "updated_at", "timestamp")
+# Checked when present (and not null); SQLite would otherwise store or reject them unpredictably
+FIELD_TYPES = {
+    "conversation_id": str,
+    "role": str,
+    "content": str,
+    "summary": str,
+    "id": int,
+    "summarized_through_id": int,
+    "token_count": int,
+}
+
+
+def parse_record(line: str, line_number: int) -> Optional[dict]:
+    """One import line as a record (None for blank lines)"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise InvalidRecordError(f"Line {line_number}: invalid JSON ({e.msg})") from None
+    if not isinstance(record, dict) or record.get("type") not in REQUIRED_FIELDS:
+        raise InvalidRecordError(f"Line {line_number}: expected an object with type conversation, summary or message")
+    missing = [name for name in REQUIRED_FIELDS[record["type"]] if record.get(name) is None]
+    if missing:
+        raise InvalidRecordError(f"Line {line_number}: {record['type']} record is missing {', '.join(missing)}")
+    for name, expected in FIELD_TYPES.items():
+        value = record.get(name)
+        if value is not None and (not isinstance(value, expected) or isinstance(value, bool)):
+            kind = "an integer" if expected is int else "a string"
+            raise InvalidRecordError(f"Line {line_number}: {name} must be {kind}")
+    for name in TIMESTAMP_FIELDS:
+        try:
+            sqlite_time(record.get(name))
+        except (TypeError, ValueError):
+            raise InvalidRecordError(f"Line {line_number}: {name} is not an ISO 8601 timestamp") from None
+    return record if record["type"] != "done" else None
+
+
+def new_import_stats() -> dict:
+    return {"conversations": 0, "summaries": 0, "messages": 0, "skipped": 0}
+
+
+def write_import_batch(conn: sqlite3.Connection, records: List[dict], preserve_ids: bool = True) -> dict:
+    """Write one batch of records; the caller owns the transaction"""
+    stats = new_import_stats()
+    conversations = [r for r in records if r["type"] == "conversation"]
+    summaries = [r for r in records if r["type"] == "summary"]
+    messages = [r for r in records if r["type"] == "message"]
+
+    conn.executemany(
+        """
+        INSERT INTO conversations (conversation_id, created_at, updated_at)
+        VALUES (?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+        ON CONFLICT(conversation_id) DO UPDATE SET
+            created_at = MIN(created_at, excluded.created_at),
+            updated_at = MAX(updated_at, excluded.updated_at)
+        """,
+        [(r["conversation_id"], sqlite_time(r.get("created_at")), sqlite_time(r.get("updated_at")))
+         for r in conversations],
+    )
+    stats["conversations"] = len(conversations)
+    # Records of conversations whose conversation line is in another batch (or missing)
+    touched = list(dict.fromkeys(r["conversation_id"] for r in summaries + messages))
+    conn.executemany("INSERT OR IGNORE INTO conversations (conversation_id) VALUES (?)", [(cid,) for cid in touched])
+    # Imported rows land in the hot table; an archived conversation joins them there first
+    for cid in touched:
+        rehydrate_conversation(conn, cid)
+
+    if preserve_ids:
+        _check_id_conflicts(conn, messages)
+        cursor = conn.executemany(
+            """
+            INSERT INTO conversation_summaries (conversation_id, summary, summarized_through_id, token_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(conversation_id) DO UPDATE SET
+                summary = excluded.summary,
+                summarized_through_id = excluded.summarized_through_id,
+                token_count = excluded.token_count,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE excluded.summarized_through_id > conversation_summaries.summarized_through_id
+            """,
+            [(r["conversation_id"], r["summary"], r["summarized_through_id"],
+              r.get("token_count") or count_tokens(r["summary"])) for r in summaries],
+        )
+        # rowcount leaves out rows the search-index triggers write
+        stats["summaries"] = max(cursor.rowcount, 0)
+        stats["skipped"] += len(summaries) - stats["summaries"]
+    else:
+        stats["skipped"] += len(summaries)  # they point at the original message ids
+
+    rows = [
+        (r["conversation_id"], r["role"], r["content"], sqlite_time(r.get("timestamp")),
+         r.get("token_count") or count_tokens(r["content"]))
+        for r in messages
+    ]
+    if preserve_ids:
+        cursor = conn.executemany(
+            "INSERT OR IGNORE INTO messages (id, conversation_id, role, content, timestamp, token_count) "
+            "VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)",
+            [(r.get("id"),) + row for r, row in zip(messages, rows)],
+        )
+    else:
+        cursor = conn.executemany(
+            "INSERT INTO messages (conversation_id, role, content, timestamp, token_count) "
+            "VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)",
+            rows,
+        )
+    inserted = max(cursor.rowcount, 0)
+    stats["messages"] = inserted
+    stats["skipped"] += len(messages) - inserted
+    return stats
+
+
+def _check_id_conflicts(conn: sqlite3.Connection, messages: List[dict]):
+    """Raise ImportConflictError for preserved ids that another conversation's message already has"""
+    owners = {}
+    conflicts = set()
+    for r in messages:
+        if r.get("id") is not None:
+            if owners.setdefault(r["id"], r["conversation_id"]) != r["conversation_id"]:
+                conflicts.add(r["id"])
+    ids = list(owners)
+    for start in range(0, len(ids), IDS_PER_QUERY):
+        chunk = ids[start:start + IDS_PER_QUERY]
+        rows = conn.execute(
+            f"SELECT id, conversation_id FROM messages WHERE id IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall()
+        conflicts.update(message_id for message_id, owner in rows if owner != owners[message_id])
+    if conflicts:
+        raise ImportConflictError(sorted(conflicts))
+
+
+def tune_for_bulk_load(pool: ConnectionPool):
+    """Apply BULK_LOAD_PRAGMAS to the writer of a pool nothing else is using"""
+    with pool.writer() as conn:
+        for name, value in BULK_LOAD_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+
+def add_stats(total: dict, batch: dict):
+    for key, value in batch.items():
+        total[key] += value
+
+
+def import_lines(
+    pool: ConnectionPool,
+    lines: Iterable[str],
+    preserve_ids: bool = True,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> dict:
+    """Import NDJSON lines, committing every `batch_size` records"""
+    totals = new_import_stats()
+    batch: List[dict] = []
+    for line_number, line in enumerate(lines, start=1):
+        record = parse_record(line, line_number)
+        if record is None:
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            with pool.writer() as conn:
+                add_stats(totals, write_import_batch(conn, batch, preserve_ids))
+            batch = []
+    if batch:
+        with pool.writer() as conn:
+            add_stats(totals, write_import_batch(conn, batch, preserve_ids))
+    return totals
+
+
+# CLI
+
+def _open(path: str, mode: str):
+    """File, gzip file (by .gz extension) or stdin/stdout for "-" """
+    if path == "-":
+        return sys.stdin if "r" in mode else sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    return open(path, mode, encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write conversations as NDJSON")
+    export_parser.add_argument("--db", default=os.getenv("DB_PATH", "conversations.db"))
+    export_parser.add_argument("--output", default="-", help="File (.gz to compress) or - for stdout")
+    export_parser.add_argument("--since", help="Only conversations updated at or after this ISO time")
+    export_parser.add_argument("--before", help="Only conversations updated before this ISO time")
+    import_parser = commands.add_parser("import", help="Load conversations from NDJSON")
+    import_parser.add_argument("--db", default=os.getenv("DB_PATH", "conversations.db"))
+    import_parser.add_argument("--input", default="-", help="File (.gz if compressed) or - for stdin")
+    import_parser.add_argument("--new-ids", action="store_true", help="Assign new message ids instead of keeping them")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    from api.migrations import migrate
+
+    pool = ConnectionPool(args.db)
+    began = time.perf_counter()
+    try:
+        with pool.writer() as conn:
+            migrate(conn)
+        if args.command == "export":
+            cursor = ExportCursor(sqlite_time(args.since), sqlite_time(args.before))
+            count = size = 0
+            with _open(args.output, "w") as out:
+                for record in export_records(pool, cursor):
+                    line = encode(record)
+                    out.write(line)
+                    count += 1
+                    size += len(line)
+            summary = f"Exported {count:,} records ({size / 2**20:,.1f} MiB uncompressed)"
+        else:
+            tune_for_bulk_load(pool)
+            with _open(args.input, "r") as lines:
+                stats = import_lines(pool, lines, preserve_ids=not args.new_ids)
+            with pool.writer() as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            count = sum(stats.values())
+            summary = (f"Imported {stats['conversations']:,} conversations, {stats['messages']:,} messages, "
+                       f"{stats['summaries']:,} summaries; skipped {stats['skipped']:,}")
+    except InvalidRecordError as e:
+        raise SystemExit(f"Import stopped: {e} (earlier batches were committed)")
+    finally:
+        pool.close()
+    elapsed = time.perf_counter() - began
+    print(f"{summary} in {elapsed:.1f} s ({count / elapsed:,.0f} records/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Token-budgeted prompt context with rolling conversation summaries.
+
+Every message stores its token count when it is written. Building the prompt
+walks the conversation newest-first through the message index and stops once
+the configured token budget is spent, so the work per turn is bounded by the
+budget rather than the length of the conversation.
+
+Turns that fall out of the window are folded into a per-conversation summary
+that is persisted in `conversation_summaries` and updated incrementally in the
+background: only messages newer than `summarized_through_id` are sent to the
+model, together with the previous summary.
+"""
+
+import logging
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency; fall back to a character heuristic
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # history tokens sent per turn
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", "1000"))  # unsummarized tokens before refreshing
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "You maintain the memory of a supportive mental coach. Update the running summary "
+    "of the conversation with the new messages below. Keep what matters for future "
+    "coaching: the user's situation, goals, feelings, preferences and the advice already "
+    "given. Be concise and write in the third person."
+)
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of tokens a message costs in the prompt"""
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text)) + MESSAGE_OVERHEAD_TOKENS
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1 + MESSAGE_OVERHEAD_TOKENS
+
+
+def create_schema(conn: sqlite3.Connection):
+    """Add the token count column and the summaries table"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+    if "token_count" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN token_count INTEGER")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            conversation_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            summarized_through_id INTEGER NOT NULL,
+            token_count INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+@dataclass
+class ContextWindow:
+    """The summary plus the newest messages of a conversation that fit the token budget"""
+
+    summary: Optional[str] = None
+    summary_tokens: int = 0
+    messages: List[dict] = field(default_factory=list)  # oldest first
+    token_counts: List[int] = field(default_factory=list)
+    truncated: bool = False  # True when unsummarized messages were left out of the window
+    oldest_id: Optional[int] = None  # id of messages[0] when loaded from the database
+
+    def copy(self) -> "ContextWindow":
+        """Independent copy that can be appended to without touching the original"""
+        return ContextWindow(
+            summary=self.summary,
+            summary_tokens=self.summary_tokens,
+            messages=list(self.messages),
+            token_counts=list(self.token_counts),
+            truncated=self.truncated,
+            oldest_id=self.oldest_id,
+        )
+
+    def append(self, role: str, content: str, tokens: int, budget: int = CONTEXT_TOKEN_BUDGET):
+        """Add a message and drop the oldest ones that no longer fit the budget"""
+        self.messages.append({"role": role, "content": content})
+        self.token_counts.append(tokens)
+        available = budget - self.summary_tokens
+        used = sum(self.token_counts)
+        while self.messages and used > available:
+            used -= self.token_counts.pop(0)
+            self.messages.pop(0)
+            self.truncated = True
+            self.oldest_id = None
+
+
+def load_context(
+    conn: sqlite3.Connection, conversation_id: str, budget: int = CONTEXT_TOKEN_BUDGET
+) -> ContextWindow:
+    """Load the summary and the newest messages that fit in `budget` tokens"""
+    window = ContextWindow()
+    summary_row = conn.execute(
+        "SELECT summary, summarized_through_id, token_count FROM conversation_summaries WHERE conversation_id = ?",
+        (conversation_id,),
+    ).fetchone()
+    summarized_through = 0
+    if summary_row:
+        window.summary = summary_row["summary"]
+        window.summary_tokens = summary_row["token_count"]
+        summarized_through = summary_row["summarized_through_id"]
+        budget -= window.summary_tokens
+
+    cursor = conn.execute(
+        "SELECT id, role, content, token_count FROM messages WHERE conversation_id = ? AND id > ? ORDER BY id DESC",
+        (conversation_id, summarized_through),
+    )
+    used = 0
+    for row in cursor:
+        tokens = row["token_count"] or count_tokens(row["content"])
+        if used + tokens > budget:
+            window.truncated = True
+            break
+        used += tokens
+        window.oldest_id = row["id"]
+        window.messages.append({"role": row["role"], "content": row["content"]})
+        window.token_counts.append(tokens)
+    cursor.close()
+    window.messages.reverse()
+    window.token_counts.reverse()
+    return window
+
+
+def build_messages(system_prompt: str, window: ContextWindow, user_message: str) -> List[dict]:
+    """Assemble the OpenAI message list: system prompt, summary, history window, new message"""
+    messages = [{"role": "system", "content": system_prompt}]
+    if window.summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{window.summary}"})
+    messages.extend(window.messages)
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+def pending_summary_rows(conn: sqlite3.Connection, conversation_id: str) -> Tuple[Optional[str], List[sqlite3.Row]]:
+    """
+    Return the current summary and the messages that dropped out of the window
+    but are not summarized yet, when they add up to SUMMARY_TRIGGER_TOKENS.
+    """
+    window = load_context(conn, conversation_id)
+    if not window.truncated or window.oldest_id is None:
+        return None, []
+    summary_row = conn.execute(
+        "SELECT summarized_through_id FROM conversation_summaries WHERE conversation_id = ?",
+        (conversation_id,),
+    ).fetchone()
+    summarized_through = summary_row["summarized_through_id"] if summary_row else 0
+    rows = conn.execute(
+        "SELECT id, role, content, token_count FROM messages "
+        "WHERE conversation_id = ? AND id > ? AND id < ? ORDER BY id ASC",
+        (conversation_id, summarized_through, window.oldest_id),
+    ).fetchall()
+    pending_tokens = sum(row["token_count"] or count_tokens(row["content"]) for row in rows)
+    if pending_tokens < SUMMARY_TRIGGER_TOKENS:
+        return None, []
+    return window.summary, rows
+
+
+async def summarize(client, model: str, previous_summary: Optional[str], messages: list) -> str:
+    """Fold `messages` (objects with .role and .content) into `previous_summary` with one completion"""
+    transcript = "\n".join(f"{message.role}: {message.content}" for message in messages)
+    content = f"Current summary:\n{previous_summary or '(none yet)'}\n\nNew messages:\n{transcript}"
+    response = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": content},
+        ],
+        temperature=0.3,
+        max_tokens=SUMMARY_MAX_TOKENS,
+    )
+    return response.choices[0].message.content.strip()
+
+
+def save_summary(conn: sqlite3.Connection, conversation_id: str, summary: str, through_id: int):
+    """Persist a summary, never moving `summarized_through_id` backwards"""
+    conn.execute(
+        """
+        INSERT INTO conversation_summaries (conversation_id, summary, summarized_through_id, token_count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(conversation_id) DO UPDATE SET
+            summary = excluded.summary,
+            summarized_through_id = excluded.summarized_through_id,
+            token_count = excluded.token_count,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE excluded.summarized_through_id > conversation_summaries.summarized_through_id
+        """,
+        (conversation_id, summary, through_id, count_tokens(summary)),
+    )
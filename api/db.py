@@ -0,0 +1,136 @@
+"""
+SQLite connection management for the Mental Coach API.
+
+Connections are opened once and reused across requests instead of paying for
+`sqlite3.connect()` on every query. The database runs in WAL mode so readers
+never block the writer (and vice versa); SQLite still allows only one writer
+at a time, so writes share a single connection behind a lock while reads are
+spread over a small pool of read-only connections.
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))  # read-only connections
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+
+# Pragmas applied to every pooled connection
+DEFAULT_PRAGMAS = {
+    # Only takes effect on a new database (or after a full VACUUM); lets maintenance
+    # return freed pages to the filesystem with PRAGMA incremental_vacuum
+    "auto_vacuum": os.getenv("DB_AUTO_VACUUM", "INCREMENTAL"),
+    "journal_mode": os.getenv("DB_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+    "cache_size": int(os.getenv("DB_CACHE_SIZE", "-16000")),  # negative = KiB, so ~16 MB
+    "mmap_size": int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "busy_timeout": int(os.getenv("DB_BUSY_TIMEOUT", "5000")),  # milliseconds
+    "temp_store": os.getenv("DB_TEMP_STORE", "MEMORY"),
+    "foreign_keys": "ON",  # deleting a conversation cascades to its messages and summary
+}
+
+
+class ConnectionPool:
+    """
+    Reusable SQLite connections with one writer and several readers.
+
+    Usage:
+        pool = ConnectionPool("conversations.db")
+        with pool.writer() as conn:
+            conn.execute("INSERT ...")
+        with pool.reader() as conn:
+            rows = conn.execute("SELECT ...").fetchall()
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = DB_POOL_SIZE,
+        pragmas: Optional[Dict[str, object]] = None,
+        timeout: float = DB_POOL_TIMEOUT,
+    ):
+        self.path = path
+        self.size = max(1, size)
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.timeout = timeout
+        self._write_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._opened_readers = 0
+        self._open_lock = threading.Lock()
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        """Open a connection and apply the configured pragmas"""
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=self.pragmas["busy_timeout"] / 1000)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if readonly:
+            conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """Exclusive access to the write connection; commits on success, rolls back on error"""
+        if not self._write_lock.acquire(timeout=self.timeout):
+            raise TimeoutError("Timed out waiting for the database writer")
+        try:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            self._write_lock.release()
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection, opening a new one while the pool is below its size"""
+        conn = None
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._open_lock:
+                if self._opened_readers < self.size:
+                    self._opened_readers += 1
+                    try:
+                        conn = self._connect(readonly=True)
+                    except Exception:
+                        self._opened_readers -= 1
+                        raise
+            if conn is None:
+                try:
+                    conn = self._readers.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError("Timed out waiting for a database reader") from None
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def close(self):
+        """Close every idle pooled connection; the pool reopens connections lazily if used again"""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._open_lock:
+                self._opened_readers -= 1
@@ -0,0 +1,135 @@
+"""
+In-process LRU/TTL cache of hot conversation context windows.
+
+Each chat turn needs the same context the previous turn of that conversation
+just produced. Keeping the ready-to-send `ContextWindow` per conversation in
+memory lets a hot conversation skip the history read entirely: new messages
+are appended to the cached window as they are written, so the database only
+sees writes.
+
+The cache is bounded both by entry count and by an estimate of the bytes held
+in message text, evicting least recently used conversations first. Entries
+also expire after a TTL so a conversation changed by another worker process
+is eventually reloaded.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
+from api.context import CONTEXT_TOKEN_BUDGET, ContextWindow
+
+HISTORY_CACHE_MAX_ENTRIES = int(os.getenv("HISTORY_CACHE_MAX_ENTRIES", "1000"))  # 0 disables the cache
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "1800"))  # seconds
+
+# Rough per-message bookkeeping overhead (dict, list slots, token count)
+MESSAGE_OVERHEAD_BYTES = 200
+
+
+def window_size(window: ContextWindow) -> int:
+    """Estimate the memory held by a context window"""
+    size = len(window.summary or "")
+    for message in window.messages:
+        size += len(message["content"]) + MESSAGE_OVERHEAD_BYTES
+    return size
+
+
+class HistoryCache:
+    """LRU cache of conversation_id -> ContextWindow with entry, byte and TTL limits"""
+
+    def __init__(
+        self,
+        max_entries: int = HISTORY_CACHE_MAX_ENTRIES,
+        max_bytes: int = HISTORY_CACHE_MAX_BYTES,
+        ttl: float = HISTORY_CACHE_TTL,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # conversation_id -> (window, size in bytes, expires at)
+        self._entries: "OrderedDict[str, Tuple[ContextWindow, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, conversation_id: str) -> Optional[ContextWindow]:
+        """Return the cached window and mark it recently used, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] < monotonic():
+                self._remove(conversation_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, conversation_id: str, window: ContextWindow):
+        """Cache a freshly loaded window"""
+        if not self.enabled:
+            return
+        size = window_size(window)
+        with self._lock:
+            if conversation_id in self._entries:
+                self._remove(conversation_id)
+            self._entries[conversation_id] = (window, size, monotonic() + self.ttl)
+            self._bytes += size
+            self._evict()
+
+    def append(self, conversation_id: str, role: str, content: str, tokens: int, budget: int = CONTEXT_TOKEN_BUDGET) -> bool:
+        """
+        Append a message to a cached window in place.
+
+        Returns False when the conversation is not cached (nothing to update).
+        """
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return False
+            window, old_size, expires_at = entry
+            window.append(role, content, tokens, budget)
+            size = window_size(window)
+            self._bytes += size - old_size
+            self._entries[conversation_id] = (window, size, expires_at)
+            self._entries.move_to_end(conversation_id)
+            self._evict()
+            return True
+
+    def invalidate(self, conversation_id: str):
+        """Drop a conversation from the cache"""
+        with self._lock:
+            if conversation_id in self._entries:
+                self._remove(conversation_id)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, conversation_id: str):
+        _, size, _ = self._entries.pop(conversation_id)
+        self._bytes -= size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
@@ -1,20 +1,63 @@
-from fastapi import FastAPI, HTTPException, Header, Depends, Request, status
+from fastapi import FastAPI, HTTPException, Header, Depends, Request, Body, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, RateLimitError
+from starlette.background import BackgroundTask
+import httpx
 import os
 import json
-import sqlite3
+import asyncio
+import gzip
+import hmac
+import zlib
+import math
 import uuid
 from datetime import datetime, timedelta
 from typing import Optional, List
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 import logging
-from contextlib import contextmanager
-from collections import defaultdict
-from time import time
+from dataclasses import asdict
+from time import perf_counter
+
+from api.db import ConnectionPool
+from api.bulk import (
+    IMPORT_BATCH_SIZE, ExportCursor, ImportConflictError, InvalidRecordError, add_stats, encode, new_import_stats,
+    parse_record, sqlite_time
+)
+from api.context import SUMMARY_ENABLED, SUMMARY_MAX_TOKENS, ContextWindow, build_messages, count_tokens, summarize
+from api.storage import SQLiteStorage
+from api.jobs import InvalidWebhookURLError, Job, JobQueue, QueueFullError, check_webhook_url
+from api.migrations import migrate
+from api.maintenance import MaintenanceScheduler, recent_reports
+from api.search import SEARCH_MAX_OFFSET, SEARCH_PAGE_MAX, SearchQueryError, search
+from api.response_cache import DUPLICATE, ResponseCache, bypass_flags, cache_key
+from api.rate_limit import create_rate_limiter
+from api.sse import EventStream
+from api.upstream import (
+    BACKGROUND,
+    CHAT,
+    UPSTREAM_COMPLETION_TOKENS,
+    UpstreamOverloadedError,
+    UpstreamScheduler,
+    retry_after_seconds,
+)
+from api.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS,
+    REGISTRY,
+    SSE_ACTIVE_STREAMS,
+    UPSTREAM_ERRORS,
+    UPSTREAM_REQUEST_SECONDS,
+    UPSTREAM_TOKENS,
+    UPSTREAM_TOKENS_PER_SECOND,
+    UPSTREAM_TTFT_SECONDS,
+    Callback,
+    MetricsMiddleware,
+)
 
 load_dotenv()
 
@@ -38,44 +81,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counts and latency per route, exposed at /metrics
+app.add_middleware(MetricsMiddleware, requests_total=HTTP_REQUESTS, request_duration=HTTP_REQUEST_SECONDS)
+
+# OpenAI client configuration. The async client lets a single worker multiplex
+# many concurrent upstream streams without blocking the event loop.
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # Optional, e.g. a local stand-in for load tests
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))  # seconds
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "1000"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "100"))
+
 # Initialize OpenAI client
 client = None
 if os.getenv("OPENAI_API_KEY"):
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=OPENAI_BASE_URL,
+        timeout=OPENAI_TIMEOUT,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            )
+        ),
+    )
 
 # API Key authentication (optional, can be disabled)
 API_KEY = os.getenv("API_KEY")  # Set this for API authentication
+# Bulk and cross-conversation endpoints need a key; they are disabled without one
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY") or API_KEY
 security = HTTPBearer(auto_error=False)
 
 # Rate limiting configuration
 RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
 RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "60"))  # requests per window
 RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # seconds
+# Ceiling for an API_KEY caller across all its conversations (per IP)
+RATE_LIMIT_CALLER_REQUESTS = int(os.getenv("RATE_LIMIT_CALLER_REQUESTS", str(RATE_LIMIT_REQUESTS * 10)))
 
-# Simple in-memory rate limiter (use Redis in production)
-rate_limit_store = defaultdict(list)
+# Sliding-window rate limiter, O(1) per client. RATE_LIMIT_BACKEND picks where
+# the counters live: per worker (memory) or shared by all workers (shm, sqlite, redis)
+rate_limiter = create_rate_limiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW)
+caller_rate_limiter = create_rate_limiter(RATE_LIMIT_CALLER_REQUESTS, RATE_LIMIT_WINDOW)
 
-def check_rate_limit(request: Request):
-    """Check if request is within rate limit"""
+def client_address(request: Request) -> str:
+    """Key identifying the caller for rate limiting and upstream fair queuing"""
+    return request.client.host if request.client else "unknown"
+
+def check_rate_limit(request: Request, conversation_id: Optional[str] = None):
+    """
+    Check if request is within rate limit.
+
+    Limits are per client IP. When API_KEY is set, callers are authenticated
+    integrations (bots) relaying many end users from one address, so a request
+    that names a conversation is counted against that conversation instead,
+    and against RATE_LIMIT_CALLER_REQUESTS for the IP as a whole, so that new
+    conversation ids do not buy new budget. The ceiling is checked first, so
+    refused requests do not take up a counter per conversation id.
+    """
     if not RATE_LIMIT_ENABLED:
         return True
     
-    client_id = request.client.host if request.client else "unknown"
-    now = time()
-    
-    # Clean old entries
-    rate_limit_store[client_id] = [
-        timestamp for timestamp in rate_limit_store[client_id]
-        if now - timestamp < RATE_LIMIT_WINDOW
-    ]
-    
-    # Check limit
-    if len(rate_limit_store[client_id]) >= RATE_LIMIT_REQUESTS:
-        return False
-    
-    # Add current request
-    rate_limit_store[client_id].append(now)
-    return True
+    key = client_address(request)
+    if API_KEY and conversation_id:
+        if not caller_rate_limiter.allow(f"caller:{key}"):
+            return False
+        key = f"{key}/{conversation_id}"
+    return rate_limiter.allow(key)
 
 # Global exception handler
 @app.exception_handler(Exception)
@@ -90,53 +163,91 @@ async def global_exception_handler(request: Request, exc: Exception):
         }
     )
 
+# Batch endpoint limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_MAX_PARALLELISM = int(os.getenv("BATCH_MAX_PARALLELISM", "8"))
+
+# Bulk import limits: body bytes (after gzip decoding) and records per request
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(256 * 1024 * 1024)))
+IMPORT_MAX_RECORDS = int(os.getenv("IMPORT_MAX_RECORDS", "1000000"))
+
+# Conversation retrieval: largest (and default) JSON page, gzip for large responses
+CONVERSATION_PAGE_MAX = int(os.getenv("CONVERSATION_PAGE_MAX", "1000"))
+CONVERSATION_GZIP_MIN_BYTES = int(os.getenv("CONVERSATION_GZIP_MIN_BYTES", "4096"))
+CONVERSATION_GZIP_LEVEL = int(os.getenv("CONVERSATION_GZIP_LEVEL", "6"))
+
 # Database setup
 DB_PATH = os.getenv("DB_PATH", "conversations.db")
 
+# Shared connection pool (WAL journaling, one writer, pooled readers)
+db_pool = ConnectionPool(DB_PATH)
+
 def init_db():
-    """Initialize the SQLite database for conversation storage"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS conversations (
-            conversation_id TEXT PRIMARY KEY,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            conversation_id TEXT,
-            role TEXT NOT NULL,
-            content TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
-        )
-    """)
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_conversation_id ON messages(conversation_id)
-    """)
-    conn.commit()
-    conn.close()
-    logger.info("Database initialized successfully")
+    """Initialize the SQLite database for conversation storage, applying pending schema migrations"""
+    with db_pool.writer() as conn:
+        version = migrate(conn)
+    logger.info(f"Database initialized successfully (schema version {version})")
 
 # Initialize database on startup
 init_db()
 
-@contextmanager
-def get_db():
-    """Context manager for database connections"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+# Async storage: blocking SQLite work runs on a dedicated executor, message
+# writes are group-committed and hot conversations are served from memory
+storage = SQLiteStorage(db_pool)
+
+# Periodic archiving of idle conversations, retention, incremental vacuum and ANALYZE
+maintenance = MaintenanceScheduler(db_pool)
+
+# Optional cache (with single-flight deduplication) for webhook completions
+response_cache = ResponseCache()
+
+# Admission control for OpenAI calls: RPM/TPM budgets, chat before background
+# work, fair turns per client, and early 503s when the queue is too long
+upstream = UpstreamScheduler()
+
+def prompt_tokens(messages: List[dict]) -> int:
+    return sum(count_tokens(message["content"]) for message in messages)
+
+def upstream_busy(e: RateLimitError) -> UpstreamOverloadedError:
+    """Pause upstream admissions after an OpenAI 429 and describe it as overload"""
+    retry_after = retry_after_seconds(e)
+    upstream.pause(retry_after)
+    return UpstreamOverloadedError("API rate limit exceeded. Please try again later.", retry_after or 1)
+
+# Conversations with a summary refresh in flight, and the tasks running them
+summarizing = set()
+summary_tasks = set()
+
+async def refresh_summary(conversation_id: str):
+    """Fold turns that fell out of the context window into the conversation summary"""
+    if conversation_id in summarizing:
+        return
+    summarizing.add(conversation_id)
     try:
-        yield conn
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
+        previous_summary, pending = await storage.pending_summary(conversation_id)
+        if not pending:
+            return
+        tokens = sum(count_tokens(message.content) for message in pending) + SUMMARY_MAX_TOKENS
+        async with upstream.slot(BACKGROUND, "summary", tokens):
+            try:
+                with UPSTREAM_REQUEST_SECONDS.labels("summary").time():
+                    summary = await summarize(client, OPENAI_MODEL, previous_summary, pending)
+            except RateLimitError as e:
+                raise upstream_busy(e) from e
+        await storage.save_summary(conversation_id, summary, pending[-1].id)
+        logger.info(f"Summarized {len(pending)} messages for conversation {conversation_id}")
+    except Exception as e:
+        logger.warning(f"Error refreshing conversation summary: {e}")
     finally:
-        conn.close()
+        summarizing.discard(conversation_id)
+
+def schedule_summary(conversation_id: str, window: ContextWindow):
+    """Refresh the summary in the background once turns have dropped out of the window"""
+    if not SUMMARY_ENABLED or not window.truncated:
+        return
+    task = asyncio.create_task(refresh_summary(conversation_id))
+    summary_tasks.add(task)
+    task.add_done_callback(summary_tasks.discard)
 
 # Request/Response Models
 class ChatRequest(BaseModel):
@@ -144,22 +255,61 @@ class ChatRequest(BaseModel):
     conversation_id: Optional[str] = Field(None, description="Optional conversation ID for maintaining context")
     system_prompt: Optional[str] = Field(None, description="Optional custom system prompt")
 
-class ChatResponse(BaseModel):
-    conversation_id: str
-    message: str
-    timestamp: str
+class BatchItem(BaseModel):
+    message: str = Field(..., min_length=1, max_length=5000, description="User message")
+    conversation_id: Optional[str] = Field(None, description="Optional conversation ID for maintaining context")
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+    parallelism: Optional[int] = Field(None, ge=1, description="Maximum items processed at once")
 
 class ConversationResponse(BaseModel):
     conversation_id: str
     messages: List[dict]
     created_at: str
     updated_at: str
+    has_more: bool = False
+    next_after_id: Optional[int] = None
+    next_before_id: Optional[int] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    conversation_id: str
+    message: str
+    webhook_url: str
+    response: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
 
 class HealthResponse(BaseModel):
     status: str
     version: str
     database: str
     openai_configured: bool
+    history_cache: Optional[dict] = None
+    response_cache: Optional[dict] = None
+    upstream: Optional[dict] = None
+
+@app.on_event("startup")
+async def startup():
+    """Resume persisted webhook jobs and schedule database maintenance"""
+    await job_queue.start()
+    maintenance.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled resources when the worker stops"""
+    await job_queue.close()
+    await maintenance.close()
+    if client:
+        await client.close()
+    await storage.close()
+    db_pool.close()
+    rate_limiter.close()
+    caller_rate_limiter.close()
 
 # Authentication dependency (optional)
 async def verify_api_key(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
@@ -169,6 +319,14 @@ async def verify_api_key(credentials: Optional[HTTPAuthorizationCredentials] = D
             raise HTTPException(status_code=401, detail="Invalid or missing API key")
     return True
 
+async def verify_admin_key(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+    """Require ADMIN_API_KEY (or API_KEY); refuse everyone when neither is set"""
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Endpoint disabled; set ADMIN_API_KEY to enable it")
+    if not credentials or not hmac.compare_digest(credentials.credentials.encode(), ADMIN_API_KEY.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing admin API key")
+    return True
+
 @app.get("/")
 def root():
     """Root endpoint to verify API is running"""
@@ -180,17 +338,23 @@ def root():
             "health": "/api/health",
             "chat": "/api/chat",
             "conversations": "/api/conversations",
-            "webhook": "/api/webhook"
+            "webhook": "/api/webhook",
+            "jobs": "/api/jobs/{job_id}",
+            "batch": "/api/batch",
+            "export": "/api/export",
+            "import": "/api/import",
+            "search": "/api/search",
+            "maintenance": "/api/maintenance/reports",
+            "metrics": "/metrics"
         }
     }
 
 @app.get("/api/health", response_model=HealthResponse)
-def health_check():
+async def health_check():
     """Health check endpoint with system status"""
     db_status = "connected"
     try:
-        with get_db() as conn:
-            conn.execute("SELECT 1")
+        await storage.ping()
     except Exception as e:
         db_status = f"error: {str(e)}"
         logger.error(f"Database health check failed: {e}")
@@ -199,21 +363,55 @@ def health_check():
         status="ok",
         version="2.0.0",
         database=db_status,
-        openai_configured=bool(client and os.getenv("OPENAI_API_KEY"))
+        openai_configured=bool(client and os.getenv("OPENAI_API_KEY")),
+        history_cache=storage.history_cache.stats(),
+        response_cache=response_cache.stats(),
+        upstream=upstream.stats()
     )
 
+# Metrics read from existing counters at scrape time
+Callback("rate_limit_rejections_total", "Requests rejected by the rate limiter",
+         lambda: rate_limiter.rejections + caller_rate_limiter.rejections, type="counter")
+Callback("rate_limit_tracked_clients", "Clients currently tracked by the rate limiter", lambda: len(rate_limiter))
+Callback("history_cache_requests_total", "Context cache lookups by result",
+         lambda: {(result,): storage.history_cache.stats()[stat] for result, stat in
+                  (("hit", "hits"), ("miss", "misses"))},
+         type="counter", labelnames=("result",))
+Callback("history_cache_bytes", "Approximate size of the context cache", lambda: storage.history_cache.stats()["bytes"])
+Callback("response_cache_requests_total", "Webhook response cache lookups by result",
+         lambda: {(result,): response_cache.stats()[stat] for result, stat in
+                  (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced"))},
+         type="counter", labelnames=("result",))
+Callback("db_write_queue_pending", "Message writes waiting for the next group commit",
+         lambda: storage.write_queue.pending())
+Callback("webhook_jobs_queued", "Webhook jobs waiting for a worker", lambda: job_queue.depth)
+Callback("webhook_jobs_running", "Webhook jobs being processed", lambda: job_queue.busy)
+Callback("upstream_queue_depth", "Completions waiting for an upstream slot",
+         lambda: {(priority,): depth for priority, depth in upstream.stats()["queued"].items()},
+         labelnames=("priority",))
+Callback("upstream_in_flight", "Completions holding an upstream slot", lambda: upstream.in_flight)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics in the text exposition format"""
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.post("/api/chat")
 async def chat(
     chat_request: ChatRequest,
     http_request: Request,
+    format: str = Query("json", pattern="^(json|compact)$", description="json events, or compact (raw text data)"),
     _: bool = Depends(verify_api_key)
 ):
     """
     Stream chat responses from OpenAI API with Server-Sent Events.
     Supports conversation history for context-aware responses.
+
+    Event framing follows SSE_FRAMING; `format=compact` sends content events
+    as raw text (see api/sse.py).
     """
     # Rate limiting check
-    if not check_rate_limit(http_request):
+    if not check_rate_limit(http_request, chat_request.conversation_id):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"Rate limit exceeded. Maximum {RATE_LIMIT_REQUESTS} requests per {RATE_LIMIT_WINDOW} seconds."
@@ -242,100 +440,107 @@ async def chat(
         "bullet points for lists, and break up long responses into paragraphs."
     )
     
-    # Save user message to database
-    try:
-        with get_db() as conn:
-            # Create conversation if it doesn't exist
-            conn.execute(
-                "INSERT OR IGNORE INTO conversations (conversation_id) VALUES (?)",
-                (conversation_id,)
-            )
-            # Update conversation timestamp
-            conn.execute(
-                "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE conversation_id = ?",
-                (conversation_id,)
-            )
-            # Save user message
-            conn.execute(
-                "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
-                (conversation_id, "user", chat_request.message)
-            )
-    except Exception as e:
-        logger.error(f"Error saving message to database: {e}")
-        # Continue even if database save fails
-    
     # Log request
     logger.info(f"Chat request - Conversation: {conversation_id}, Message length: {len(chat_request.message)}")
     
-    # Retrieve conversation history
-    messages_history = []
+    # Retrieve the newest history that fits the token budget, plus the summary of
+    # older turns
+    window = ContextWindow()
     try:
-        with get_db() as conn:
-            cursor = conn.execute(
-                "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC",
-                (conversation_id,)
-            )
-            messages_history = [{"role": row["role"], "content": row["content"]} for row in cursor.fetchall()]
+        window = await storage.load_history(conversation_id, new=not chat_request.conversation_id)
     except Exception as e:
         logger.warning(f"Error retrieving conversation history: {e}")
     
-    # Build messages for OpenAI (system + history + current user message)
-    openai_messages = [{"role": "system", "content": system_prompt}]
-    # Add history (excluding the last user message since we're about to add it)
-    for msg in messages_history[:-1] if len(messages_history) > 1 else []:
-        openai_messages.append(msg)
-    # Add current user message
-    openai_messages.append({"role": "user", "content": chat_request.message})
+    # Build messages for OpenAI (system + summary + history + current user message)
+    openai_messages = build_messages(system_prompt, window, chat_request.message)
+    
+    # Wait for an upstream slot, or turn the request away before anything is saved
+    estimated_prompt = prompt_tokens(openai_messages)
+    try:
+        ticket = await upstream.acquire(
+            CHAT, client_address(http_request), estimated_prompt + UPSTREAM_COMPLETION_TOKENS
+        )
+    except UpstreamOverloadedError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers=e.headers)
+    
+    # Save user message to database
+    try:
+        await storage.append_message(conversation_id, "user", chat_request.message)
+    except Exception as e:
+        logger.error(f"Error saving message to database: {e}")
+        # Continue even if database save fails
+    
+    events = EventStream(conversation_id, compact=format == "compact")
+
+    async def deltas():
+        """Upstream content deltas, recording upstream timings"""
+        started = perf_counter()
+        first_token_at = None
+        tokens = 0
+        stream = await client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=openai_messages,
+            stream=True,
+            temperature=0.7
+        )
+        
+        # Awaiting the stream yields the event loop to other requests between tokens
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token_at is None:
+                    first_token_at = perf_counter()
+                    UPSTREAM_TTFT_SECONDS.observe(first_token_at - started)
+                tokens += 1
+                yield chunk.choices[0].delta.content
+        
+        finished = perf_counter()
+        ticket.tokens_used = estimated_prompt + tokens
+        UPSTREAM_REQUEST_SECONDS.labels("stream").observe(finished - started)
+        UPSTREAM_TOKENS.inc(tokens)
+        if tokens > 1 and finished > first_token_at:
+            UPSTREAM_TOKENS_PER_SECOND.observe((tokens - 1) / (finished - first_token_at))
     
     async def generate():
         """Generator function that streams OpenAI responses"""
         accumulated_response = ""
+        SSE_ACTIVE_STREAMS.inc()
         try:
-            stream = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=openai_messages,
-                stream=True,
-                temperature=0.7
-            )
-            
-            # Stream each chunk as it arrives
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
-                    accumulated_response += content
-                    # Send as Server-Sent Event format
-                    yield f"data: {json.dumps({'content': content, 'conversation_id': conversation_id})}\n\n"
+            opening = events.start()
+            if opening:
+                yield opening
+            # Send as Server-Sent Events, one per delta or coalesced (SSE_FRAMING)
+            async for piece in events.pieces(deltas()):
+                accumulated_response += piece
+                yield events.content(piece)
             
             # Save assistant response to database
             try:
-                with get_db() as conn:
-                    conn.execute(
-                        "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
-                        (conversation_id, "assistant", accumulated_response)
-                    )
-                    conn.execute(
-                        "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE conversation_id = ?",
-                        (conversation_id,)
-                    )
+                await storage.append_message(conversation_id, "assistant", accumulated_response)
             except Exception as e:
                 logger.error(f"Error saving assistant response: {e}")
+            schedule_summary(conversation_id, window)
             
             # Send done signal with conversation ID
-            yield f"data: {json.dumps({'done': True, 'conversation_id': conversation_id})}\n\n"
+            yield events.done()
             
         except Exception as e:
             error_message = f"Error calling OpenAI API: {str(e)}"
             logger.error(f"OpenAI API error: {e}", exc_info=True)
             # Provide user-friendly error messages
-            if "rate limit" in str(e).lower():
-                error_message = "API rate limit exceeded. Please try again later."
+            if isinstance(e, RateLimitError):
+                error_message = str(upstream_busy(e))
             elif "invalid" in str(e).lower() or "authentication" in str(e).lower():
                 error_message = "API authentication error. Please check your configuration."
-            yield f"data: {json.dumps({'error': error_message, 'conversation_id': conversation_id})}\n\n"
+            UPSTREAM_ERRORS.labels("stream").inc()
+            yield events.error(error_message)
+        finally:
+            ticket.release()
+            SSE_ACTIVE_STREAMS.dec()
     
     return StreamingResponse(
         generate(),
         media_type="text/event-stream",
+        background=BackgroundTask(ticket.release),  # in case the stream never starts
         headers={
             "Cache-Control": "no-cache",
             "X-Accel-Buffering": "no",
@@ -343,132 +548,561 @@ async def chat(
         }
     )
 
+def message_dict(message) -> dict:
+    return {"id": message.id, "role": message.role, "content": message.content, "timestamp": message.timestamp}
+
+def accepts_gzip(request: Request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
 @app.get("/api/conversations/{conversation_id}", response_model=ConversationResponse)
-async def get_conversation(conversation_id: str, _: bool = Depends(verify_api_key)):
-    """Retrieve a conversation by ID"""
+async def get_conversation(
+    conversation_id: str,
+    request: Request,
+    after_id: Optional[int] = Query(None, ge=0, description="Return messages after this message id"),
+    before_id: Optional[int] = Query(None, ge=1, description="Return the messages just before this message id"),
+    limit: Optional[int] = Query(None, ge=1, description="Messages per page"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="json (one page) or ndjson (streamed)"),
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Retrieve a conversation by ID, paginated by message id.
+
+    `after_id` pages forwards from the start, `before_id` pages backwards from
+    the end; both come back in id order. JSON pages hold at most
+    CONVERSATION_PAGE_MAX messages and carry the cursor for the next page.
+    `format=ndjson` streams every selected message (no cap unless `limit` is
+    given) without loading the conversation into memory.
+    """
+    if format == "ndjson":
+        return await stream_conversation(conversation_id, after_id, before_id, limit, accepts_gzip(request))
+
+    limit = min(limit or CONVERSATION_PAGE_MAX, CONVERSATION_PAGE_MAX)
     try:
-        with get_db() as conn:
-            # Get conversation metadata
-            conv_cursor = conn.execute(
-                "SELECT created_at, updated_at FROM conversations WHERE conversation_id = ?",
-                (conversation_id,)
-            )
-            conv_row = conv_cursor.fetchone()
-            
-            if not conv_row:
-                raise HTTPException(status_code=404, detail="Conversation not found")
-            
-            # Get messages
-            msg_cursor = conn.execute(
-                "SELECT role, content, timestamp FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC",
-                (conversation_id,)
-            )
-            messages = [
-                {
-                    "role": row["role"],
-                    "content": row["content"],
-                    "timestamp": row["timestamp"]
-                }
-                for row in msg_cursor.fetchall()
-            ]
-            
-            return ConversationResponse(
-                conversation_id=conversation_id,
-                messages=messages,
-                created_at=conv_row["created_at"],
-                updated_at=conv_row["updated_at"]
-            )
-    except HTTPException:
-        raise
+        conversation = await storage.get_conversation(conversation_id, after_id, before_id, limit)
+    except Exception as e:
+        logger.error(f"Error retrieving conversation: {e}")
+        raise HTTPException(status_code=500, detail=f"Error retrieving conversation: {str(e)}")
+    
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    messages = [message_dict(message) for message in conversation.messages]
+    backwards = before_id is not None and after_id is None
+    more = conversation.has_more and bool(messages)
+    # Built as plain JSON: validating thousands of message dicts through the model adds nothing
+    body = json.dumps({
+        "conversation_id": conversation_id,
+        "messages": messages,
+        "created_at": conversation.created_at,
+        "updated_at": conversation.updated_at,
+        "has_more": conversation.has_more,
+        "next_after_id": messages[-1]["id"] if more and not backwards else None,
+        "next_before_id": messages[0]["id"] if more and backwards else None,
+    }).encode()
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= CONVERSATION_GZIP_MIN_BYTES and accepts_gzip(request):
+        body = gzip.compress(body, compresslevel=CONVERSATION_GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type="application/json", headers=headers)
+
+async def stream_conversation(
+    conversation_id: str,
+    after_id: Optional[int],
+    before_id: Optional[int],
+    limit: Optional[int],
+    compress: bool
+):
+    """
+    NDJSON: a metadata line, one line per message in id order, then
+    `{"done": true, "count": ..., "last_id": ...}`. Rows are read in keyset
+    chunks, so memory stays flat however long the conversation is. A stream
+    without the final line was cut short and can resume with `after_id=last id`.
+    """
+    try:
+        conversation = await storage.get_conversation(conversation_id, limit=0)
     except Exception as e:
         logger.error(f"Error retrieving conversation: {e}")
         raise HTTPException(status_code=500, detail=f"Error retrieving conversation: {str(e)}")
+    
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    async def lines():
+        yield json.dumps({
+            "conversation_id": conversation_id,
+            "created_at": conversation.created_at,
+            "updated_at": conversation.updated_at
+        }) + "\n"
+        count = 0
+        last_id = None
+        try:
+            async for chunk in storage.iter_messages(conversation_id, after_id, before_id, limit):
+                count += len(chunk)
+                last_id = chunk[-1].id
+                yield "".join(json.dumps(message_dict(message)) + "\n" for message in chunk)
+        except Exception as e:
+            logger.error(f"Error streaming conversation: {e}")
+            yield json.dumps({"error": "Error retrieving conversation", "last_id": last_id}) + "\n"
+            return
+        yield json.dumps({"done": True, "count": count, "last_id": last_id}) + "\n"
+    
+    return ndjson_response(lines(), compress)
+
+def ndjson_response(lines, compress: bool) -> StreamingResponse:
+    """Stream NDJSON text chunks, gzip-compressed when the client accepts it"""
+    async def encoded():
+        # gzip member flushed per chunk, so the client can decode as rows arrive
+        compressor = zlib.compressobj(CONVERSATION_GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None
+        async for text in lines:
+            data = text.encode()
+            yield compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else data
+        if compressor:
+            yield compressor.flush()
+    
+    headers = {"Vary": "Accept-Encoding", "X-Accel-Buffering": "no"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(encoded(), media_type="application/x-ndjson", headers=headers)
 
 @app.delete("/api/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str, _: bool = Depends(verify_api_key)):
     """Delete a conversation and all its messages"""
     try:
-        with get_db() as conn:
-            conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
-            conn.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
-            return {"status": "deleted", "conversation_id": conversation_id}
+        await storage.delete_conversation(conversation_id)
+        return {"status": "deleted", "conversation_id": conversation_id}
     except Exception as e:
         logger.error(f"Error deleting conversation: {e}")
         raise HTTPException(status_code=500, detail=f"Error deleting conversation: {str(e)}")
 
+@app.get("/api/export")
+async def export_conversations(
+    request: Request,
+    updated_since: Optional[str] = Query(None, description="ISO 8601; conversations updated at or after this time"),
+    updated_before: Optional[str] = Query(None, description="ISO 8601; conversations updated before this time"),
+    _: bool = Depends(verify_admin_key)
+):
+    """
+    Every conversation (optionally within an `updated_at` range) as NDJSON:
+    conversation, summary and message records, then `{"type": "done", "count": ...}`.
+    The format is the one POST /api/import and `python -m api.bulk` read.
+    """
+    try:
+        cursor = ExportCursor(sqlite_time(updated_since), sqlite_time(updated_before))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid timestamp: {e}")
+    
+    async def lines():
+        count = 0
+        try:
+            while not cursor.done:
+                records = await storage.export_chunk(cursor)
+                count += len(records)
+                if records:
+                    yield "".join(encode(record) for record in records)
+        except Exception as e:
+            logger.error(f"Error exporting conversations: {e}")
+            yield encode({"type": "error", "error": "Export failed", "count": count})
+            return
+        yield encode({"type": "done", "count": count})
+    
+    return ndjson_response(lines(), accepts_gzip(request))
+
+@app.post("/api/import")
+async def import_conversations(
+    request: Request,
+    preserve_ids: bool = Query(True, description="Keep message ids (re-imports skip existing ones)"),
+    _: bool = Depends(verify_admin_key)
+):
+    """
+    Load an NDJSON export (gzip with `Content-Encoding: gzip`) from the request
+    body as it arrives, IMPORT_BATCH_SIZE records per transaction. A bad line,
+    or a preserved message id that belongs to another conversation, stops the
+    import with 400, and a body over IMPORT_MAX_BYTES or IMPORT_MAX_RECORDS
+    with 413; the batches before it stay committed.
+    """
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    decompressor = zlib.decompressobj(31) if gzipped else None
+    totals = new_import_stats()
+    
+    def too_large(limit: str):
+        return HTTPException(status_code=413, detail={"error": f"Import exceeds {limit}", "imported": totals})
+    
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > IMPORT_MAX_BYTES:
+        raise too_large(f"IMPORT_MAX_BYTES ({IMPORT_MAX_BYTES} bytes)")
+    batch = []
+    pending = b""
+    line_number = 0
+    received = records = 0
+    try:
+        async for data in request.stream():
+            if decompressor:
+                # Never inflate past the limit, however well the body compresses
+                data = decompressor.decompress(data, IMPORT_MAX_BYTES - received + 1)
+            received += len(data)
+            if received > IMPORT_MAX_BYTES:
+                raise too_large(f"IMPORT_MAX_BYTES ({IMPORT_MAX_BYTES} bytes)")
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                line_number += 1
+                record = parse_record(line.decode("utf-8", errors="replace"), line_number)
+                if record is not None:
+                    batch.append(record)
+                    records += 1
+            if records > IMPORT_MAX_RECORDS:
+                raise too_large(f"IMPORT_MAX_RECORDS ({IMPORT_MAX_RECORDS} records)")
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                add_stats(totals, await storage.import_records(batch, preserve_ids))
+                batch = []
+        record = parse_record(pending.decode("utf-8", errors="replace"), line_number + 1)
+        if record is not None:
+            if records + 1 > IMPORT_MAX_RECORDS:
+                raise too_large(f"IMPORT_MAX_RECORDS ({IMPORT_MAX_RECORDS} records)")
+            batch.append(record)
+        if batch:
+            add_stats(totals, await storage.import_records(batch, preserve_ids))
+    except HTTPException:
+        raise
+    except ImportConflictError as e:
+        raise HTTPException(
+            status_code=400, detail={"error": str(e), "conflicting_ids": e.ids, "imported": totals}
+        )
+    except InvalidRecordError as e:
+        raise HTTPException(status_code=400, detail={"error": str(e), "imported": totals})
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail={"error": f"Invalid gzip body: {e}", "imported": totals})
+    except Exception as e:
+        logger.error(f"Error importing conversations: {e}")
+        raise HTTPException(status_code=500, detail={"error": "Import failed", "imported": totals})
+    return {"status": "imported", **totals}
+
+async def complete_reply(
+    window: ContextWindow,
+    message: str,
+    owner: Optional[str] = None,
+    read_cache: bool = True,
+    store_cache: bool = True,
+    key: str = "unknown",
+    max_wait: Optional[float] = None
+):
+    """
+    Non-streaming completion for an integration message, through the response
+    cache. Returns (reply, cache status); nothing is persisted.
+    
+    Upstream calls queue as background work under `key`; see api/upstream.py
+    for `max_wait`.
+    """
+    # Build messages
+    openai_messages = build_messages(
+        "You are a supportive mental coach. Provide helpful, concise responses.",
+        window,
+        message
+    )
+    
+    async def complete() -> str:
+        # Get response from OpenAI (non-streaming for webhooks)
+        tokens = prompt_tokens(openai_messages) + UPSTREAM_COMPLETION_TOKENS
+        async with upstream.slot(BACKGROUND, key, tokens, max_wait) as ticket:
+            try:
+                with UPSTREAM_REQUEST_SECONDS.labels("completion").time():
+                    response = await client.chat.completions.create(
+                        model=OPENAI_MODEL,
+                        messages=openai_messages,
+                        temperature=0.7
+                    )
+            except RateLimitError as e:
+                UPSTREAM_ERRORS.labels("completion").inc()
+                raise upstream_busy(e) from e
+            except Exception:
+                UPSTREAM_ERRORS.labels("completion").inc()
+                raise
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                ticket.tokens_used = usage.prompt_tokens + usage.completion_tokens
+        return response.choices[0].message.content
+    
+    return await response_cache.get_or_compute(
+        cache_key(OPENAI_MODEL, openai_messages),
+        complete,
+        owner=owner,
+        read=read_cache,
+        store=store_cache
+    )
+
+async def generate_webhook_reply(
+    message: str,
+    conversation_id: str,
+    is_new: bool = False,
+    read_cache: bool = True,
+    store_cache: bool = True,
+    key: str = "unknown",
+    max_wait: Optional[float] = None
+):
+    """
+    Produce a non-streaming reply for an integration message and save the
+    exchange. Returns (reply, cache status).
+    """
+    # Get conversation history if conversation_id exists
+    window = ContextWindow()
+    try:
+        window = await storage.load_history(conversation_id, new=is_new)
+    except Exception:
+        pass
+    
+    assistant_response, cache_status = await complete_reply(
+        window, message, conversation_id, read_cache, store_cache, key, max_wait
+    )
+    
+    # Save to database, unless this was a retry of a request that is already saving it
+    if cache_status != DUPLICATE:
+        try:
+            await storage.append_message(conversation_id, "user", message)
+            await storage.append_message(conversation_id, "assistant", assistant_response)
+        except Exception as e:
+            logger.error(f"Error saving webhook conversation: {e}")
+        schedule_summary(conversation_id, window)
+    
+    return assistant_response, cache_status
+
+async def process_webhook_job(job: Job) -> str:
+    """Generate the reply for a queued webhook job"""
+    # Already accepted and queued, so it waits for upstream rather than failing;
+    # jobs take turns per webhook host
+    reply, _ = await generate_webhook_reply(
+        job.message, job.conversation_id,
+        key=urlparse(job.webhook_url).hostname or "webhook", max_wait=math.inf
+    )
+    return reply
+
+# Background webhook jobs, persisted in SQLite and delivered with retries
+job_queue = JobQueue(db_pool, process_webhook_job, storage.run_blocking)
+
 @app.post("/api/webhook")
 async def webhook_integration(
-    message: str = Field(..., description="Message from external system"),
-    conversation_id: Optional[str] = Field(None, description="Optional conversation ID"),
-    webhook_url: Optional[str] = Field(None, description="URL to send response to"),
+    http_request: Request,
+    message: str = Body(..., embed=True, description="Message from external system"),
+    conversation_id: Optional[str] = Body(None, embed=True, description="Optional conversation ID"),
+    webhook_url: Optional[str] = Body(None, embed=True, description="URL to send response to"),
+    cache_control: Optional[str] = Header(None),
+    x_cache_bypass: Optional[str] = Header(None),
     _: bool = Depends(verify_api_key)
 ):
     """
     Webhook endpoint for integrating with external systems.
-    Accepts a message and optionally sends response to a webhook URL.
+    
+    Without `webhook_url` the reply is returned in the response. With
+    `webhook_url` the message is queued as a job: the endpoint answers 202
+    with a job ID right away and the result is POSTed to the URL when ready
+    (progress is available from /api/jobs/{job_id}).
+    
+    When the response cache is enabled, identical prompts (same history and
+    message) are answered from the cache; send `Cache-Control: no-cache` or
+    `X-Cache-Bypass: 1` to force a fresh answer, `Cache-Control: no-store` to
+    also keep it out of the cache.
     """
     if not client or not os.getenv("OPENAI_API_KEY"):
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured")
     
+    is_new = not conversation_id
     conversation_id = conversation_id or str(uuid.uuid4())
     
-    try:
-        # Get conversation history if conversation_id exists
-        messages_history = []
+    if webhook_url:
         try:
-            with get_db() as conn:
-                cursor = conn.execute(
-                    "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC",
-                    (conversation_id,)
-                )
-                messages_history = [{"role": row["role"], "content": row["content"]} for row in cursor.fetchall()]
-        except Exception:
-            pass
-        
-        # Build messages
-        openai_messages = [
-            {"role": "system", "content": "You are a supportive mental coach. Provide helpful, concise responses."},
-            *messages_history,
-            {"role": "user", "content": message}
-        ]
-        
-        # Get response from OpenAI (non-streaming for webhooks)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=openai_messages,
-            temperature=0.7
-        )
-        
-        assistant_response = response.choices[0].message.content
-        
-        # Save to database
+            await check_webhook_url(webhook_url)
+        except InvalidWebhookURLError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         try:
-            with get_db() as conn:
-                conn.execute(
-                    "INSERT OR IGNORE INTO conversations (conversation_id) VALUES (?)",
-                    (conversation_id,)
-                )
-                conn.execute(
-                    "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
-                    (conversation_id, "user", message)
-                )
-                conn.execute(
-                    "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
-                    (conversation_id, "assistant", assistant_response)
-                )
-        except Exception as e:
-            logger.error(f"Error saving webhook conversation: {e}")
-        
-        # If webhook_url provided, send response there (async in production)
-        if webhook_url:
-            # In production, use background tasks for this
-            logger.info(f"Webhook response would be sent to: {webhook_url}")
+            job = await job_queue.submit(conversation_id, message, webhook_url)
+        except QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={
+                "job_id": job.job_id,
+                "status": job.status,
+                "conversation_id": conversation_id,
+                "status_url": f"/api/jobs/{job.job_id}"
+            }
+        )
+    
+    try:
+        read_cache, store_cache = bypass_flags(cache_control, x_cache_bypass)
+        assistant_response, cache_status = await generate_webhook_reply(
+            message, conversation_id, is_new, read_cache, store_cache, client_address(http_request)
+        )
         
-        return {
-            "conversation_id": conversation_id,
-            "response": assistant_response,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        return JSONResponse(
+            content={
+                "conversation_id": conversation_id,
+                "response": assistant_response,
+                "timestamp": datetime.utcnow().isoformat()
+            },
+            headers={"X-Cache": cache_status}
+        )
+    except UpstreamOverloadedError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers=e.headers)
     except Exception as e:
         logger.error(f"Webhook error: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing webhook: {str(e)}")
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, _: bool = Depends(verify_api_key)):
+    """Report the progress of an asynchronous webhook job"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(**asdict(job))
+
+@app.get("/api/search")
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=500, description="Words to find; a trailing * matches a prefix"),
+    conversation_id: Optional[str] = Query(None, description="Only search this conversation"),
+    role: Optional[str] = Query(None, pattern="^(user|assistant)$"),
+    sort: str = Query("relevance", pattern="^(relevance|recent)$"),
+    limit: int = Query(20, ge=1, le=SEARCH_PAGE_MAX),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+    raw: bool = Query(False, description="Treat q as an FTS5 query expression"),
+    _: bool = Depends(verify_admin_key)
+):
+    """
+    Messages matching every word of `q`, best match (BM25) or newest first,
+    with the matching words wrapped in <mark> in each snippet. Archived
+    conversations are not searched until they are read again.
+    """
+    def read():
+        with db_pool.reader() as conn:
+            return search(conn, q, conversation_id, role, sort, limit + 1, offset, raw)
+    try:
+        results = await storage.run_blocking(read)
+    except SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching messages: {e}")
+        raise HTTPException(status_code=500, detail=f"Error searching messages: {str(e)}")
+    has_more = len(results) > limit
+    return {
+        "query": q,
+        "results": results[:limit],
+        "has_more": has_more,
+        "next_offset": offset + limit if has_more and offset + limit <= SEARCH_MAX_OFFSET else None,
+    }
+
+@app.get("/api/maintenance/reports")
+async def maintenance_reports(
+    limit: int = Query(24, ge=1, le=1000, description="Number of runs, newest first"),
+    _: bool = Depends(verify_admin_key)
+):
+    """Database maintenance history: space reclaimed, database and hot-table size per run"""
+    def read():
+        with db_pool.reader() as conn:
+            return recent_reports(conn, limit)
+    return {"reports": await storage.run_blocking(read)}
+
+@app.post("/api/batch")
+async def batch_chat(
+    batch_request: BatchRequest,
+    http_request: Request,
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Answer many messages in one request, streaming results as NDJSON.
+    
+    Items run concurrently (up to `parallelism`, capped by BATCH_MAX_PARALLELISM),
+    but items of the same conversation run in order so each one sees the
+    previous reply. Each result line carries the item's `index`; a final
+    `{"done": true, ...}` line follows once every exchange is saved in a single
+    transaction.
+    """
+    if not check_rate_limit(http_request):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded. Maximum {RATE_LIMIT_REQUESTS} requests per {RATE_LIMIT_WINDOW} seconds."
+        )
+    
+    if not client or not os.getenv("OPENAI_API_KEY"):
+        raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured")
+    
+    # Group items by conversation, keeping their order; items without an ID
+    # each start a new conversation
+    conversations = {}
+    new_conversations = set()
+    for index, item in enumerate(batch_request.items):
+        conversation_id = item.conversation_id
+        if not conversation_id:
+            conversation_id = str(uuid.uuid4())
+            new_conversations.add(conversation_id)
+        conversations.setdefault(conversation_id, []).append((index, item.message))
+    
+    parallelism = min(batch_request.parallelism or BATCH_MAX_PARALLELISM, BATCH_MAX_PARALLELISM)
+    semaphore = asyncio.Semaphore(parallelism)
+    results = asyncio.Queue()
+    exchanges = []  # (conversation_id, role, content) to save at the end
+    windows = {}
+    
+    async def run_conversation(conversation_id: str, entries: list):
+        try:
+            window = (await storage.load_history(
+                conversation_id, new=conversation_id in new_conversations
+            )).copy()
+        except Exception as e:
+            logger.warning(f"Error retrieving conversation history: {e}")
+            window = ContextWindow()
+        windows[conversation_id] = window
+        for index, message in entries:
+            result = {"index": index, "conversation_id": conversation_id}
+            try:
+                async with semaphore:
+                    reply, _ = await complete_reply(
+                        window, message, conversation_id, key=client_address(http_request)
+                    )
+                exchanges.append((conversation_id, "user", message))
+                exchanges.append((conversation_id, "assistant", reply))
+                window.append("user", message, count_tokens(message))
+                window.append("assistant", reply, count_tokens(reply))
+                result["response"] = reply
+            except Exception as e:
+                logger.error(f"Batch item {index} failed: {e}")
+                result["error"] = str(e)
+            await results.put(result)
+    
+    async def save_exchanges():
+        try:
+            await storage.append_messages(exchanges)
+        except Exception as e:
+            logger.error(f"Error saving batch conversations: {e}")
+            return False
+        for conversation_id, window in windows.items():
+            schedule_summary(conversation_id, window)
+        return True
+    
+    async def stream():
+        tasks = [
+            asyncio.create_task(run_conversation(conversation_id, entries))
+            for conversation_id, entries in conversations.items()
+        ]
+        errors = 0
+        finished = False
+        try:
+            for _ in range(len(batch_request.items)):
+                result = await results.get()
+                errors += "error" in result
+                yield json.dumps(result) + "\n"
+            saved = await save_exchanges() if exchanges else True
+            finished = True
+            yield json.dumps({
+                "done": True,
+                "count": len(batch_request.items),
+                "errors": errors,
+                "saved": saved
+            }) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            if not finished and exchanges:
+                # Client went away early: still save the exchanges that completed
+                task = asyncio.create_task(save_exchanges())
+                summary_tasks.add(task)
+                task.add_done_callback(summary_tasks.discard)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
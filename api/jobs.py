@@ -0,0 +1,419 @@
+"""
+Asynchronous webhook jobs.
+
+When `/api/webhook` is called with a `webhook_url`, the request is stored as a
+job and acknowledged with 202 straight away. A bounded pool of worker tasks
+generates the reply and POSTs the result to the webhook URL through a pooled
+HTTP client, retrying failed deliveries with exponential backoff.
+
+Jobs live in the `webhook_jobs` table, so queued work survives a restart:
+on startup, queued jobs are picked up again, as are jobs left running or
+delivering by a worker that stopped more than WEBHOOK_JOB_LEASE seconds ago.
+A worker renews the lease of its job while it waits, so a job is never
+taken over from a live worker.
+
+Webhook URLs must point at public addresses: a host that resolves to a
+loopback, private, link-local or otherwise non-global address is refused,
+both when the job is submitted and before each delivery, so the worker
+cannot be aimed at internal services. Deliveries connect to the very address
+that was checked (PinnedAddressBackend), so a host whose DNS answer changes
+between the check and the connection (DNS rebinding) gets nowhere. WEBHOOK_ALLOWED_HOSTS restricts
+delivery to the listed hosts instead; WEBHOOK_ALLOW_PRIVATE lifts the
+address check (local testing).
+
+Job states: queued -> running -> delivering -> completed | failed
+"""
+
+import asyncio
+import ipaddress
+import logging
+import os
+import random
+import socket
+import sqlite3
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+from urllib.parse import urlparse
+
+import httpcore
+import httpx
+
+from api.db import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_JOB_WORKERS = int(os.getenv("WEBHOOK_JOB_WORKERS", "4"))
+WEBHOOK_JOB_MAX_PENDING = int(os.getenv("WEBHOOK_JOB_MAX_PENDING", "1000"))
+WEBHOOK_JOB_LEASE = int(os.getenv("WEBHOOK_JOB_LEASE", "300"))  # seconds before an abandoned job is retried
+WEBHOOK_DELIVERY_TIMEOUT = float(os.getenv("WEBHOOK_DELIVERY_TIMEOUT", "10"))
+WEBHOOK_DELIVERY_ATTEMPTS = int(os.getenv("WEBHOOK_DELIVERY_ATTEMPTS", "5"))
+WEBHOOK_DELIVERY_BACKOFF = float(os.getenv("WEBHOOK_DELIVERY_BACKOFF", "1"))  # seconds, doubled per attempt
+WEBHOOK_DELIVERY_MAX_BACKOFF = float(os.getenv("WEBHOOK_DELIVERY_MAX_BACKOFF", "60"))
+# Comma-separated hosts webhooks may be sent to; empty allows any public host
+WEBHOOK_ALLOWED_HOSTS = {h.strip().lower() for h in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()}
+WEBHOOK_ALLOW_PRIVATE = os.getenv("WEBHOOK_ALLOW_PRIVATE", "false").lower() == "true"  # local testing only
+
+QUEUED = "queued"
+RUNNING = "running"
+DELIVERING = "delivering"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting"""
+
+
+class InvalidWebhookURLError(ValueError):
+    """Raised for a webhook URL the job worker must not call"""
+
+
+async def check_webhook_url(url: str):
+    """Raise InvalidWebhookURLError unless `url` is an http(s) URL of an allowed, public host"""
+    parsed = urlparse(url)
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    except ValueError:
+        raise InvalidWebhookURLError("webhook_url has an invalid port") from None
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise InvalidWebhookURLError("webhook_url must be an http(s) URL")
+    host = parsed.hostname.lower()
+    if WEBHOOK_ALLOWED_HOSTS:
+        if host not in WEBHOOK_ALLOWED_HOSTS:
+            raise InvalidWebhookURLError(f"webhook_url host {host} is not allowed")
+        return
+    if WEBHOOK_ALLOW_PRIVATE:
+        return
+    await public_addresses(host, port)
+
+
+async def public_addresses(host: str, port: int) -> List[str]:
+    """Addresses `host` resolves to; InvalidWebhookURLError unless every one of them is public"""
+    try:
+        answers = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise InvalidWebhookURLError(f"webhook_url host {host} does not resolve") from None
+    addresses = []
+    for *_, sockaddr in answers:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise InvalidWebhookURLError(f"webhook_url host {host} resolves to a non-public address")
+        if sockaddr[0] not in addresses:
+            addresses.append(sockaddr[0])
+    return addresses
+
+
+class PinnedAddressBackend(httpcore.AsyncNetworkBackend):
+    """
+    Network backend that resolves and checks the host itself, then connects
+    to the checked address. A second lookup by the socket layer could return
+    another answer (DNS rebinding); this way there is none. TLS (SNI and
+    certificate) and the Host header still use the host name.
+    """
+
+    def __init__(self, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+        self._backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host: str, port: int, timeout=None, local_address=None, socket_options=None):
+        if WEBHOOK_ALLOWED_HOSTS or WEBHOOK_ALLOW_PRIVATE:
+            addresses = [host]
+        else:
+            addresses = await public_addresses(host, port)
+        error = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(
+                    address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+                )
+            except httpcore.ConnectError as e:
+                error = e
+        raise error
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+
+def webhook_transport(limits: httpx.Limits, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+    """HTTP transport for webhook deliveries, connecting through PinnedAddressBackend"""
+    transport = httpx.AsyncHTTPTransport(limits=limits)
+    transport._pool = httpcore.AsyncConnectionPool(
+        ssl_context=httpx.create_ssl_context(),
+        max_connections=limits.max_connections,
+        max_keepalive_connections=limits.max_keepalive_connections,
+        keepalive_expiry=limits.keepalive_expiry,
+        network_backend=PinnedAddressBackend(backend),
+    )
+    return transport
+
+
+@dataclass
+class Job:
+    job_id: str
+    status: str
+    conversation_id: str
+    message: str
+    webhook_url: str
+    response: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+
+def create_schema(conn: sqlite3.Connection):
+    """Create the jobs table"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS webhook_jobs (
+            job_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            conversation_id TEXT NOT NULL,
+            message TEXT NOT NULL,
+            webhook_url TEXT NOT NULL,
+            response TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_webhook_jobs_status ON webhook_jobs(status, updated_at)")
+
+
+def _row_to_job(row: sqlite3.Row) -> Job:
+    return Job(**{key: row[key] for key in row.keys()})
+
+
+class JobQueue:
+    """
+    Persistent job queue drained by a bounded pool of asyncio workers.
+
+    `process(job)` produces the reply text for a job; `run_blocking(func, *args)`
+    runs database calls off the event loop (e.g. `SQLiteStorage.run_blocking`).
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        process: Callable[[Job], Awaitable[str]],
+        run_blocking: Callable[..., Awaitable],
+        workers: int = WEBHOOK_JOB_WORKERS,
+        max_pending: int = WEBHOOK_JOB_MAX_PENDING,
+    ):
+        self.pool = pool
+        self.process = process
+        self.run_blocking = run_blocking
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._http: Optional[httpx.AsyncClient] = None
+        self.busy = 0
+
+    @property
+    def depth(self) -> int:
+        """Jobs waiting for a worker"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        """Start the workers and resume jobs left over from a previous run"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._http = httpx.AsyncClient(
+            timeout=WEBHOOK_DELIVERY_TIMEOUT,
+            transport=webhook_transport(httpx.Limits(max_connections=max(self.workers * 2, 10))),
+        )
+        self._tasks = [asyncio.create_task(self._worker(), name=f"webhook-job-{i}") for i in range(self.workers)]
+        for job_id in await self.run_blocking(self._recover):
+            self._queue.put_nowait(job_id)
+
+    async def close(self):
+        """Stop the workers; unfinished jobs stay persisted and resume on the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        self._queue = None
+
+    async def submit(self, conversation_id: str, message: str, webhook_url: str) -> Job:
+        """Persist a new job and queue it for a worker"""
+        await self.start()
+        if self.depth >= self.max_pending:
+            raise QueueFullError(f"{self.depth} webhook jobs are already queued")
+        job = Job(
+            job_id=str(uuid.uuid4()),
+            status=QUEUED,
+            conversation_id=conversation_id,
+            message=message,
+            webhook_url=webhook_url,
+        )
+        await self.run_blocking(self._insert, job)
+        self._queue.put_nowait(job.job_id)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Current state of a job"""
+        return await self.run_blocking(self._get, job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self.busy += 1
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Webhook job {job_id} crashed: {e}", exc_info=True)
+            finally:
+                self.busy -= 1
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        job = await self.run_blocking(self._claim, job_id)
+        if job is None:
+            return  # already finished or claimed by another worker process
+        if job.status == RUNNING:
+            try:
+                job.response = await self._leased(job, self.process(job))
+                job.error = None
+            except Exception as e:
+                logger.error(f"Webhook job {job_id} failed: {e}")
+                job.error = str(e)
+            job.status = DELIVERING
+            await self.run_blocking(self._update, job)
+        delivered = await self._leased(job, self._deliver(job))
+        if not delivered:
+            job.status = FAILED
+            job.error = job.error or "Webhook delivery failed"
+        else:
+            job.status = FAILED if job.error else COMPLETED
+        await self.run_blocking(self._update, job)
+
+    async def _leased(self, job: Job, work: Awaitable):
+        """
+        Await `work`, renewing the job's lease meanwhile: a reply can wait on
+        upstream capacity (or a delivery retry) for longer than
+        WEBHOOK_JOB_LEASE, and another process must not take the job over.
+        """
+        task = asyncio.ensure_future(work)
+        try:
+            while True:
+                done, _ = await asyncio.wait((task,), timeout=WEBHOOK_JOB_LEASE / 3)
+                if done:
+                    return task.result()
+                await self.run_blocking(self._renew, job)
+        finally:
+            task.cancel()
+
+    async def _deliver(self, job: Job) -> bool:
+        """POST the result to the job's webhook URL, retrying with exponential backoff"""
+        payload = {
+            "job_id": job.job_id,
+            "conversation_id": job.conversation_id,
+            "status": FAILED if job.error else COMPLETED,
+            "response": job.response,
+            "error": job.error,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+        try:
+            # Again at delivery: the host may resolve differently by now
+            await check_webhook_url(job.webhook_url)
+        except InvalidWebhookURLError as e:
+            logger.warning(f"Not delivering job {job.job_id}: {e}")
+            job.error = job.error or str(e)
+            return False
+        delay = WEBHOOK_DELIVERY_BACKOFF
+        for attempt in range(1, WEBHOOK_DELIVERY_ATTEMPTS + 1):
+            job.attempts += 1
+            try:
+                response = await self._http.post(job.webhook_url, json=payload)
+                if response.status_code < 400:
+                    return True
+                # Client errors other than throttling will not succeed on retry
+                if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                    logger.warning(f"Webhook {job.webhook_url} rejected job {job.job_id}: {response.status_code}")
+                    return False
+                logger.warning(f"Webhook delivery attempt {attempt} for job {job.job_id}: {response.status_code}")
+            except InvalidWebhookURLError as e:
+                logger.warning(f"Not delivering job {job.job_id}: {e}")
+                job.error = job.error or str(e)
+                return False
+            except httpx.HTTPError as e:
+                logger.warning(f"Webhook delivery attempt {attempt} for job {job.job_id} failed: {e}")
+            if attempt < WEBHOOK_DELIVERY_ATTEMPTS:
+                await asyncio.sleep(delay * (0.5 + random.random()))
+                delay = min(delay * 2, WEBHOOK_DELIVERY_MAX_BACKOFF)
+        return False
+
+    # Blocking database operations (run on the storage executor)
+
+    def _insert(self, job: Job):
+        with self.pool.writer() as conn:
+            conn.execute(
+                "INSERT INTO webhook_jobs (job_id, status, conversation_id, message, webhook_url) VALUES (?, ?, ?, ?, ?)",
+                (job.job_id, job.status, job.conversation_id, job.message, job.webhook_url),
+            )
+
+    def _get(self, job_id: str) -> Optional[Job]:
+        with self.pool.reader() as conn:
+            row = conn.execute("SELECT * FROM webhook_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def _claim(self, job_id: str) -> Optional[Job]:
+        """
+        Atomically move a queued job to running, or take over an undelivered
+        result whose lease ran out. Returns None when another worker has it.
+        """
+        with self.pool.writer() as conn:
+            claimed = conn.execute(
+                "UPDATE webhook_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE job_id = ? AND status = ?",
+                (RUNNING, job_id, QUEUED),
+            ).rowcount
+            if not claimed:
+                # Restarting the lease claims the delivery for this worker alone
+                claimed = conn.execute(
+                    "UPDATE webhook_jobs SET updated_at = CURRENT_TIMESTAMP "
+                    "WHERE job_id = ? AND status = ? AND updated_at < datetime('now', ?)",
+                    (job_id, DELIVERING, f"-{WEBHOOK_JOB_LEASE} seconds"),
+                ).rowcount
+            if not claimed:
+                return None
+            row = conn.execute("SELECT * FROM webhook_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return _row_to_job(row)
+
+    def _update(self, job: Job):
+        with self.pool.writer() as conn:
+            conn.execute(
+                "UPDATE webhook_jobs SET status = ?, response = ?, error = ?, attempts = ?, "
+                "updated_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+                (job.status, job.response, job.error, job.attempts, job.job_id),
+            )
+
+    def _renew(self, job: Job):
+        with self.pool.writer() as conn:
+            conn.execute(
+                "UPDATE webhook_jobs SET updated_at = CURRENT_TIMESTAMP WHERE job_id = ? AND status = ?",
+                (job.job_id, job.status),
+            )
+
+    def _recover(self) -> List[str]:
+        """Requeue abandoned jobs and return every job id that needs a worker"""
+        with self.pool.writer() as conn:
+            conn.execute(
+                "UPDATE webhook_jobs SET status = ? WHERE status = ? AND updated_at < datetime('now', ?)",
+                (QUEUED, RUNNING, f"-{WEBHOOK_JOB_LEASE} seconds"),
+            )
+            rows = conn.execute(
+                "SELECT job_id FROM webhook_jobs WHERE status = ? "
+                "OR (status = ? AND updated_at < datetime('now', ?)) ORDER BY created_at",
+                (QUEUED, DELIVERING, f"-{WEBHOOK_JOB_LEASE} seconds"),
+            ).fetchall()
+        return [row["job_id"] for row in rows]
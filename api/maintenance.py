@@ -0,0 +1,411 @@
+"""
+Background maintenance of the conversation database.
+
+The `messages` table only grows, and every index over it grows too. A
+periodic sweep keeps the hot tables small:
+
+- Conversations idle for ARCHIVE_AFTER_DAYS move out of `messages` into
+  `archived_conversations`, one compressed blob per conversation (zlib, or
+  zstd when the `zstandard` package is installed and ARCHIVE_CODEC=zstd).
+  Reads rehydrate an archived conversation transparently (`ensure_hot`), so
+  callers never see the difference beyond one slower first read.
+- Conversations idle for RETENTION_DAYS are deleted outright (disabled by
+  default); messages, summaries and archives go with them by cascade.
+- Freed pages are returned to the filesystem with `PRAGMA incremental_vacuum`
+  and planner statistics are refreshed with a bounded `ANALYZE`.
+
+Work is done in small transactions so the writer is never held for long and
+group-committed message writes keep flowing. With several worker processes,
+only the one holding an exclusive lock on MAINTENANCE_LOCK_PATH runs the
+sweep; the lock passes to another worker when its holder exits. Every run is recorded in
+`maintenance_runs` (space reclaimed, database and hot-table size), readable
+from `GET /api/maintenance/reports` or the CLI.
+
+Usage (from the repository root):
+    python -m api.maintenance --db conversations.db --run
+    python -m api.maintenance --db conversations.db --report 24
+    python -m api.maintenance --db conversations.db --vacuum   # one-off full VACUUM
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import List, Optional
+
+from api.db import ConnectionPool
+from api.metrics import ARCHIVE_OPERATIONS
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, where every scheduler runs the sweep
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency; zlib is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "true").lower() == "true"
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "3600"))  # seconds between sweeps
+MAINTENANCE_INITIAL_DELAY = float(os.getenv("MAINTENANCE_INITIAL_DELAY", "60"))  # seconds after startup
+MAINTENANCE_LOCK_PATH = os.getenv("MAINTENANCE_LOCK_PATH")  # default: next to the database
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))  # 0 disables archiving
+ARCHIVE_CODEC = os.getenv("ARCHIVE_CODEC", "zlib").lower()  # zlib | zstd
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))  # conversations per transaction
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "0"))  # 0 keeps conversations forever
+VACUUM_STEP_PAGES = int(os.getenv("VACUUM_STEP_PAGES", "2000"))  # pages freed per transaction
+ANALYZE_LIMIT = int(os.getenv("ANALYZE_LIMIT", "1000"))  # rows sampled per index by ANALYZE
+MAINTENANCE_REPORTS_KEPT = 1000
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(payload: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archived conversation uses zstd but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+def archive_codec() -> str:
+    if ARCHIVE_CODEC == "zstd" and zstandard is None:
+        logger.warning("ARCHIVE_CODEC=zstd but zstandard is not installed; archiving with zlib")
+        return "zlib"
+    return ARCHIVE_CODEC if ARCHIVE_CODEC in ("zlib", "zstd") else "zlib"
+
+
+# Archiving and rehydration (the caller owns the transaction)
+
+def archive_conversation(conn: sqlite3.Connection, conversation_id: str, codec: str) -> int:
+    """Move a conversation's messages into its archive blob; returns the number of messages moved"""
+    rows = conn.execute(
+        "SELECT id, role, content, timestamp, token_count FROM messages WHERE conversation_id = ? ORDER BY id",
+        (conversation_id,),
+    ).fetchall()
+    if not rows:
+        return 0
+    # Messages written after an earlier archive (not yet rehydrated) are merged into it
+    records = _archived_records(conn, conversation_id) + [list(row) for row in rows]
+    raw = json.dumps(records, separators=(",", ":")).encode()
+    payload = compress(raw, codec)
+    conn.execute(
+        "INSERT OR REPLACE INTO archived_conversations "
+        "(conversation_id, codec, payload, message_count, raw_bytes, compressed_bytes) VALUES (?, ?, ?, ?, ?, ?)",
+        (conversation_id, codec, payload, len(records), len(raw), len(payload)),
+    )
+    conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+    return len(rows)
+
+
+def _archived_records(conn: sqlite3.Connection, conversation_id: str) -> List[list]:
+    row = conn.execute(
+        "SELECT codec, payload FROM archived_conversations WHERE conversation_id = ?", (conversation_id,)
+    ).fetchone()
+    return json.loads(decompress(row[1], row[0])) if row else []
+
+
+def rehydrate_conversation(conn: sqlite3.Connection, conversation_id: str) -> int:
+    """Restore archived messages (with their original ids) into `messages`; returns the count"""
+    records = _archived_records(conn, conversation_id)
+    if not records:
+        return 0
+    conn.executemany(
+        "INSERT OR IGNORE INTO messages (id, role, content, timestamp, token_count, conversation_id) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [record + [conversation_id] for record in records],
+    )
+    conn.execute("DELETE FROM archived_conversations WHERE conversation_id = ?", (conversation_id,))
+    # Keeps the next sweep from archiving it again straight away
+    conn.execute(
+        "UPDATE conversations SET rehydrated_at = CURRENT_TIMESTAMP WHERE conversation_id = ?", (conversation_id,)
+    )
+    return len(records)
+
+
+def ensure_hot(pool: ConnectionPool, conversation_id: str):
+    """Rehydrate the conversation if it is archived; a primary-key lookup when it is not"""
+    with pool.reader() as conn:
+        archived = conn.execute(
+            "SELECT 1 FROM archived_conversations WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+    if archived:
+        with pool.writer() as conn:
+            count = rehydrate_conversation(conn, conversation_id)
+        if count:
+            ARCHIVE_OPERATIONS.labels("rehydrate").inc()
+            logger.info(f"Rehydrated {count} archived messages of conversation {conversation_id}")
+
+
+# Sweep steps
+
+def archive_idle(pool: ConnectionPool, days: float = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> dict:
+    """Archive every conversation idle (no writes, no rehydration) for `days`"""
+    totals = {"conversations": 0, "messages": 0}
+    if days <= 0:
+        return totals
+    codec = archive_codec()
+    cutoff = f"-{days * 86400:.0f} seconds"
+    while True:
+        with pool.writer() as conn:
+            candidates = conn.execute(
+                """
+                SELECT conversation_id FROM conversations c
+                WHERE updated_at < datetime('now', ?)
+                  AND (rehydrated_at IS NULL OR rehydrated_at < datetime('now', ?))
+                  AND EXISTS (SELECT 1 FROM messages m WHERE m.conversation_id = c.conversation_id)
+                ORDER BY updated_at LIMIT ?
+                """,
+                (cutoff, cutoff, batch_size),
+            ).fetchall()
+            for (conversation_id,) in candidates:
+                totals["messages"] += archive_conversation(conn, conversation_id, codec)
+        totals["conversations"] += len(candidates)
+        if len(candidates) < batch_size:
+            break
+    ARCHIVE_OPERATIONS.labels("archive").inc(totals["conversations"])
+    return totals
+
+
+def expire(pool: ConnectionPool, days: float = RETENTION_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Delete conversations with no writes for `days`; returns how many were deleted"""
+    if days <= 0:
+        return 0
+    deleted = 0
+    while True:
+        with pool.writer() as conn:
+            count = conn.execute(
+                "DELETE FROM conversations WHERE conversation_id IN ("
+                "SELECT conversation_id FROM conversations WHERE updated_at < datetime('now', ?) LIMIT ?)",
+                (f"-{days * 86400:.0f} seconds", batch_size),
+            ).rowcount
+        deleted += count
+        if count < batch_size:
+            break
+    ARCHIVE_OPERATIONS.labels("expire").inc(deleted)
+    return deleted
+
+
+def vacuum(pool: ConnectionPool, step_pages: int = VACUUM_STEP_PAGES) -> int:
+    """Return free pages to the filesystem a step at a time; returns pages released"""
+    released = 0
+    with pool.reader() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.warning("auto_vacuum is not INCREMENTAL; run `python -m api.maintenance --vacuum` once")
+            return 0
+    while True:
+        with pool.writer() as conn:
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not before:
+                break
+            # Each result row is one freed page; the pragma only runs while it is stepped
+            conn.execute(f"PRAGMA incremental_vacuum({int(step_pages)})").fetchall()
+            after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        released += before - after
+        if after == 0 or before == after:
+            break
+    return released
+
+
+def analyze(pool: ConnectionPool, limit: int = ANALYZE_LIMIT):
+    """Refresh planner statistics, sampling at most `limit` rows per index"""
+    with pool.writer() as conn:
+        conn.execute(f"PRAGMA analysis_limit = {int(limit)}")
+        conn.execute("ANALYZE")
+
+
+def database_stats(conn: sqlite3.Connection) -> dict:
+    """Database size, free space, hot and archived message counts"""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # Row count as of the last ANALYZE: exact counts would scan the whole table
+    stat = conn.execute(
+        "SELECT stat FROM sqlite_stat1 WHERE tbl = 'messages' ORDER BY idx IS NULL DESC LIMIT 1"
+    ).fetchone() if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() else None
+    archived = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(message_count), 0), COALESCE(SUM(compressed_bytes), 0), "
+        "COALESCE(SUM(raw_bytes), 0) FROM archived_conversations"
+    ).fetchone()
+    return {
+        "db_bytes": page_size * page_count,
+        "free_bytes": page_size * free_pages,
+        "hot_messages": int(stat[0].split()[0]) if stat else None,
+        "archived_conversations": archived[0],
+        "archived_messages": archived[1],
+        "archive_bytes": archived[2],
+        "archive_raw_bytes": archived[3],
+    }
+
+
+def run_maintenance(pool: ConnectionPool) -> dict:
+    """One full sweep: archive, expire, vacuum, analyze, then record a report"""
+    began = time.monotonic()
+    with pool.reader() as conn:
+        before = database_stats(conn)
+    archived = archive_idle(pool)
+    expired = expire(pool)
+    released_pages = vacuum(pool)
+    analyze(pool)
+    with pool.reader() as conn:
+        after = database_stats(conn)
+    report = {
+        "duration_ms": round((time.monotonic() - began) * 1000),
+        "archived_conversations": archived["conversations"],
+        "archived_messages": archived["messages"],
+        "expired_conversations": expired,
+        "released_pages": released_pages,
+        "reclaimed_bytes": before["db_bytes"] - after["db_bytes"],
+        "db_bytes": after["db_bytes"],
+        "free_bytes": after["free_bytes"],
+        "hot_messages": after["hot_messages"],
+        "total_archived_conversations": after["archived_conversations"],
+        "total_archived_messages": after["archived_messages"],
+        "total_archive_bytes": after["archive_bytes"],
+        "total_archive_raw_bytes": after["archive_raw_bytes"],
+    }
+    with pool.writer() as conn:
+        conn.execute(
+            "INSERT INTO maintenance_runs (report) VALUES (?)", (json.dumps(report),)
+        )
+        conn.execute(
+            "DELETE FROM maintenance_runs WHERE id <= (SELECT MAX(id) FROM maintenance_runs) - ?",
+            (MAINTENANCE_REPORTS_KEPT,),
+        )
+    logger.info(
+        f"Maintenance: archived {archived['conversations']} conversations ({archived['messages']} messages), "
+        f"expired {expired}, reclaimed {report['reclaimed_bytes']} bytes in {report['duration_ms']} ms"
+    )
+    return report
+
+
+def recent_reports(conn: sqlite3.Connection, limit: int = 24) -> List[dict]:
+    """Newest maintenance reports first"""
+    rows = conn.execute(
+        "SELECT id, finished_at, report FROM maintenance_runs ORDER BY id DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [{"id": row[0], "finished_at": row[1], **json.loads(row[2])} for row in rows]
+
+
+class MaintenanceScheduler:
+    """
+    Runs `run_maintenance` every `interval` seconds on a background thread,
+    in one process per database: the one holding the lock file
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        interval: float = MAINTENANCE_INTERVAL,
+        initial_delay: float = MAINTENANCE_INITIAL_DELAY,
+        enabled: bool = MAINTENANCE_ENABLED,
+        lock_path: Optional[str] = MAINTENANCE_LOCK_PATH,
+    ):
+        self.pool = pool
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self.enabled = enabled
+        self.lock_path = lock_path or f"{pool.path}-maintenance.lock"
+        self.last_report: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock_fd: Optional[int] = None
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="db-maintenance")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # releases the lock
+            self._lock_fd = None
+
+    def _lead(self) -> bool:
+        """
+        Whether this process runs the sweep: it takes the lock once and keeps
+        it, and the operating system releases it if the process dies
+        """
+        if fcntl is None or self._lock_fd is not None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # flock, not lockf: the lock belongs to this descriptor, so it also
+            # excludes other schedulers in the same process
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        logger.info(f"Database maintenance runs in this process (pid {os.getpid()})")
+        return True
+
+    async def _loop(self):
+        await asyncio.sleep(self.initial_delay)
+        while True:
+            try:
+                if self._lead():
+                    # Its own thread: a sweep must not tie up the request executor
+                    self.last_report = await asyncio.to_thread(run_maintenance, self.pool)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Database maintenance failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "conversations.db"), help="Database file")
+    parser.add_argument("--run", action="store_true", help="Run one maintenance sweep now")
+    parser.add_argument("--report", type=int, metavar="N", help="Print the last N maintenance reports")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="Full VACUUM, switching the database to incremental auto-vacuum (locks it while running)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from api.migrations import migrate
+
+    pool = ConnectionPool(args.db)
+    try:
+        with pool.writer() as conn:
+            migrate(conn)
+        if args.vacuum:
+            with pool.writer() as conn:
+                conn.commit()
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            print("Vacuumed; auto_vacuum is now INCREMENTAL")
+        if args.run:
+            print(json.dumps(run_maintenance(pool), indent=2))
+        if args.report:
+            with pool.reader() as conn:
+                for report in reversed(recent_reports(conn, args.report)):
+                    print(
+                        f"{report['finished_at']}  archived {report['archived_conversations']:>6}  "
+                        f"expired {report['expired_conversations']:>6}  reclaimed {report['reclaimed_bytes']:>12,} B  "
+                        f"db {report['db_bytes']:>14,} B  hot messages {report['hot_messages'] or 0:>11,}  "
+                        f"archive {report['total_archive_bytes']:>12,} B"
+                    )
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+A deliberately small subset of a Prometheus client: counters, gauges and
+histograms with fixed label names, plus callback metrics that read existing
+stats (cache counters, queue depths) at scrape time. Recording an
+observation is a dict lookup, a bisect over the bucket bounds and a couple
+of additions under a lock, about a microsecond, so instrumentation can stay
+on in production. `GET /metrics` renders everything in `REGISTRY`.
+
+Set METRICS_ENABLED=false to turn recording into no-ops.
+"""
+
+import os
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Default latency buckets in seconds, from sub-millisecond SQLite queries to
+# long upstream generations
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Number = Union[int, float]
+
+
+def _format_value(value: Number) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> "_Metric":
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format"""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+        if registry is not None:
+            registry.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Child metric for one combination of label values"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: Number = 1):
+        if METRICS_ENABLED:
+            with self.lock:
+                self.value += amount
+
+    def dec(self, amount: Number = 1):
+        self.inc(-amount)
+
+    def set(self, value: Number):
+        if METRICS_ENABLED:
+            self.value = value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: Number = 1):
+        self._default.inc(amount)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    type = "gauge"
+
+    def dec(self, amount: Number = 1):
+        self._default.dec(amount)
+
+    def set(self, value: Number):
+        self._default.set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        if METRICS_ENABLED:
+            index = bisect_left(self.bounds, value)
+            with self.lock:
+                self.counts[index] += 1
+                self.sum += value
+
+    def time(self) -> "_Timer":
+        """Context manager observing the elapsed wall time in seconds"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("histogram", "began")
+
+    def __init__(self, histogram: _HistogramValue):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.began = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(perf_counter() - self.began)
+        return False
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            with child.lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, values)} {cumulative}")
+        return lines
+
+
+class Callback(_Metric):
+    """
+    Metric read at scrape time from existing state.
+
+    `function()` returns a number, or a dict mapping label-value tuples to
+    numbers when `labelnames` are given.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        function: Callable[[], Union[Number, Dict[Tuple[str, ...], Number]]],
+        type: str = "gauge",
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.function = function
+        self.type = type
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return None
+
+    def samples(self) -> List[str]:
+        try:
+            result = self.function()
+        except Exception:
+            return []
+        if not self.labelnames:
+            result = {(): result}
+        return [
+            f"{self.name}{_label_text(self.labelnames, values)} {_format_value(value)}"
+            for values, value in result.items()
+        ]
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and timing them per route template.
+
+    Durations run until the response body is complete, so for streaming
+    endpoints they cover the whole stream. Requests that match no route are
+    grouped under one label to keep cardinality bounded.
+    """
+
+    def __init__(self, app, requests_total: Counter, request_duration: Histogram):
+        self.app = app
+        self.requests_total = requests_total
+        self.request_duration = request_duration
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        began = perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            self.request_duration.labels(method, path).observe(perf_counter() - began)
+            self.requests_total.labels(method, path, str(status_code)).inc()
+
+
+# Application metrics shared across modules
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status code", ("method", "path", "status")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request duration until the response body completes", ("method", "path")
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Duration of OpenAI completion calls", ("kind",)
+)
+UPSTREAM_TTFT_SECONDS = Histogram(
+    "upstream_time_to_first_token_seconds", "Time from sending a streaming completion to its first content token"
+)
+UPSTREAM_TOKENS_PER_SECOND = Histogram(
+    "upstream_tokens_per_second", "Streamed completion tokens per second after the first token",
+    buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+UPSTREAM_TOKENS = Counter("upstream_completion_tokens_total", "Completion tokens (stream chunks) received from OpenAI")
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "Failed OpenAI completion calls", ("kind",))
+UPSTREAM_QUEUE_SECONDS = Histogram(
+    "upstream_queue_wait_seconds", "Time completions waited for an upstream slot", ("priority",)
+)
+UPSTREAM_SHED = Counter(
+    "upstream_shed_total", "Completions refused because the upstream queue was over its latency budget", ("priority",)
+)
+SSE_ACTIVE_STREAMS = Gauge("sse_active_streams", "Server-Sent Event responses currently streaming")
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Duration of SQLite operations", ("operation",))
+ARCHIVE_OPERATIONS = Counter(
+    "conversation_archive_operations_total", "Conversations archived, rehydrated or expired by maintenance", ("operation",)
+)
@@ -0,0 +1,281 @@
+"""
+Versioned schema migrations for the conversation database.
+
+The schema version lives in SQLite's `PRAGMA user_version`. `migrate()` runs
+every step above the stored version in order, each in its own IMMEDIATE
+transaction together with the version bump, so a failed step leaves the
+database at the previous version and concurrent workers starting at the same
+time apply each step exactly once.
+
+Versions:
+    1  original tables (conversations, messages, summaries, webhook jobs)
+    2  messages and summaries rebuilt with ON DELETE CASCADE foreign keys,
+       composite (conversation_id, id) message index, conversations.updated_at
+       index
+    3  compressed conversation archive, conversations.rehydrated_at and the
+       maintenance report log (see api/maintenance.py)
+    4  FTS5 full-text index over message content, kept in step by triggers
+       and filled from the existing rows (see api/search.py)
+
+Foreign keys are switched off while steps run (table rebuilds require it) and
+checked with `PRAGMA foreign_key_check` before each step after the first
+commits.
+
+Usage (from the repository root):
+    python -m api.migrations --db conversations.db            # apply pending steps
+    python -m api.migrations --db conversations.db --status   # show the version only
+    python -m api.migrations --db conversations.db --explain  # query plans of the history queries
+"""
+
+import argparse
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+from api import context as context_schema
+from api import jobs as jobs_schema
+from api import search
+
+logger = logging.getLogger(__name__)
+
+
+def _v1_initial(conn: sqlite3.Connection):
+    """Original schema; a no-op on databases created before versioning"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            conversation_id TEXT PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversation_id ON messages(conversation_id)")
+    context_schema.create_schema(conn)
+    jobs_schema.create_schema(conn)
+
+
+def _v2_cascade_and_ordered_index(conn: sqlite3.Connection):
+    """Rebuild messages and summaries with cascading foreign keys; add ordered indexes"""
+    # Messages whose conversation row is missing get one, so no history is lost
+    conn.execute("""
+        INSERT OR IGNORE INTO conversations (conversation_id)
+        SELECT DISTINCT conversation_id FROM messages WHERE conversation_id IS NOT NULL
+    """)
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'messages'").fetchone()
+
+    conn.execute("""
+        CREATE TABLE messages_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT REFERENCES conversations(conversation_id) ON DELETE CASCADE,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            token_count INTEGER
+        )
+    """)
+    conn.execute("""
+        INSERT INTO messages_v2 (id, conversation_id, role, content, timestamp, token_count)
+        SELECT id, conversation_id, role, content, timestamp, token_count FROM messages
+    """)
+    conn.execute("DROP TABLE messages")
+    conn.execute("ALTER TABLE messages_v2 RENAME TO messages")
+    # Keep AUTOINCREMENT from reusing ids of messages deleted before the rebuild
+    if sequence is not None:
+        updated = conn.execute(
+            "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'messages'", (sequence[0],)
+        ).rowcount
+        if not updated:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', ?)", (sequence[0],))
+
+    # History is always read per conversation in id order; the index hands rows
+    # back in that order, so no query needs a temporary sort
+    conn.execute("CREATE INDEX idx_messages_conversation ON messages(conversation_id, id)")
+
+    # Summaries of conversations that no longer exist are dropped
+    conn.execute("""
+        CREATE TABLE conversation_summaries_v2 (
+            conversation_id TEXT PRIMARY KEY REFERENCES conversations(conversation_id) ON DELETE CASCADE,
+            summary TEXT NOT NULL,
+            summarized_through_id INTEGER NOT NULL,
+            token_count INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        INSERT INTO conversation_summaries_v2
+        SELECT s.conversation_id, s.summary, s.summarized_through_id, s.token_count, s.updated_at
+        FROM conversation_summaries s JOIN conversations c ON c.conversation_id = s.conversation_id
+    """)
+    conn.execute("DROP TABLE conversation_summaries")
+    conn.execute("ALTER TABLE conversation_summaries_v2 RENAME TO conversation_summaries")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations(updated_at)")
+
+
+def _v3_archive(conn: sqlite3.Connection):
+    """Archive table for idle conversations and the maintenance report log"""
+    conn.execute("ALTER TABLE conversations ADD COLUMN rehydrated_at TIMESTAMP")
+    conn.execute("""
+        CREATE TABLE archived_conversations (
+            conversation_id TEXT PRIMARY KEY REFERENCES conversations(conversation_id) ON DELETE CASCADE,
+            codec TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            message_count INTEGER NOT NULL,
+            raw_bytes INTEGER NOT NULL,
+            compressed_bytes INTEGER NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            report TEXT NOT NULL
+        )
+    """)
+
+
+def _v4_search(conn: sqlite3.Connection):
+    """Full-text index over messages; indexing existing rows takes about 20 s per million"""
+    search.rebuild(conn)
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _v1_initial,
+    _v2_cascade_and_ordered_index,
+    _v3_archive,
+    _v4_search,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations and return the resulting schema version"""
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
+    if conn.in_transaction:
+        conn.commit()
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for version, step in enumerate(MIGRATIONS, start=1):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-read under the write lock: another process may have got here first
+                if schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                step(conn)
+                # The original schema never enforced its foreign key, so only later steps are checked
+                violations = conn.execute("PRAGMA foreign_key_check").fetchall() if version > 1 else []
+                if violations:
+                    raise sqlite3.IntegrityError(f"Migration {version} left {len(violations)} foreign key violations")
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            logger.info(f"Database schema migrated to version {version}")
+    finally:
+        conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+    return SCHEMA_VERSION
+
+
+# History queries with sample parameters, checked by `explain_hot_queries`
+HOT_QUERIES: List[Tuple[str, str, tuple]] = [
+    (
+        "load_context",
+        "SELECT id, role, content, token_count FROM messages WHERE conversation_id = ? AND id > ? ORDER BY id DESC",
+        ("conversation", 0),
+    ),
+    (
+        "pending_summary",
+        "SELECT id, role, content, token_count FROM messages "
+        "WHERE conversation_id = ? AND id > ? AND id < ? ORDER BY id ASC",
+        ("conversation", 0, 1000),
+    ),
+    (
+        "get_conversation",
+        "SELECT id, role, content, timestamp FROM messages WHERE conversation_id = ? ORDER BY id ASC",
+        ("conversation",),
+    ),
+    (
+        "conversation_page_backwards",
+        "SELECT id, role, content, timestamp FROM messages WHERE conversation_id = ? AND id < ? "
+        "ORDER BY id DESC LIMIT ?",
+        ("conversation", 1000, 100),
+    ),
+    (
+        "list_conversations",
+        "SELECT conversation_id, updated_at FROM conversations ORDER BY updated_at DESC LIMIT ?",
+        (20,),
+    ),
+]
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[str]:
+    """The `EXPLAIN QUERY PLAN` lines for a query"""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def explain_hot_queries(conn: sqlite3.Connection) -> List[Tuple[str, List[str], List[str]]]:
+    """
+    (name, plan, problems) for each history query. A problem is a full table
+    scan or a temporary B-tree sort, either of which grows with table size.
+    """
+    results = []
+    for name, sql, params in HOT_QUERIES:
+        plan = explain(conn, sql, params)
+        problems = [
+            line for line in plan
+            if "USE TEMP B-TREE" in line or (line.startswith("SCAN") and "USING" not in line)
+        ]
+        results.append((name, plan, problems))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="conversations.db", help="Database file")
+    parser.add_argument("--status", action="store_true", help="Print the schema version without migrating")
+    parser.add_argument("--explain", action="store_true", help="Print query plans; exit 1 if any needs a scan or sort")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.status:
+            print(f"Schema version {schema_version(conn)} (latest {SCHEMA_VERSION})")
+            return
+        before = schema_version(conn)
+        after = migrate(conn)
+        print(f"Schema version {before} -> {after}" if after != before else f"Schema version {after}, up to date")
+        if args.explain:
+            failed = False
+            for name, plan, problems in explain_hot_queries(conn):
+                print(f"{name}: {'FAIL' if problems else 'ok'}")
+                for line in plan:
+                    print(f"    {line}")
+                failed = failed or bool(problems)
+            if failed:
+                raise SystemExit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Write-behind message persistence with group commit.
+
+Request handlers enqueue message writes instead of running their own
+transaction. A background flusher drains the queue in batches, writing every
+queued message with `executemany` inside a single transaction, so concurrent
+requests share one commit (and one fsync) instead of paying for their own.
+
+A batch is flushed when it reaches `batch_size` messages or when the oldest
+queued write is `flush_interval` seconds old, whichever comes first.
+
+Durability modes:
+    async - enqueue() returns immediately; a crash can lose the writes of the
+            last flush interval. Lowest latency.
+    sync  - callers wait on the returned future until their batch commits.
+            Still group-committed with other in-flight requests.
+
+Reads that must see earlier writes (the next turn of the same conversation)
+call `wait_for(conversation_id)` first, which forces an immediate flush when
+that conversation still has queued writes.
+"""
+
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from time import monotonic
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from api.metrics import DB_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DB_WRITE_DURABILITY = os.getenv("DB_WRITE_DURABILITY", "async").lower()  # async | sync
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "256"))
+DB_WRITE_FLUSH_INTERVAL_MS = int(os.getenv("DB_WRITE_FLUSH_INTERVAL_MS", "50"))
+
+# (sequence number, conversation_id, role, content, token_count, future)
+PendingWrite = Tuple[int, str, str, str, Optional[int], Future]
+
+
+def write_messages(conn, rows: List[Tuple[str, str, str, Optional[int]]]):
+    """
+    Insert (conversation_id, role, content, token_count) rows with executemany,
+    creating conversations and bumping updated_at once per conversation.
+    The caller owns the transaction.
+    """
+    conversation_ids = [(cid,) for cid in dict.fromkeys(row[0] for row in rows)]
+    conn.executemany("INSERT OR IGNORE INTO conversations (conversation_id) VALUES (?)", conversation_ids)
+    conn.executemany(
+        "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE conversation_id = ?",
+        conversation_ids,
+    )
+    conn.executemany(
+        "INSERT INTO messages (conversation_id, role, content, token_count) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+
+
+class WriteBehindQueue:
+    """
+    Collects message writes from all requests and commits them in batches.
+
+    `get_writer` must return a context manager yielding a connection that
+    commits on exit (e.g. `ConnectionPool.writer`).
+    """
+
+    def __init__(
+        self,
+        get_writer: Callable,
+        batch_size: int = DB_WRITE_BATCH_SIZE,
+        flush_interval: float = DB_WRITE_FLUSH_INTERVAL_MS / 1000,
+        durability: str = DB_WRITE_DURABILITY,
+    ):
+        if durability not in ("async", "sync"):
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.get_writer = get_writer
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self._queue: Deque[PendingWrite] = deque()
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._flush_requested = False
+        self._last_write: Dict[str, Future] = {}  # conversation_id -> future of its newest queued write
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def enqueue(self, conversation_id: str, role: str, content: str, token_count: Optional[int] = None) -> Future:
+        """
+        Queue one message for persistence.
+
+        Returns a future that resolves once the message is committed. In sync
+        mode callers should wait on it; in async mode it can be ignored.
+        """
+        future: Future = Future()
+        with self._cond:
+            self._ensure_started()
+            self._seq += 1
+            self._queue.append((self._seq, conversation_id, role, content, token_count, future))
+            self._last_write[conversation_id] = future
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+            elif len(self._queue) == 1:
+                # Wake the flusher so it starts the interval timer for this batch
+                self._cond.notify()
+        return future
+
+    def wait_for(self, conversation_id: str) -> Future:
+        """
+        Return a future that resolves when every queued write for the
+        conversation is committed, flushing early if any are still pending.
+        """
+        with self._cond:
+            future = self._last_write.get(conversation_id)
+            if future is None or future.done():
+                done: Future = Future()
+                done.set_result(None)
+                return done
+            self._flush_requested = True
+            self._cond.notify()
+            return future
+
+    def pending(self) -> int:
+        """Number of writes waiting to be flushed"""
+        with self._cond:
+            return len(self._queue)
+
+    def flush(self, timeout: Optional[float] = None):
+        """Commit everything queued so far and wait for it"""
+        with self._cond:
+            if not self._queue:
+                return
+            future = self._queue[-1][-1]
+            self._flush_requested = True
+            self._cond.notify()
+        future.result(timeout=timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Flush remaining writes and stop the background flusher"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+        with self._cond:
+            self._thread = None
+            self._stopping = False
+        # Anything enqueued after the flusher exited is written inline
+        self._write_batch(self._take_batch(len(self._queue)))
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _take_batch(self, limit: int) -> List[PendingWrite]:
+        with self._cond:
+            batch = [self._queue.popleft() for _ in range(min(limit, len(self._queue)))]
+            if not self._queue:
+                self._flush_requested = False
+            return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue and self._stopping:
+                    return
+                # Wait for the batch to fill up, the interval to pass, or an explicit flush
+                deadline = monotonic() + self.flush_interval
+                while (
+                    len(self._queue) < self.batch_size
+                    and not self._flush_requested
+                    and not self._stopping
+                ):
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self._write_batch(self._take_batch(self.batch_size))
+
+    def _write_batch(self, batch: List[PendingWrite]):
+        """Write one batch in a single transaction and resolve its futures"""
+        if not batch:
+            return
+        conversation_ids = list(dict.fromkeys(item[1] for item in batch))
+        try:
+            with DB_QUERY_SECONDS.labels("write_batch").time(), self.get_writer() as conn:
+                write_messages(conn, [(cid, role, content, tokens) for _, cid, role, content, tokens, _ in batch])
+        except Exception as e:
+            logger.error(f"Error writing batch of {len(batch)} messages: {e}")
+            for *_, future in batch:
+                future.set_exception(e)
+        else:
+            for *_, future in batch:
+                future.set_result(None)
+        finally:
+            with self._cond:
+                for cid in conversation_ids:
+                    last = self._last_write.get(cid)
+                    if last is not None and last.done():
+                        del self._last_write[cid]
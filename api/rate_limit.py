@@ -0,0 +1,519 @@
+"""
+Constant-memory rate limiting.
+
+Uses a sliding-window counter: each client keeps only the request count of
+the current fixed window and of the previous one. The previous count is
+weighted by how much of it still overlaps the sliding window, which closely
+approximates a true sliding log at O(1) time and memory per client.
+
+Backends (RATE_LIMIT_BACKEND) share that algorithm and differ in where the
+counters live:
+
+  memory  this process only. Clients are kept in an OrderedDict ordered by
+          last activity, so evicting idle clients only touches the entries
+          being removed; a background sweeper runs the eviction periodically.
+          With several workers each one enforces the limit separately.
+  shm     a fixed-size table in a memory-mapped file (in /dev/shm by default)
+          shared by every worker on the host, updated under byte-range locks.
+  sqlite  a table in its own SQLite file, one atomic upsert per check.
+  redis   a Redis (or Redis-compatible) server shared across hosts; needs the
+          `redis` package.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import monotonic, time
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; only the shm backend needs it
+    fcntl = None
+
+try:
+    import redis
+except ImportError:  # optional dependency; only the redis backend needs it
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory, shm, sqlite or redis
+RATE_LIMIT_SWEEP_INTERVAL = float(os.getenv("RATE_LIMIT_SWEEP_INTERVAL", "60"))  # seconds
+RATE_LIMIT_SHM_PATH = os.getenv(
+    "RATE_LIMIT_SHM_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "coach-rate-limit"),
+)
+RATE_LIMIT_SHM_SLOTS = int(os.getenv("RATE_LIMIT_SHM_SLOTS", "131072"))  # clients tracked at once (24 bytes each)
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "rate_limits.db")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+
+
+def seconds_until_allowed(start: float, current: int, previous: int, limit: int, window: float, now: float) -> float:
+    """Retry-after for a client whose current window began at `start`"""
+    if now - start >= window:
+        return 0.0
+    if current >= limit:
+        return start + window - now
+    if previous == 0:
+        return 0.0
+    # Solve previous * (1 - t / window) + current < limit for t
+    needed = 1.0 - (limit - current) / previous
+    return max(0.0, start + needed * window - now)
+
+
+class RateLimiter(ABC):
+    """
+    Allow at most `limit` requests per `window` seconds for each key.
+
+    Usage:
+        limiter = create_rate_limiter(limit=60, window=60)
+        if not limiter.allow(client_ip):
+            ...reject with 429...
+    """
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = float(window)
+        self.rejections = 0  # in this process
+
+    @abstractmethod
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        """Record a request for `key` and return whether it is within the limit"""
+
+    @abstractmethod
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        """Seconds until `key` can make another request (0 if it can now)"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Clients currently tracked"""
+
+    def close(self):
+        """Release background threads, files and connections"""
+
+
+class SlidingWindowRateLimiter(RateLimiter):
+    """In-process limiter (the `memory` backend)"""
+
+    def __init__(self, limit: int, window: float, sweep_interval: float = RATE_LIMIT_SWEEP_INTERVAL):
+        super().__init__(limit, window)
+        self.sweep_interval = sweep_interval
+        # key -> [current window start, current count, previous count]
+        self._clients: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = monotonic()
+        window = self.window
+        with self._lock:
+            if self._sweeper is None and self.sweep_interval > 0:
+                self._start_sweeper()
+            state = self._clients.get(key)
+            if state is None:
+                state = [now - now % window, 0, 0]
+                self._clients[key] = state
+            else:
+                self._clients.move_to_end(key)
+                elapsed_windows = int((now - state[0]) // window)
+                if elapsed_windows:
+                    # Roll forward: the current window becomes the previous one,
+                    # or both reset after more than one idle window
+                    state[2] = state[1] if elapsed_windows == 1 else 0
+                    state[1] = 0
+                    state[0] += elapsed_windows * window
+            overlap = 1.0 - (now - state[0]) / window
+            if state[2] * overlap + state[1] >= self.limit:
+                self.rejections += 1
+                return False
+            state[1] += 1
+            return True
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        if now is None:
+            now = monotonic()
+        with self._lock:
+            state = self._clients.get(key)
+            if state is None:
+                return 0.0
+            return seconds_until_allowed(*state, self.limit, self.window, now)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Evict clients idle for more than two windows; returns the number evicted"""
+        if now is None:
+            now = monotonic()
+        cutoff = now - 2 * self.window
+        evicted = 0
+        with self._lock:
+            while self._clients:
+                key, state = next(iter(self._clients.items()))
+                if state[0] >= cutoff:
+                    break
+                del self._clients[key]
+                evicted += 1
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def close(self):
+        """Stop the background sweeper"""
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+        self._stop.clear()
+
+    def _start_sweeper(self):
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="rate-limit-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            evicted = self.sweep()
+            if evicted:
+                logger.debug(f"Evicted {evicted} idle rate-limit clients")
+
+
+class SharedMemoryRateLimiter(RateLimiter):
+    """
+    Counters in a memory-mapped file shared by every worker process on the host.
+
+    The file holds a fixed table of RATE_LIMIT_SHM_SLOTS 24-byte slots (key
+    hash, window number, current count, previous count) grouped in buckets of
+    eight; a key lives in the bucket its hash selects. Slots idle for two
+    windows are reused, and when a bucket is full the client that has been
+    quiet longest is evicted (it starts again with a fresh count). A check
+    holds a per-bucket-stripe thread lock and the matching byte-range lock on
+    the file, so concurrent checks on one key never lose an update.
+
+    Workers opening the file with a different window or table size replace it
+    with a new one; processes still using the old one keep their mapping.
+    """
+
+    MAGIC = b"coachrl1"
+    HEADER = struct.Struct("<8sId")  # magic, slots, window
+    HEADER_SIZE = 64
+    SLOT = struct.Struct("<QqII")  # key hash (0 = free), window number, current, previous
+    BUCKET_SLOTS = 8
+    LOCK_STRIPES = 256
+    INIT_LOCK = LOCK_STRIPES  # byte locked while the file is created or checked
+
+    def __init__(
+        self,
+        limit: int,
+        window: float,
+        path: str = RATE_LIMIT_SHM_PATH,
+        slots: int = RATE_LIMIT_SHM_SLOTS,
+    ):
+        if fcntl is None:
+            raise RuntimeError("The shm rate limit backend needs POSIX file locks (fcntl)")
+        super().__init__(limit, window)
+        self.path = path
+        self._buckets = max(1, slots // self.BUCKET_SLOTS)
+        self.slots = self._buckets * self.BUCKET_SLOTS
+        self._size = self.HEADER_SIZE + self.slots * self.SLOT.size
+        self._fd = self._open()
+        self._map = mmap.mmap(self._fd, self._size)
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.evictions = 0  # in this process
+
+    def _open(self) -> int:
+        header = self.HEADER.pack(self.MAGIC, self.slots, self.window)
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, self.INIT_LOCK)
+            try:
+                try:
+                    replaced = os.fstat(fd).st_ino != os.stat(self.path).st_ino
+                except FileNotFoundError:
+                    replaced = True
+                if not replaced:
+                    existing = os.pread(fd, self.HEADER.size, 0)
+                    if existing == header and os.fstat(fd).st_size == self._size:
+                        return fd
+                    if os.fstat(fd).st_size == 0:
+                        os.ftruncate(fd, self._size)
+                        os.pwrite(fd, header, 0)
+                        return fd
+                    # Created with other settings: unlink it and start a new
+                    # file, since workers still on the old one may map it
+                    logger.warning(f"Replacing rate limit table {self.path} (window or size changed)")
+                    os.unlink(self.path)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, self.INIT_LOCK)
+            # Another worker replaced the file first, or this one just did
+            os.close(fd)
+
+    def _hash(self, key: str) -> int:
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+        return digest or 1
+
+    def _slot(self, bucket: int, digest: int, number: int) -> int:
+        """Offset of `digest`'s slot in `bucket`, claiming a free or the stalest one if absent"""
+        base = self.HEADER_SIZE + bucket * self.BUCKET_SLOTS * self.SLOT.size
+        free = stalest = None
+        stalest_number = None
+        for offset in range(base, base + self.BUCKET_SLOTS * self.SLOT.size, self.SLOT.size):
+            held, last, _, _ = self.SLOT.unpack_from(self._map, offset)
+            if held == digest:
+                return offset
+            if free is None and (held == 0 or last < number - 1):
+                free = offset
+            if stalest_number is None or last < stalest_number:
+                stalest, stalest_number = offset, last
+        if free is not None:
+            return free
+        self.evictions += 1
+        return stalest
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = monotonic()
+        position = now / self.window
+        number = int(position)
+        digest = self._hash(key)
+        bucket = digest % self._buckets
+        stripe = bucket % self.LOCK_STRIPES
+        with self._locks[stripe]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                offset = self._slot(bucket, digest, number)
+                held, last, current, previous = self.SLOT.unpack_from(self._map, offset)
+                if held != digest:
+                    current = previous = 0
+                elif last != number:
+                    previous = current if last == number - 1 else 0
+                    current = 0
+                allowed = previous * (1.0 - (position - number)) + current < self.limit
+                if allowed:
+                    current += 1
+                self.SLOT.pack_into(self._map, offset, digest, number, current, previous)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+        if not allowed:
+            self.rejections += 1
+        return allowed
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        if now is None:
+            now = monotonic()
+        number = int(now / self.window)
+        digest = self._hash(key)
+        base = self.HEADER_SIZE + digest % self._buckets * self.BUCKET_SLOTS * self.SLOT.size
+        for offset in range(base, base + self.BUCKET_SLOTS * self.SLOT.size, self.SLOT.size):
+            held, last, current, previous = self.SLOT.unpack_from(self._map, offset)
+            if held == digest:
+                if last != number:
+                    previous = current if last == number - 1 else 0
+                    current = 0
+                return seconds_until_allowed(number * self.window, current, previous, self.limit, self.window, now)
+        return 0.0
+
+    def __len__(self) -> int:
+        number = int(monotonic() / self.window)
+        return sum(
+            1 for held, last, _, _ in self.SLOT.iter_unpack(self._map[self.HEADER_SIZE:self._size])
+            if held and last >= number - 1
+        )
+
+    def close(self):
+        if self._fd >= 0:
+            self._map.close()
+            os.close(self._fd)
+            self._fd = -1
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """
+    Counters in a SQLite table, so every process using the file shares them.
+
+    Each check is one upsert that rolls the client's windows forward, decides
+    and increments in a single statement, so it is atomic without an explicit
+    transaction. Rows idle for two windows are deleted every
+    RATE_LIMIT_SWEEP_INTERVAL seconds by whichever process checks next.
+    """
+
+    UPSERT = """
+        INSERT INTO rate_limits (key, window_number, current, previous, allowed)
+        VALUES (:key, :number, 1, 0, 1)
+        ON CONFLICT (key) DO UPDATE SET
+            window_number = :number,
+            previous = {previous},
+            current = {current} + ({allowed}),
+            allowed = {allowed}
+        RETURNING allowed
+    """.format(
+        previous="CASE :number - window_number WHEN 0 THEN previous WHEN 1 THEN current ELSE 0 END",
+        current="CASE window_number WHEN :number THEN current ELSE 0 END",
+        allowed="CASE :number - window_number WHEN 0 THEN previous WHEN 1 THEN current ELSE 0 END * :overlap"
+                " + CASE window_number WHEN :number THEN current ELSE 0 END < :limit",
+    )
+
+    def __init__(
+        self,
+        limit: int,
+        window: float,
+        path: str = RATE_LIMIT_DB_PATH,
+        sweep_interval: float = RATE_LIMIT_SWEEP_INTERVAL,
+    ):
+        super().__init__(limit, window)
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = OFF")  # counters are not worth an fsync
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                window_number INTEGER NOT NULL,
+                current INTEGER NOT NULL,
+                previous INTEGER NOT NULL,
+                allowed INTEGER NOT NULL  -- outcome of the last check, read back by RETURNING
+            ) WITHOUT ROWID
+        """)
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time()
+        position = now / self.window
+        number = int(position)
+        params = {"key": key, "number": number, "overlap": 1.0 - (position - number), "limit": self.limit}
+        with self._lock:
+            if self.sweep_interval > 0 and now >= self._next_sweep:
+                self._next_sweep = now + self.sweep_interval
+                self._conn.execute("DELETE FROM rate_limits WHERE window_number < ?", (number - 1,))
+            allowed = bool(self._conn.execute(self.UPSERT, params).fetchone()[0])
+        if not allowed:
+            self.rejections += 1
+        return allowed
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        if now is None:
+            now = time()
+        number = int(now / self.window)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT window_number, current, previous FROM rate_limits WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return 0.0
+        last, current, previous = row
+        if last != number:
+            previous = current if last == number - 1 else 0
+            current = 0
+        return seconds_until_allowed(number * self.window, current, previous, self.limit, self.window, now)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT count(*) FROM rate_limits WHERE window_number >= ?", (int(time() / self.window) - 1,)
+            ).fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Counters in Redis, shared by every process and host using the server.
+
+    Each client is a hash updated by a Lua script, so the check is atomic on
+    the server and costs one round trip; keys expire after two idle windows.
+    Works with any server that runs Lua scripts (Redis, Valkey, KeyDB, or
+    fakeredis in-process). If the server is unreachable requests are allowed
+    and a warning is logged.
+    """
+
+    KEY_PREFIX = "ratelimit:"
+    SCRIPT = """
+        local number, overlap, limit = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'n', 'c', 'p')
+        local last = tonumber(state[1])
+        local current, previous = 0, 0
+        if last == number then
+            current, previous = tonumber(state[2]), tonumber(state[3])
+        elseif last == number - 1 then
+            previous = tonumber(state[2])
+        end
+        local allowed = 0
+        if previous * overlap + current < limit then
+            allowed = 1
+            current = current + 1
+        end
+        redis.call('HSET', KEYS[1], 'n', number, 'c', current, 'p', previous)
+        redis.call('PEXPIRE', KEYS[1], ARGV[4])
+        return allowed
+    """
+
+    def __init__(self, limit: int, window: float, url: str = RATE_LIMIT_REDIS_URL, client=None):
+        super().__init__(limit, window)
+        if client is None:
+            if redis is None:
+                raise RuntimeError("The redis rate limit backend needs the redis package (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._script = client.register_script(self.SCRIPT)
+        self._ttl_ms = int(2 * self.window * 1000)
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time()
+        position = now / self.window
+        number = int(position)
+        try:
+            allowed = bool(self._script(
+                keys=[self.KEY_PREFIX + key],
+                args=[number, repr(1.0 - (position - number)), self.limit, self._ttl_ms],
+            ))
+        except Exception as e:  # redis.RedisError, but the package may be a stand-in
+            logger.warning(f"Rate limit check skipped, Redis unavailable: {e}")
+            return True
+        if not allowed:
+            self.rejections += 1
+        return allowed
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        if now is None:
+            now = time()
+        number = int(now / self.window)
+        last, current, previous = self._client.hmget(self.KEY_PREFIX + key, "n", "c", "p")
+        if last is None:
+            return 0.0
+        last, current, previous = int(last), int(current), int(previous)
+        if last != number:
+            previous = current if last == number - 1 else 0
+            current = 0
+        return seconds_until_allowed(number * self.window, current, previous, self.limit, self.window, now)
+
+    def __len__(self) -> int:
+        # A scan of the key space: meant for metrics scrapes, not request paths
+        return sum(1 for _ in self._client.scan_iter(match=self.KEY_PREFIX + "*", count=1000))
+
+    def close(self):
+        self._client.close()
+
+
+def create_rate_limiter(limit: int, window: float, backend: str = RATE_LIMIT_BACKEND) -> RateLimiter:
+    """The limiter for `backend` (RATE_LIMIT_BACKEND by default), configured from the environment"""
+    if backend == "memory":
+        return SlidingWindowRateLimiter(limit, window)
+    if backend == "shm":
+        return SharedMemoryRateLimiter(limit, window)
+    if backend == "sqlite":
+        return SQLiteRateLimiter(limit, window)
+    if backend == "redis":
+        return RedisRateLimiter(limit, window)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND {backend!r} (expected memory, shm, sqlite or redis)")
@@ -0,0 +1,178 @@
+"""
+Response cache for non-streaming completions (used by /api/webhook).
+
+Integrations often resend identical prompts: Slack retries, repeated `/coach`
+help questions, health-style pings. Responses are cached under a hash of the
+normalized model, system prompt, history and user message, with a TTL, LRU
+eviction and entry/byte caps.
+
+Concurrent identical requests are coalesced ("single flight"): the first one
+calls upstream and the others await the same result instead of paying for
+their own call.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+WEBHOOK_CACHE_ENABLED = os.getenv("WEBHOOK_CACHE_ENABLED", "false").lower() == "true"
+WEBHOOK_CACHE_TTL = float(os.getenv("WEBHOOK_CACHE_TTL", "300"))  # seconds
+WEBHOOK_CACHE_MAX_ENTRIES = int(os.getenv("WEBHOOK_CACHE_MAX_ENTRIES", "1024"))
+WEBHOOK_CACHE_MAX_BYTES = int(os.getenv("WEBHOOK_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Cache statuses reported in the X-Cache response header
+HIT = "HIT"  # served from the cache
+MISS = "MISS"  # computed by this request
+COALESCED = "COALESCED"  # shared an identical in-flight upstream call
+DUPLICATE = "DUPLICATE"  # shared an in-flight call made for the same owner (a retry)
+BYPASS = "BYPASS"  # cache skipped on request
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Collapse whitespace so trivially different prompts share a key"""
+    return _whitespace.sub(" ", text).strip()
+
+
+def cache_key(model: str, messages: List[dict]) -> str:
+    """Deterministic key for a completion request"""
+    payload = [model] + [[m["role"], normalize(m["content"])] for m in messages]
+    encoded = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """TTL + LRU cache of completion text with single-flight deduplication"""
+
+    def __init__(
+        self,
+        enabled: bool = WEBHOOK_CACHE_ENABLED,
+        ttl: float = WEBHOOK_CACHE_TTL,
+        max_entries: int = WEBHOOK_CACHE_MAX_ENTRIES,
+        max_bytes: int = WEBHOOK_CACHE_MAX_BYTES,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (response text, expires at)
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        # key -> (future shared by identical requests, owner of the leading request)
+        self._in_flight: Dict[str, Tuple[asyncio.Future, Optional[str]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[str]],
+        owner: Optional[str] = None,
+        read: bool = True,
+        store: bool = True,
+    ) -> Tuple[str, str]:
+        """
+        Return (response, status), calling `compute()` only when needed.
+
+        `owner` identifies who asked (e.g. the conversation id) so callers can
+        tell a retry of an in-flight request (DUPLICATE) apart from another
+        caller that happened to ask the same thing (COALESCED). `read=False`
+        skips the lookup and `store=False` skips storing the result.
+        """
+        if not self.enabled:
+            return await compute(), BYPASS
+        while read:
+            cached = self._lookup(key)
+            if cached is not None:
+                self.hits += 1
+                return cached, HIT
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            future, leader = in_flight
+            # Unlike awaiting the future, wait() neither cancels it when this
+            # request is cancelled nor raises when the leading request was
+            await asyncio.wait((future,))
+            if future.cancelled():
+                continue  # the leader went away: follow a new one, or lead
+            self.coalesced += 1
+            return future.result(), DUPLICATE if owner is not None and owner == leader else COALESCED
+        self.misses += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (future, owner)
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved in case no follower is waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            if store:
+                self._store(key, result)
+            return result, MISS if read else BYPASS
+        finally:
+            if self._in_flight.get(key, (None,))[0] is future:
+                del self._in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] < monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _store(self, key: str, value: str):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, monotonic() + self.ttl)
+        self._bytes += len(value)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+
+def bypass_flags(cache_control: Optional[str], bypass_header: Optional[str]) -> Tuple[bool, bool]:
+    """
+    Translate request headers into (read, store) flags.
+
+    `Cache-Control: no-cache` (or `X-Cache-Bypass: 1`) forces a fresh upstream
+    call; `Cache-Control: no-store` also keeps the result out of the cache.
+    """
+    directives = {d.strip().lower() for d in (cache_control or "").split(",")}
+    bypass = (bypass_header or "").strip().lower() in ("1", "true", "yes")
+    read = not bypass and "no-cache" not in directives and "no-store" not in directives
+    store = "no-store" not in directives
+    return read, store
@@ -0,0 +1,259 @@
+"""
+Full-text search over message content with SQLite FTS5.
+
+`messages_fts` is an external-content FTS5 table: it stores only the index and
+reads text from `messages`, so the content is not duplicated. Triggers on
+`messages` keep it in step with every insert, update and delete, including
+cascading deletes, archiving (archived conversations drop out of the index)
+and rehydration (they come back). Schema version 4 creates it and indexes the
+existing rows; `--rebuild` re-indexes everything, e.g. after restoring a copy
+made without the triggers, and `--check` verifies index and table agree.
+
+Queries are plain words by default: every word must appear (in any order,
+after Porter stemming, ignoring case and diacritics) and a trailing `*` makes
+a word a prefix. `raw=True` passes FTS5 query syntax through, applied to the
+message content.
+
+Usage (from the repository root):
+    python -m api.search --db conversations.db --query "trouble sleeping"
+    python -m api.search --db conversations.db --rebuild
+    python -m api.search --db conversations.db --check
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import time
+from typing import List, Optional
+
+SEARCH_PAGE_MAX = int(os.getenv("SEARCH_PAGE_MAX", "50"))  # results per page
+SEARCH_MAX_OFFSET = int(os.getenv("SEARCH_MAX_OFFSET", "1000"))  # deepest page reachable by offset
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "10000"))  # newest matches ranked by relevance
+SEARCH_SNIPPET_TOKENS = int(os.getenv("SEARCH_SNIPPET_TOKENS", "16"))  # tokens of context per snippet
+
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+ELLIPSIS = "…"
+REBUILD_CHUNK = 1000  # rows indexed per statement; one huge statement leaves later inserts slower
+
+
+class SearchQueryError(ValueError):
+    """Raised for a query FTS5 cannot parse (or one with no searchable words)"""
+
+
+def create_index(conn: sqlite3.Connection):
+    """Index table and the triggers that maintain it (empty until `rebuild`)"""
+    # conversation_id is indexed so a per-conversation search intersects two
+    # doclists instead of checking each of the conversation's rows; it carries
+    # no weight in the ranking
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content,
+            conversation_id,
+            content = 'messages',
+            content_rowid = 'id',
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content, conversation_id)
+            VALUES (new.id, new.content, new.conversation_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, conversation_id)
+            VALUES ('delete', old.id, old.content, old.conversation_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, conversation_id ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, conversation_id)
+            VALUES ('delete', old.id, old.content, old.conversation_id);
+            INSERT INTO messages_fts (rowid, content, conversation_id)
+            VALUES (new.id, new.content, new.conversation_id);
+        END
+    """)
+
+
+def rebuild(conn: sqlite3.Connection):
+    """Re-index every message from scratch"""
+    create_index(conn)
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('delete-all')")
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+    for start in range(0, last_id, REBUILD_CHUNK):
+        conn.execute(
+            "INSERT INTO messages_fts (rowid, content, conversation_id) "
+            "SELECT id, content, conversation_id FROM messages WHERE id > ? AND id <= ?",
+            (start, start + REBUILD_CHUNK),
+        )
+
+
+def optimize(conn: sqlite3.Connection):
+    """Merge the index's b-trees into one (faster queries after bulk loads)"""
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+
+
+def check(conn: sqlite3.Connection) -> bool:
+    """True when the index matches the messages table"""
+    try:
+        conn.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('integrity-check', 1)")
+    except sqlite3.DatabaseError:
+        return False
+    return True
+
+
+def _phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def fts_query(text: str) -> str:
+    """Plain words as an FTS5 query: each word quoted (so punctuation is literal), all required"""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        # Only word characters are indexed; a term of pure punctuation matches nothing
+        if not re.search(r"\w", word):
+            continue
+        terms.append(_phrase(word) + ("*" if prefix else ""))
+    if not terms:
+        raise SearchQueryError("Query has no searchable words")
+    return " ".join(terms)
+
+
+def search(
+    conn: sqlite3.Connection,
+    query: str,
+    conversation_id: Optional[str] = None,
+    role: Optional[str] = None,
+    sort: str = "relevance",
+    limit: int = SEARCH_PAGE_MAX,
+    offset: int = 0,
+    raw: bool = False,
+) -> List[dict]:
+    """
+    Up to `limit` matching messages with highlighted snippets, best match first
+    (BM25) or, with sort="recent", newest first. Ask for one row more than
+    the page size to learn whether another page exists.
+
+    Relevance ranks only the newest SEARCH_RANK_WINDOW matches: scoring every
+    message that contains a very common word would grow with the table. Recent
+    results carry no score.
+    """
+    match = f"content : ({query if raw else fts_query(query)})"
+    filters = []
+    params: list = []
+    if conversation_id is not None:
+        if re.search(r"\w", conversation_id):
+            match = f"conversation_id : {_phrase(conversation_id)} AND {match}"
+        filters.append("m.conversation_id = ?")  # the phrase can also match longer ids
+        params.append(conversation_id)
+    if role is not None:
+        filters.append("m.role = ?")
+        params.append(role)
+    where = "".join(f" AND {clause}" for clause in filters)
+    try:
+        if sort == "recent":
+            # FTS5 walks rowids newest first and stops at the limit. No score: BM25
+            # counts every match of each word, which is what this order avoids
+            return [_result(row) for row in conn.execute(
+                f"""
+                SELECT m.id, m.conversation_id, m.role, m.timestamp,
+                       snippet(messages_fts, 0, ?, ?, ?, ?)
+                FROM messages_fts CROSS JOIN messages m ON m.id = messages_fts.rowid
+                WHERE messages_fts MATCH ?{where}
+                ORDER BY messages_fts.rowid DESC LIMIT ? OFFSET ?
+                """,
+                [HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE, ELLIPSIS, SEARCH_SNIPPET_TOKENS, match] + params + [limit, offset],
+            )]
+        ranked = conn.execute(
+            f"""
+            SELECT f.rowid, f.rank
+            FROM (
+                SELECT rowid, rank FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rowid DESC LIMIT ?
+            ) f CROSS JOIN messages m ON m.id = f.rowid
+            WHERE 1{where}
+            ORDER BY f.rank LIMIT ? OFFSET ?
+            """,
+            [match, SEARCH_RANK_WINDOW] + params + [limit, offset],
+        ).fetchall()
+        if not ranked:
+            return []
+        # Snippets for the page only, looked up by rowid (scores come from above:
+        # rank here would be recomputed per lookup)
+        rows = conn.execute(
+            f"""
+            SELECT m.id, m.conversation_id, m.role, m.timestamp, snippet(messages_fts, 0, ?, ?, ?, ?)
+            FROM messages_fts CROSS JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ? AND messages_fts.rowid IN ({", ".join("?" * len(ranked))})
+            """,
+            [HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE, ELLIPSIS, SEARCH_SNIPPET_TOKENS, match] + [row[0] for row in ranked],
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        # A raw query can fail in more ways than the syntax check (e.g. a
+        # `column:` filter naming no column), all of them the caller's
+        if raw or "fts5" in str(e) or "syntax error" in str(e):
+            raise SearchQueryError(f"Invalid search query: {e}") from None
+        raise
+    by_id = {row[0]: row for row in rows}
+    return [_result(by_id[message_id], rank) for message_id, rank in ranked if message_id in by_id]
+
+
+def _result(row, rank: Optional[float] = None) -> dict:
+    return {
+        "message_id": row[0],
+        "conversation_id": row[1],
+        "role": row[2],
+        "timestamp": row[3],
+        "snippet": row[4],
+        "score": -rank if rank is not None else None,  # BM25 is negative; higher is better here
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "conversations.db"))
+    parser.add_argument("--query", help="Search and print the first page of results")
+    parser.add_argument("--sort", choices=["relevance", "recent"], default="relevance")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index every message (locks writes while it runs)")
+    parser.add_argument("--optimize", action="store_true", help="Merge the index into a single b-tree")
+    parser.add_argument("--check", action="store_true", help="Verify the index matches the messages table")
+    args = parser.parse_args()
+
+    from api.migrations import migrate
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        migrate(conn)
+        for flag, action in (("rebuild", rebuild), ("optimize", optimize)):
+            if getattr(args, flag):
+                began = time.perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                action(conn)
+                conn.execute("COMMIT")
+                print(f"{flag.capitalize()} finished in {time.perf_counter() - began:.1f} s")
+        if args.check:
+            ok = check(conn)
+            print("Index consistent" if ok else "Index does not match messages; run --rebuild")
+            if not ok:
+                raise SystemExit(1)
+        if args.query:
+            began = time.perf_counter()
+            results = search(conn, args.query, sort=args.sort)
+            print(f"{len(results)} results in {(time.perf_counter() - began) * 1000:.1f} ms")
+            for result in results:
+                score = f"{result['score']:7.3f}" if result["score"] is not None else result["timestamp"]
+                print(f"  [{score}] {result['conversation_id']} #{result['message_id']} "
+                      f"{result['role']}: {result['snippet']}")
+    except SearchQueryError as e:
+        raise SystemExit(str(e))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
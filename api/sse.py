@@ -0,0 +1,154 @@
+"""
+Server-Sent Events framing for the /api/chat stream.
+
+SSE_FRAMING picks how upstream deltas become events:
+
+  token      one event per upstream delta, each a JSON object that repeats the
+             conversation_id (the original wire format)
+  coalesced  a leading `meta` event carries the conversation_id once, then
+             deltas are joined into events flushed every SSE_FLUSH_INTERVAL_MS
+             or once SSE_FLUSH_BYTES are buffered. The first delta goes out at
+             once, so time to first token is unchanged. Events carry an `id:`
+             (their sequence number).
+
+Either way every `data:` line is a JSON object with `content`, `done` or
+`error`, so existing clients keep working. A client that asks for the compact
+format (`format=compact`) gets coalesced events whose data is the raw text
+instead: one `data:` line per line of text, which SSE parsers join with
+newlines. Its `meta`, `done` and `error` events are named and stay JSON.
+"""
+
+import asyncio
+import json
+import os
+from typing import AsyncIterator, List, Optional
+
+SSE_FRAMING = os.getenv("SSE_FRAMING", "coalesced")  # token or coalesced
+SSE_FLUSH_INTERVAL_MS = float(os.getenv("SSE_FLUSH_INTERVAL_MS", "25"))  # longest a delta waits for company
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "512"))  # buffered text that forces a flush
+
+
+async def coalesce(
+    deltas: AsyncIterator[str],
+    interval: float = SSE_FLUSH_INTERVAL_MS / 1000,
+    max_bytes: int = SSE_FLUSH_BYTES,
+) -> AsyncIterator[str]:
+    """
+    Join `deltas` into pieces, each flushed `interval` seconds after its first
+    delta arrived or once it holds `max_bytes`. The first piece goes out as
+    soon as there is one. Buffered text is flushed before an error from
+    `deltas` is re-raised.
+
+    A task reads `deltas` into a buffer, so a delta costs an append; this
+    generator wakes once per piece rather than once per delta.
+    """
+    loop = asyncio.get_running_loop()
+    buffer: List[str] = []
+    size = 0
+    since = 0.0  # when the oldest buffered delta arrived
+    finished = False
+    error: Optional[Exception] = None
+    wake: Optional[asyncio.Future] = None
+
+    def notify():
+        if wake is not None and not wake.done():
+            wake.set_result(None)
+
+    async def read():
+        nonlocal size, since, finished, error
+        try:
+            async for delta in deltas:
+                if not buffer:
+                    since = loop.time()
+                    notify()
+                buffer.append(delta)
+                size += len(delta)
+                if size >= max_bytes:
+                    notify()
+        except Exception as e:
+            error = e
+        finally:
+            finished = True
+            notify()
+
+    reader = asyncio.ensure_future(read())
+    first = True
+    try:
+        while True:
+            if not buffer and not finished:
+                wake = loop.create_future()
+                await wake
+            if buffer and not first and not finished and size < max_bytes:
+                delay = since + interval - loop.time()
+                if delay > 0:
+                    wake = loop.create_future()
+                    await asyncio.wait((wake,), timeout=delay)
+            if buffer:
+                piece = "".join(buffer)
+                buffer.clear()
+                size = 0
+                first = False
+                yield piece
+            elif finished:
+                break
+        if error is not None:
+            raise error
+    finally:
+        reader.cancel()
+
+
+class EventStream:
+    """
+    Formats one chat response as SSE events.
+
+    Usage:
+        events = EventStream(conversation_id, compact=False)
+        opening = events.start()  # None in token framing
+        async for piece in events.pieces(deltas):
+            yield events.content(piece)
+        yield events.done()
+    """
+
+    def __init__(self, conversation_id: str, framing: str = SSE_FRAMING, compact: bool = False):
+        self.conversation_id = conversation_id
+        self.compact = compact
+        self.coalesced = compact or framing == "coalesced"
+        self._last_id = 0
+
+    def _event(self, data: str, event: Optional[str] = None) -> str:
+        self._last_id += 1
+        head = f"event: {event}\nid: {self._last_id}\n" if event else f"id: {self._last_id}\n"
+        return f"{head}{data}\n\n"
+
+    @staticmethod
+    def _json(payload: dict) -> str:
+        return "data: " + json.dumps(payload, separators=(",", ":"))
+
+    def start(self) -> Optional[str]:
+        """Leading event naming the conversation (coalesced framing only)"""
+        if not self.coalesced:
+            return None
+        return self._event(self._json({"conversation_id": self.conversation_id}), "meta")
+
+    def pieces(self, deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+        """The text of each content event"""
+        return coalesce(deltas) if self.coalesced else deltas
+
+    def content(self, text: str) -> str:
+        if not self.coalesced:
+            return f"data: {json.dumps({'content': text, 'conversation_id': self.conversation_id})}\n\n"
+        if self.compact:
+            lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+            return self._event("\n".join("data: " + line for line in lines))
+        return self._event(self._json({"content": text}))
+
+    def done(self) -> str:
+        return self._final({"done": True, "conversation_id": self.conversation_id}, "done")
+
+    def error(self, message: str) -> str:
+        return self._final({"error": message, "conversation_id": self.conversation_id}, "error")
+
+    def _final(self, payload: dict, event: str) -> str:
+        if not self.coalesced:
+            return f"data: {json.dumps(payload)}\n\n"
+        return self._event(self._json(payload), event if self.compact else None)
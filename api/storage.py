@@ -0,0 +1,360 @@
+"""
+Async conversation storage.
+
+Request handlers talk to a `Storage` backend through typed async operations
+instead of running SQL inline. `SQLiteStorage` runs every blocking sqlite3
+call on a small dedicated thread pool, so slow disk I/O never stalls the event
+loop (and with it every other in-flight SSE stream). It composes the pooled
+connections, the write-behind queue and the hot-conversation cache, and
+rehydrates archived conversations before reading them.
+
+Other backends can be plugged in by implementing `Storage`.
+"""
+
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import AsyncIterator, List, Optional, Tuple
+
+from api.bulk import EXPORT_CHUNK_SIZE, ExportCursor, export_chunk, write_import_batch
+from api.context import ContextWindow, count_tokens, load_context, pending_summary_rows, save_summary
+from api.db import DB_POOL_SIZE, ConnectionPool
+from api.history_cache import HistoryCache
+from api.maintenance import ensure_hot
+from api.metrics import DB_QUERY_SECONDS
+from api.persistence import WriteBehindQueue, write_messages
+
+logger = logging.getLogger(__name__)
+
+DB_EXECUTOR_THREADS = int(os.getenv("DB_EXECUTOR_THREADS", str(DB_POOL_SIZE + 1)))
+CONVERSATION_STREAM_CHUNK = int(os.getenv("CONVERSATION_STREAM_CHUNK", "500"))  # rows per streamed read
+
+
+@dataclass
+class StoredMessage:
+    role: str
+    content: str
+    timestamp: Optional[str] = None
+    id: Optional[int] = None
+
+
+@dataclass
+class Conversation:
+    conversation_id: str
+    created_at: str
+    updated_at: str
+    messages: List[StoredMessage] = field(default_factory=list)
+    has_more: bool = False  # more messages beyond the requested page
+
+
+def _timed(func, *args):
+    """Run a database function, recording its duration under its name"""
+    with DB_QUERY_SECONDS.labels(getattr(func, "__name__", "other").lstrip("_")).time():
+        return func(*args)
+
+
+def _page_rows(conn, conversation_id: str, after_id: Optional[int], before_id: Optional[int], limit: Optional[int]):
+    """Messages between the keyset bounds in id order, read straight off the (conversation_id, id) index"""
+    clauses = ["conversation_id = ?"]
+    params: list = [conversation_id]
+    if after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    if before_id is not None:
+        clauses.append("id < ?")
+        params.append(before_id)
+    # Paging backwards from before_id reads the index in reverse, then restores id order
+    backwards = before_id is not None and after_id is None and limit is not None
+    sql = (
+        f"SELECT id, role, content, timestamp FROM messages WHERE {' AND '.join(clauses)} "
+        f"ORDER BY id {'DESC' if backwards else 'ASC'}"
+    )
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    rows = conn.execute(sql, params).fetchall()
+    if backwards:
+        rows.reverse()
+    return rows
+
+
+def _stored_message(row) -> StoredMessage:
+    return StoredMessage(role=row["role"], content=row["content"], timestamp=row["timestamp"], id=row["id"])
+
+
+class Storage(ABC):
+    """Async interface for conversation persistence"""
+
+    @abstractmethod
+    async def append_message(self, conversation_id: str, role: str, content: str) -> None:
+        """Persist one message, creating the conversation if needed"""
+
+    @abstractmethod
+    async def append_messages(self, messages: List[Tuple[str, str, str]]) -> None:
+        """Persist (conversation_id, role, content) messages in one transaction"""
+
+    @abstractmethod
+    async def load_history(self, conversation_id: str, new: bool = False) -> ContextWindow:
+        """Context window (summary + newest messages within budget) for the next turn"""
+
+    @abstractmethod
+    async def get_conversation(
+        self,
+        conversation_id: str,
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Optional[Conversation]:
+        """
+        Conversation metadata and one page of messages in id order, or None if
+        it does not exist. Without `before_id` the page holds the first `limit`
+        messages after `after_id`; with only `before_id` it holds the last
+        `limit` messages before it. `limit=None` returns every match.
+        """
+
+    @abstractmethod
+    def iter_messages(
+        self,
+        conversation_id: str,
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[List[StoredMessage]]:
+        """Same selection as `get_conversation`, yielded in chunks so memory stays bounded"""
+
+    @abstractmethod
+    async def export_chunk(self, cursor: ExportCursor, limit: int = EXPORT_CHUNK_SIZE) -> List[dict]:
+        """Up to `limit` further bulk-export records; empty (with `cursor.done`) once the export is complete"""
+
+    @abstractmethod
+    async def import_records(self, records: List[dict], preserve_ids: bool = True) -> dict:
+        """Write one batch of bulk-import records in a single transaction"""
+
+    @abstractmethod
+    async def delete_conversation(self, conversation_id: str) -> None:
+        """Delete a conversation, its messages and its summary"""
+
+    @abstractmethod
+    async def pending_summary(self, conversation_id: str) -> Tuple[Optional[str], List[StoredMessage]]:
+        """Current summary and the out-of-window messages waiting to be folded into it"""
+
+    @abstractmethod
+    async def save_summary(self, conversation_id: str, summary: str, through_id: int) -> None:
+        """Store an updated conversation summary"""
+
+    @abstractmethod
+    async def ping(self) -> None:
+        """Raise if the backend is unavailable"""
+
+    async def close(self) -> None:
+        """Flush pending work and release resources"""
+
+
+class SQLiteStorage(Storage):
+    """SQLite backend running all blocking calls on a dedicated executor"""
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        write_queue: Optional[WriteBehindQueue] = None,
+        history_cache: Optional[HistoryCache] = None,
+        threads: int = DB_EXECUTOR_THREADS,
+    ):
+        self.pool = pool
+        self.write_queue = write_queue or WriteBehindQueue(pool.writer)
+        self.history_cache = history_cache or HistoryCache()
+        self.threads = threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def run_blocking(self, func, *args):
+        """Run a blocking function on the database executor"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="db")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(_timed, func, *args))
+
+    async def _wait_for_writes(self, conversation_id: str):
+        """Wait until queued writes for a conversation are committed (read-your-writes)"""
+        await asyncio.wrap_future(self.write_queue.wait_for(conversation_id))
+
+    async def append_message(self, conversation_id: str, role: str, content: str) -> None:
+        tokens = count_tokens(content)
+        future = self.write_queue.enqueue(conversation_id, role, content, tokens)
+        self.history_cache.append(conversation_id, role, content, tokens)
+        # A failed write must not stay visible through the cache
+        future.add_done_callback(lambda f: f.exception() and self.history_cache.invalidate(conversation_id))
+        if self.write_queue.durability == "sync":
+            await asyncio.wrap_future(future)
+
+    async def append_messages(self, messages: List[Tuple[str, str, str]]) -> None:
+        conversation_ids = list(dict.fromkeys(message[0] for message in messages))
+        # Keep ordering with writes still queued for the same conversations
+        for conversation_id in conversation_ids:
+            await self._wait_for_writes(conversation_id)
+        rows = [(cid, role, content, count_tokens(content)) for cid, role, content in messages]
+        await self.run_blocking(self._write_messages, rows)
+        for conversation_id in conversation_ids:
+            self.history_cache.invalidate(conversation_id)
+
+    def _write_messages(self, rows: List[Tuple[str, str, str, int]]):
+        with self.pool.writer() as conn:
+            write_messages(conn, rows)
+
+    async def load_history(self, conversation_id: str, new: bool = False) -> ContextWindow:
+        """Serve hot conversations from the cache; brand-new ones skip the read entirely"""
+        window = self.history_cache.get(conversation_id)
+        if window is not None:
+            return window
+        if new:
+            window = ContextWindow()
+        else:
+            await self._wait_for_writes(conversation_id)
+            window = await self.run_blocking(self._load_history, conversation_id)
+        self.history_cache.put(conversation_id, window)
+        return window
+
+    def _load_history(self, conversation_id: str) -> ContextWindow:
+        ensure_hot(self.pool, conversation_id)
+        with self.pool.reader() as conn:
+            return load_context(conn, conversation_id)
+
+    async def get_conversation(
+        self,
+        conversation_id: str,
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Optional[Conversation]:
+        await self._wait_for_writes(conversation_id)
+        return await self.run_blocking(self._get_conversation, conversation_id, after_id, before_id, limit)
+
+    def _get_conversation(
+        self, conversation_id: str, after_id: Optional[int], before_id: Optional[int], limit: Optional[int]
+    ) -> Optional[Conversation]:
+        if limit != 0:
+            ensure_hot(self.pool, conversation_id)
+        with self.pool.reader() as conn:
+            conv_row = conn.execute(
+                "SELECT created_at, updated_at FROM conversations WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()
+            if not conv_row:
+                return None
+            conversation = Conversation(
+                conversation_id=conversation_id,
+                created_at=conv_row["created_at"],
+                updated_at=conv_row["updated_at"],
+            )
+            if limit == 0:
+                return conversation
+            # One extra row tells whether another page follows
+            rows = _page_rows(conn, conversation_id, after_id, before_id, None if limit is None else limit + 1)
+        if limit is not None and len(rows) > limit:
+            conversation.has_more = True
+            # A backwards page drops its oldest row, a forwards page its newest
+            rows = rows[1:] if before_id is not None and after_id is None else rows[:limit]
+        conversation.messages = [_stored_message(row) for row in rows]
+        return conversation
+
+    async def iter_messages(
+        self,
+        conversation_id: str,
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[List[StoredMessage]]:
+        await self._wait_for_writes(conversation_id)
+        await self.run_blocking(ensure_hot, self.pool, conversation_id)
+        if before_id is not None and after_id is None and limit is not None:
+            # The last `limit` messages before before_id: find where that page starts
+            after_id = await self.run_blocking(self._page_start, conversation_id, before_id, limit)
+        remaining = limit
+        while remaining is None or remaining > 0:
+            chunk_size = CONVERSATION_STREAM_CHUNK if remaining is None else min(remaining, CONVERSATION_STREAM_CHUNK)
+            # Each chunk is its own short keyset query, so a slow client never pins a pooled reader
+            chunk = await self.run_blocking(self._message_chunk, conversation_id, after_id, before_id, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+            after_id = chunk[-1].id
+            if remaining is not None:
+                remaining -= len(chunk)
+            if len(chunk) < chunk_size:
+                break
+
+    def _page_start(self, conversation_id: str, before_id: int, limit: int) -> int:
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                "SELECT MIN(id) FROM (SELECT id FROM messages WHERE conversation_id = ? AND id < ? "
+                "ORDER BY id DESC LIMIT ?)",
+                (conversation_id, before_id, limit),
+            ).fetchone()
+        return (row[0] or before_id) - 1
+
+    def _message_chunk(
+        self, conversation_id: str, after_id: Optional[int], before_id: Optional[int], limit: int
+    ) -> List[StoredMessage]:
+        with self.pool.reader() as conn:
+            rows = _page_rows(conn, conversation_id, after_id if after_id is not None else 0, before_id, limit)
+        return [_stored_message(row) for row in rows]
+
+    async def export_chunk(self, cursor: ExportCursor, limit: int = EXPORT_CHUNK_SIZE) -> List[dict]:
+        return await self.run_blocking(export_chunk, self.pool, cursor, limit)
+
+    async def import_records(self, records: List[dict], preserve_ids: bool = True) -> dict:
+        conversation_ids = list(dict.fromkeys(record["conversation_id"] for record in records))
+        for conversation_id in conversation_ids:
+            await self._wait_for_writes(conversation_id)
+        stats = await self.run_blocking(self._import_records, records, preserve_ids)
+        for conversation_id in conversation_ids:
+            self.history_cache.invalidate(conversation_id)
+        return stats
+
+    def _import_records(self, records: List[dict], preserve_ids: bool) -> dict:
+        with self.pool.writer() as conn:
+            return write_import_batch(conn, records, preserve_ids)
+
+    async def delete_conversation(self, conversation_id: str) -> None:
+        await self._wait_for_writes(conversation_id)
+        await self.run_blocking(self._delete_conversation, conversation_id)
+        self.history_cache.invalidate(conversation_id)
+
+    def _delete_conversation(self, conversation_id: str):
+        with self.pool.writer() as conn:
+            # Messages and the summary go with it (ON DELETE CASCADE)
+            conn.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+
+    async def pending_summary(self, conversation_id: str) -> Tuple[Optional[str], List[StoredMessage]]:
+        await self._wait_for_writes(conversation_id)
+        return await self.run_blocking(self._pending_summary, conversation_id)
+
+    def _pending_summary(self, conversation_id: str) -> Tuple[Optional[str], List[StoredMessage]]:
+        ensure_hot(self.pool, conversation_id)
+        with self.pool.reader() as conn:
+            summary, rows = pending_summary_rows(conn, conversation_id)
+        return summary, [StoredMessage(role=row["role"], content=row["content"], id=row["id"]) for row in rows]
+
+    async def save_summary(self, conversation_id: str, summary: str, through_id: int) -> None:
+        await self.run_blocking(self._save_summary, conversation_id, summary, through_id)
+        # The cached window predates the summary; reload it on the next turn
+        self.history_cache.invalidate(conversation_id)
+
+    def _save_summary(self, conversation_id: str, summary: str, through_id: int):
+        with self.pool.writer() as conn:
+            save_summary(conn, conversation_id, summary, through_id)
+
+    async def ping(self) -> None:
+        await self.run_blocking(self._ping)
+
+    def _ping(self):
+        with self.pool.reader() as conn:
+            conn.execute("SELECT 1")
+
+    async def close(self) -> None:
+        await self.run_blocking(self.write_queue.close)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
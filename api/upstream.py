@@ -0,0 +1,335 @@
+"""
+Admission control for upstream (OpenAI) completions.
+
+Every completion takes a slot from the scheduler first. A slot is granted
+when the call fits the configured budgets: UPSTREAM_RPM requests and
+UPSTREAM_TPM tokens per minute (token buckets that refill continuously) and
+UPSTREAM_MAX_CONCURRENCY calls in flight. Calls that do not fit wait in a
+queue:
+
+- interactive chat is always served before background work (webhooks,
+  batches, webhook jobs and summaries);
+- within a priority, clients (IP addresses, or webhook hosts for jobs) take
+  turns, so one busy integration cannot starve the others.
+
+Admission estimates how long a call would wait. When that exceeds the
+priority's latency budget the call is refused at once with
+UpstreamOverloadedError, which the API answers with 503 and Retry-After,
+instead of queueing work that would time out anyway. A call still waiting
+when its budget runs out is refused the same way.
+
+Token costs are estimated up front (prompt plus UPSTREAM_COMPLETION_TOKENS)
+and corrected with the real usage when the call ends. An upstream 429 pauses
+admissions for its Retry-After.
+
+Budgets apply per worker process: divide the account's limits by the number
+of workers. A budget of 0 is unlimited.
+"""
+
+import asyncio
+import logging
+import math
+import os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Deque, Dict, Optional
+
+from api.metrics import UPSTREAM_QUEUE_SECONDS, UPSTREAM_SHED
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_RPM = int(os.getenv("UPSTREAM_RPM", "0"))  # requests per minute, 0 = unlimited
+UPSTREAM_TPM = int(os.getenv("UPSTREAM_TPM", "0"))  # tokens per minute, 0 = unlimited
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "0"))  # calls in flight, 0 = unlimited
+UPSTREAM_COMPLETION_TOKENS = int(os.getenv("UPSTREAM_COMPLETION_TOKENS", "500"))  # reserved until usage is known
+UPSTREAM_CHAT_MAX_WAIT = float(os.getenv("UPSTREAM_CHAT_MAX_WAIT", "10"))  # seconds
+UPSTREAM_BACKGROUND_MAX_WAIT = float(os.getenv("UPSTREAM_BACKGROUND_MAX_WAIT", "30"))  # seconds
+UPSTREAM_RATE_LIMIT_PAUSE = float(os.getenv("UPSTREAM_RATE_LIMIT_PAUSE", "5"))  # after a 429 without Retry-After
+
+# Priorities, highest first
+CHAT = "chat"
+BACKGROUND = "background"
+PRIORITIES = (CHAT, BACKGROUND)
+MAX_WAIT = {CHAT: UPSTREAM_CHAT_MAX_WAIT, BACKGROUND: UPSTREAM_BACKGROUND_MAX_WAIT}
+
+
+class UpstreamOverloadedError(Exception):
+    """Raised when a call would wait longer than its latency budget"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> dict:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class _Bucket:
+    """Token bucket refilled continuously to `per_minute`; 0 means unlimited"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.level = self.capacity
+        self.updated = monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` is available (a call larger than the bucket waits for a full one)"""
+        if not self.capacity:
+            return 0.0
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        if self.capacity:
+            # Corrections can leave the bucket in debt, but never by more than a minute's budget
+            self.level = max(self.level - amount, -self.capacity)
+
+
+@dataclass(eq=False)
+class Ticket:
+    """A granted slot; `release()` it when the call ends (repeat calls are ignored)"""
+
+    scheduler: "UpstreamScheduler"
+    priority: str
+    tokens: int
+    tokens_used: Optional[int] = None  # set to the real usage when known
+    granted: float = field(default_factory=monotonic)
+    released: bool = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self)
+
+
+@dataclass(eq=False)
+class _Waiter:
+    priority: str
+    key: str
+    tokens: int
+    future: asyncio.Future
+    enqueued: float
+
+
+class UpstreamScheduler:
+    """
+    Grants upstream slots within RPM/TPM/concurrency budgets, queueing fairly.
+
+    Usage:
+        async with scheduler.slot(CHAT, client_ip, tokens=estimate) as ticket:
+            response = await client.chat.completions.create(...)
+            ticket.tokens_used = response.usage.total_tokens
+    """
+
+    def __init__(
+        self,
+        rpm: int = UPSTREAM_RPM,
+        tpm: int = UPSTREAM_TPM,
+        max_concurrency: int = UPSTREAM_MAX_CONCURRENCY,
+    ):
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        # priority -> key -> waiters; keys are served round-robin
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._depth = dict.fromkeys(PRIORITIES, 0)
+        self._tokens_waiting = dict.fromkeys(PRIORITIES, 0)
+        self.shed = dict.fromkeys(PRIORITIES, 0)
+        self._paused_until = 0.0
+        self._call_seconds = 0.0  # moving average of slot hold time, for wait estimates
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = 0.0
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def depth(self, priority: Optional[str] = None) -> int:
+        """Calls waiting for a slot (at `priority`, or in total)"""
+        return self._depth[priority] if priority else sum(self._depth.values())
+
+    def stats(self) -> dict:
+        return {
+            "queued": dict(self._depth),
+            "in_flight": self.in_flight,
+            "shed": dict(self.shed),
+            "paused_for": round(max(0.0, self._paused_until - monotonic()), 1),
+        }
+
+    @asynccontextmanager
+    async def slot(self, priority: str, key: str, tokens: int, max_wait: Optional[float] = None):
+        """Hold a slot for the duration of the block; see `acquire`"""
+        ticket = await self.acquire(priority, key, tokens, max_wait)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def acquire(self, priority: str, key: str, tokens: int, max_wait: Optional[float] = None) -> Ticket:
+        """
+        Wait for a slot for a call expected to use `tokens` tokens.
+
+        `max_wait` defaults to the priority's latency budget; math.inf waits
+        as long as it takes (for work that is already queued elsewhere, such
+        as webhook jobs). Raises UpstreamOverloadedError when the wait would
+        be or becomes longer than `max_wait`.
+        """
+        if max_wait is None:
+            max_wait = MAX_WAIT[priority]
+        now = monotonic()
+        rank = PRIORITIES.index(priority)
+        ahead = any(self._depth[p] for p in PRIORITIES[:rank + 1])
+        if not ahead and self._delay(tokens, now) == 0:
+            UPSTREAM_QUEUE_SECONDS.labels(priority).observe(0.0)
+            return self._grant(priority, tokens)
+        if max_wait != math.inf:
+            wait = self.estimate_wait(priority, tokens, now)
+            if wait > max_wait:
+                self._refuse(priority, f"estimated wait {wait:.0f} s")
+        waiter = _Waiter(priority, key, tokens, asyncio.get_running_loop().create_future(), now)
+        self._queues[priority].setdefault(key, deque()).append(waiter)
+        self._depth[priority] += 1
+        self._tokens_waiting[priority] += tokens
+        self._dispatch()
+        try:
+            done, _ = await asyncio.wait((waiter.future,), timeout=None if max_wait == math.inf else max_wait)
+        except BaseException:
+            # Cancelled while waiting: give back a slot granted in the meantime
+            if waiter.future.done() and not waiter.future.cancelled():
+                waiter.future.result().release()
+            else:
+                self._remove(waiter)
+            raise
+        if not done:
+            self._remove(waiter)
+            self._refuse(priority, f"waited {max_wait:g} s")
+        UPSTREAM_QUEUE_SECONDS.labels(priority).observe(monotonic() - now)
+        return waiter.future.result()
+
+    def estimate_wait(self, priority: str, tokens: int, now: Optional[float] = None) -> float:
+        """Seconds a call queued now at `priority` would wait, given the calls ahead of it"""
+        if now is None:
+            now = monotonic()
+        ahead = PRIORITIES[:PRIORITIES.index(priority) + 1]
+        requests = sum(self._depth[p] for p in ahead) + 1
+        needed = sum(self._tokens_waiting[p] for p in ahead) + tokens
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        wait = max(
+            self._paused_until - now,
+            self._requests.delay(requests) if self._requests.capacity else 0.0,
+            # Beyond one bucket the rest arrives at the refill rate
+            (needed - self._tokens.level) / self._tokens.rate if self._tokens.capacity else 0.0,
+        )
+        if self.max_concurrency and self.in_flight + requests > self.max_concurrency:
+            wait = max(wait, (self.in_flight + requests - self.max_concurrency) / self.max_concurrency
+                       * self._call_seconds)
+        return max(0.0, wait)
+
+    def pause(self, seconds: Optional[float] = None):
+        """Stop granting slots for `seconds` (after an upstream 429)"""
+        seconds = UPSTREAM_RATE_LIMIT_PAUSE if seconds is None else seconds
+        until = monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            logger.warning(f"Upstream rate limited; pausing new calls for {seconds:.1f} s")
+            self._schedule(until)
+
+    def _refuse(self, priority: str, reason: str):
+        self.shed[priority] += 1
+        UPSTREAM_SHED.labels(priority).inc()
+        retry_after = self.estimate_wait(priority, 0)
+        raise UpstreamOverloadedError(f"Upstream is busy ({reason}); try again later", retry_after)
+
+    def _delay(self, tokens: int, now: float) -> float:
+        """0 if a call of `tokens` fits now, else seconds until it may (inf: when a call ends)"""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return math.inf
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        return max(self._requests.delay(1), self._tokens.delay(tokens))
+
+    def _grant(self, priority: str, tokens: int) -> Ticket:
+        self._requests.take(1)
+        self._tokens.take(tokens)
+        self.in_flight += 1
+        return Ticket(self, priority, tokens)
+
+    def _release(self, ticket: Ticket):
+        self.in_flight -= 1
+        if ticket.tokens_used is not None:
+            self._tokens.take(ticket.tokens_used - ticket.tokens)
+        held = monotonic() - ticket.granted
+        self._call_seconds = held if not self._call_seconds else 0.9 * self._call_seconds + 0.1 * held
+        self._dispatch()
+
+    def _remove(self, waiter: _Waiter):
+        waiters = self._queues[waiter.priority].get(waiter.key)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del self._queues[waiter.priority][waiter.key]
+        self._depth[waiter.priority] -= 1
+        self._tokens_waiting[waiter.priority] -= waiter.tokens
+
+    def _dispatch(self):
+        """Grant slots to waiting calls in priority order, round-robin across keys"""
+        now = monotonic()
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue:
+                key, waiters = next(iter(queue.items()))
+                waiter = waiters[0]
+                delay = self._delay(waiter.tokens, now)
+                if delay:
+                    # Lower priorities wait too; a timer (or the next release) resumes
+                    if delay != math.inf:
+                        self._schedule(now + delay)
+                    return
+                waiters.popleft()
+                if waiters:
+                    queue.move_to_end(key)
+                else:
+                    del queue[key]
+                self._depth[priority] -= 1
+                self._tokens_waiting[priority] -= waiter.tokens
+                if not waiter.future.done():
+                    waiter.future.set_result(self._grant(priority, waiter.tokens))
+
+    def _schedule(self, when: float):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop yet: the next acquire dispatches
+        if self._timer is not None and self._timer_loop is loop and self._timer_at <= when:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_loop = loop
+        self._timer_at = when
+        self._timer = loop.call_later(max(0.0, when - monotonic()), self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Retry-After of an upstream 429 (openai.RateLimitError), if it sent one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[name]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
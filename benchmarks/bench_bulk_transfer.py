@@ -0,0 +1,156 @@
+"""
+Throughput and memory of the bulk NDJSON export and import in api/bulk.py.
+
+Fills a database with `--messages` messages of `--content-size` characters
+spread over `--conversations` conversations (the defaults make a database of
+about 2 GiB), archives `--archived` of the conversations so the export also
+decodes archive blobs, then times:
+
+  export        every record to a plain NDJSON file
+  export gzip   the same to a .gz file
+  import        the gzip file into an empty database
+  re-import     the same file again (every record already present)
+
+Imports run with the CLI's bulk-load tuning and include the final checkpoint.
+
+Reported per phase: records/s, MiB/s of NDJSON and the process's peak RSS,
+which should stay flat however large the database is (it is mostly the
+DB_MMAP_SIZE mapping, plus the bulk-load page cache once importing).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_bulk_transfer --messages 2000000 --content-size 1000
+    python -m benchmarks.bench_bulk_transfer --messages 200000 --dir /tmp/bulk --keep
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from api.bulk import ExportCursor, _open, encode, export_records, import_lines, tune_for_bulk_load
+from api.db import ConnectionPool
+from api.maintenance import archive_conversation
+from api.migrations import migrate
+
+BUILD_BATCH = 50_000
+
+
+def peak_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build(path: str, messages: int, conversations: int, content_size: int, archived: float):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    migrate(conn)
+    rng = random.Random(0)
+    words = "sleep focus stress breathe walk journal rest goal habit energy".split()
+    conn.executemany(
+        "INSERT INTO conversations (conversation_id) VALUES (?)",
+        ((f"conv-{i:07d}",) for i in range(conversations)),
+    )
+    began = time.perf_counter()
+    written = 0
+    while written < messages:
+        count = min(BUILD_BATCH, messages - written)
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, role, content, token_count) VALUES (?, ?, ?, ?)",
+            (
+                (f"conv-{rng.randrange(conversations):07d}", "user" if (written + i) % 2 else "assistant",
+                 " ".join(rng.choice(words) for _ in range(content_size // 6))[:content_size], content_size // 4)
+                for i in range(count)
+            ),
+        )
+        conn.commit()
+        written += count
+        print(f"\r  inserted {written:,} / {messages:,} messages ({time.perf_counter() - began:.0f} s)", end="")
+    print()
+    for i in range(int(conversations * archived)):
+        archive_conversation(conn, f"conv-{i:07d}", "zlib")
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def export(pool: ConnectionPool, path: str) -> tuple:
+    count = size = 0
+    with _open(path, "w") as out:
+        for record in export_records(pool, ExportCursor()):
+            line = encode(record)
+            out.write(line)
+            count += 1
+            size += len(line)
+    return count, size
+
+
+def phase(name: str, func) -> tuple:
+    began = time.perf_counter()
+    count, size = func()
+    elapsed = time.perf_counter() - began
+    print(f"  {name:<12} {elapsed:7.1f} s  {count / elapsed:10,.0f} records/s  "
+          f"{size / 2**20 / elapsed:7.1f} MiB/s  peak RSS {peak_rss_mib():6.0f} MiB")
+    return count, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--conversations", type=int, default=50_000)
+    parser.add_argument("--content-size", type=int, default=1000, help="Characters per message")
+    parser.add_argument("--archived", type=float, default=0.2, help="Fraction of conversations archived")
+    parser.add_argument("--dir", help="Working directory (default: a temporary one)")
+    parser.add_argument("--keep", action="store_true", help="Keep the databases and export files")
+    args = parser.parse_args()
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="coach-bulk-")
+    os.makedirs(workdir, exist_ok=True)
+    source, target = os.path.join(workdir, "source.db"), os.path.join(workdir, "target.db")
+    plain, compressed = os.path.join(workdir, "export.ndjson"), os.path.join(workdir, "export.ndjson.gz")
+    for path in (source, target):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    print(f"Building {args.messages:,} messages over {args.conversations:,} conversations in {source}")
+    # In a child process, so peak RSS below covers the transfers only
+    builder = multiprocessing.Process(
+        target=build, args=(source, args.messages, args.conversations, args.content_size, args.archived)
+    )
+    builder.start()
+    builder.join()
+    print(f"Database {os.path.getsize(source) / 2**30:.2f} GiB, {args.archived:.0%} of conversations archived")
+
+    pool = ConnectionPool(source)
+    count, size = phase("export", lambda: export(pool, plain))
+    phase("export gzip", lambda: export(pool, compressed))
+    pool.close()
+    print(f"  {count:,} records, {size / 2**30:.2f} GiB of NDJSON, "
+          f"{os.path.getsize(compressed) / 2**20:,.0f} MiB gzipped")
+
+    pool = ConnectionPool(target)
+    with pool.writer() as conn:
+        migrate(conn)
+    tune_for_bulk_load(pool)  # as `python -m api.bulk import` does
+    for name in ("import", "re-import"):
+        def run():
+            with _open(compressed, "r") as lines:
+                stats = import_lines(pool, lines)
+            with pool.writer() as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            print(f"  {name}: {stats}")
+            return count, size
+        phase(name, run)
+    pool.close()
+
+    if not args.keep and not args.dir:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
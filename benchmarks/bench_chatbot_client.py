@@ -0,0 +1,107 @@
+"""
+Per-message overhead of the Slack bot's calls to the chatbot API.
+
+Runs a stub chatbot API (answering instantly) plus a stub Slack `auth.test`
+in a child process and compares, per handled mention:
+
+  legacy:  auth.test on every mention + a bare `requests.post` (new TCP
+           connection per call)
+  pooled:  cached bot identity + `ChatbotClient` (keep-alive session)
+
+Everything is plain HTTP on localhost, so the gap shown is a lower bound:
+against a remote HTTPS API every avoided connection also saves a TLS
+handshake and network round trips.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_chatbot_client --messages 500 --threads 1,8
+"""
+
+import argparse
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from fastapi import FastAPI
+
+from benchmarks.common import percentile, run_server
+from integrations.chatbot_client import ChatbotClient
+
+BOT_USER_ID = "U0BOT"
+
+
+def create_stub_app() -> FastAPI:
+    app = FastAPI(title="Stub chatbot API")
+
+    @app.post("/api/webhook")
+    async def webhook(payload: dict):
+        return {"response": "stub reply", "conversation_id": payload.get("conversation_id")}
+
+    @app.post("/api/auth.test")
+    async def auth_test():
+        return {"ok": True, "user_id": BOT_USER_ID}
+
+    return app
+
+
+def legacy_mention(base_url: str, text: str) -> str:
+    """What handle_mentions() + call_chatbot_api() used to do"""
+    bot_user_id = requests.post(f"{base_url}/api/auth.test", timeout=5).json()["user_id"]
+    message = text.replace(f"<@{bot_user_id}>", "").strip()
+    response = requests.post(
+        f"{base_url}/api/webhook",
+        json={"message": message, "conversation_id": "slack-U1"},
+        headers={"Content-Type": "application/json"},
+        timeout=30,
+    )
+    return response.json()["response"]
+
+
+def pooled_mention(chatbot: ChatbotClient, pattern: re.Pattern, text: str) -> str:
+    return chatbot.reply(pattern.sub("", text).strip(), "slack-U1")
+
+
+def measure(handle, messages: int, threads: int):
+    """Return (messages per second, per-message latencies in ms)"""
+    def timed(_):
+        began = time.perf_counter()
+        handle()
+        return (time.perf_counter() - began) * 1000
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(timed, range(messages)))
+    return messages / (time.perf_counter() - began), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--threads", default="1,8", help="Comma-separated handler thread counts")
+    args = parser.parse_args()
+
+    text = f"<@{BOT_USER_ID}> how do I deal with stress before exams?"
+    pattern = re.compile(rf"<@{BOT_USER_ID}>")
+
+    with run_server(create_stub_app) as base_url:
+        for threads in [int(n) for n in args.threads.split(",")]:
+            chatbot = ChatbotClient(base_url=base_url, pool_size=threads, max_concurrency=threads)
+            # Warm up both paths (imports, first connections)
+            legacy_mention(base_url, text)
+            pooled_mention(chatbot, pattern, text)
+
+            print(f"{args.messages} mentions, {threads} handler thread(s):")
+            for name, handle in (
+                ("legacy", lambda: legacy_mention(base_url, text)),
+                ("pooled", lambda: pooled_mention(chatbot, pattern, text)),
+            ):
+                rate, latencies = measure(handle, args.messages, threads)
+                print(
+                    f"  {name}:  {rate:>7.0f} msg/s  "
+                    f"p50 {percentile(latencies, 50):6.2f} ms  p99 {percentile(latencies, 99):6.2f} ms"
+                )
+            chatbot.close()
+
+
+if __name__ == "__main__":
+    main()
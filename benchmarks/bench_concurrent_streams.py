@@ -0,0 +1,87 @@
+"""
+Concurrency benchmark for the /api/chat SSE stream.
+
+Drives N simultaneous chat streams against a single uvicorn worker backed by a
+fake upstream with a fixed first-token delay and token rate. With a
+non-blocking upstream client, per-stream latency should stay close to the
+upstream's own generation time as N grows.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_concurrent_streams --levels 1,10,100,300
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import FakeAsyncOpenAI, percentile, prepare_env, run_server
+
+
+async def one_stream(http: httpx.AsyncClient, base_url: str, index: int):
+    """Open one chat stream and return (ttft, total) in seconds"""
+    start = time.perf_counter()
+    ttft = None
+    async with http.stream(
+        "POST",
+        f"{base_url}/api/chat",
+        json={"message": f"benchmark message {index}"},
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if ttft is None and line.startswith("data:") and '"content"' in line:
+                ttft = time.perf_counter() - start
+    return ttft or 0.0, time.perf_counter() - start
+
+
+async def run_level(base_url: str, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as http:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one_stream(http, base_url, i) for i in range(concurrency)))
+        wall = time.perf_counter() - started
+    ttfts = [r[0] for r in results]
+    totals = [r[1] for r in results]
+    return {
+        "concurrency": concurrency,
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "total_p50": percentile(totals, 50),
+        "total_p95": percentile(totals, 95),
+        "streams_per_s": concurrency / wall,
+    }
+
+
+def create_app(tokens: int, token_delay: float, first_token_delay: float):
+    """Build the API app with the upstream replaced by a fake (runs in the server process)"""
+    from api import index
+
+    index.client = FakeAsyncOpenAI(tokens, token_delay, first_token_delay)
+    return index.app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,10,50,100,200", help="Comma-separated concurrency levels")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per fake completion")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between fake tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="Fake upstream TTFT in seconds")
+    args = parser.parse_args()
+
+    prepare_env()
+    ideal = args.first_token_delay + args.token_delay * (args.tokens - 1)
+    print(f"Upstream generation time per stream: {ideal * 1000:.0f} ms")
+    print(f"{'streams':>8} {'ttft p50':>10} {'ttft p95':>10} {'total p50':>10} {'total p95':>10} {'streams/s':>10}")
+
+    with run_server(create_app, args.tokens, args.token_delay, args.first_token_delay) as base_url:
+        for level in (int(x) for x in args.levels.split(",")):
+            r = asyncio.run(run_level(base_url, level))
+            print(
+                f"{r['concurrency']:>8} {r['ttft_p50'] * 1000:>8.0f}ms {r['ttft_p95'] * 1000:>8.0f}ms "
+                f"{r['total_p50'] * 1000:>8.0f}ms {r['total_p95'] * 1000:>8.0f}ms {r['streams_per_s']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Memory and latency of GET /api/conversations/{id} for very long conversations.
+
+Writes one conversation of `--messages` messages, then drives the endpoint
+in-process through the ASGI interface (response bodies are counted and
+discarded, so only server-side allocations are measured) and reports peak
+Python memory (tracemalloc), time to the first body byte, total time and
+bytes sent for:
+
+  legacy        every message through the pydantic ConversationResponse model
+  json page     one keyset page of CONVERSATION_PAGE_MAX messages
+  ndjson        the whole conversation streamed in keyset chunks
+  ndjson gzip   the same, gzip-compressed on the fly
+
+Usage (from the repository root):
+    python -m benchmarks.bench_conversation_pages --messages 10000,100000
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from benchmarks.common import prepare_env
+
+
+async def call(app, path: str, query: str = "", gzip: bool = False) -> dict:
+    """Run one GET through the ASGI app; body bytes are counted, not kept"""
+    headers = [(b"host", b"bench")]
+    if gzip:
+        headers.append((b"accept-encoding", b"gzip"))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "headers": headers, "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    result = {"status": None, "bytes": 0, "first_byte": None}
+    began = time.perf_counter()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if requested:
+            # The client never disconnects; block until the response is done
+            await asyncio.Event().wait()
+        requested = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if result["first_byte"] is None:
+                result["first_byte"] = time.perf_counter() - began
+            result["bytes"] += len(message["body"])
+
+    await app(scope, receive, send)
+    result["total"] = time.perf_counter() - began
+    return result
+
+
+async def legacy(index, conversation_id: str) -> dict:
+    """The original handler: load everything, validate it through the response model, serialize"""
+    began = time.perf_counter()
+    conversation = await index.storage.get_conversation(conversation_id)
+    response = index.ConversationResponse(
+        conversation_id=conversation_id,
+        messages=[
+            {"role": m.role, "content": m.content, "timestamp": m.timestamp} for m in conversation.messages
+        ],
+        created_at=conversation.created_at,
+        updated_at=conversation.updated_at,
+    )
+    body = response.model_dump_json().encode()
+    elapsed = time.perf_counter() - began
+    return {"status": 200, "bytes": len(body), "first_byte": elapsed, "total": elapsed}
+
+
+async def measure(coroutine_factory) -> dict:
+    """Timings from a plain run (tracing slows allocation down), peak memory from a traced one"""
+    await coroutine_factory()  # warm the page cache
+    result = await coroutine_factory()
+    tracemalloc.start()
+    await coroutine_factory()
+    result["peak"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", default="10000,100000", help="Comma-separated conversation lengths")
+    parser.add_argument("--content-size", type=int, default=200, help="Characters per message")
+    args = parser.parse_args()
+
+    prepare_env()
+    from api import index
+    from api.persistence import write_messages
+
+    async def run():
+        for length in [int(n) for n in args.messages.split(",")]:
+            conversation_id = f"long-{length}"
+            with index.db_pool.writer() as conn:
+                text = "x" * args.content_size
+                write_messages(conn, [(conversation_id, "user" if i % 2 else "assistant", text, 50)
+                                      for i in range(length)])
+            path = f"/api/conversations/{conversation_id}"
+            cases = [
+                ("legacy", lambda: legacy(index, conversation_id)),
+                ("json page", lambda: call(index.app, path)),
+                ("ndjson", lambda: call(index.app, path, "format=ndjson")),
+                ("ndjson gzip", lambda: call(index.app, path, "format=ndjson", gzip=True)),
+            ]
+            print(f"\n{length:,} messages of {args.content_size} characters")
+            for name, factory in cases:
+                result = await measure(factory)
+                print(
+                    f"  {name:<12} peak {result['peak'] / 2**20:8.1f} MiB  first byte "
+                    f"{result['first_byte'] * 1000:8.1f} ms  total {result['total'] * 1000:8.1f} ms  "
+                    f"sent {result['bytes'] / 2**20:7.1f} MiB"
+                )
+        await index.storage.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Chat-turn throughput: per-call sqlite3.connect() vs the pooled WAL connections.
+
+Each simulated turn performs the same database work as one /api/chat request:
+save the user message, read the conversation history, save the assistant
+reply. Turns run on a thread pool, the way FastAPI would dispatch blocking
+work, against separate database files for the two strategies.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_db_pool --turns 5000 --threads 8
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from api.db import ConnectionPool
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_conversation_id ON messages(conversation_id);
+"""
+
+
+def legacy_db(path: str):
+    """The original get_db(): a fresh connection per use, default rollback journal"""
+
+    @contextmanager
+    def get_db(readonly: bool = False):
+        conn = sqlite3.connect(path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    return get_db
+
+
+def pooled_db(pool: ConnectionPool):
+    @contextmanager
+    def get_db(readonly: bool = False):
+        if readonly:
+            with pool.reader() as conn:
+                yield conn
+        else:
+            with pool.writer() as conn:
+                yield conn
+
+    return get_db
+
+
+def chat_turn(get_db, conversation_id: str):
+    with get_db() as conn:
+        conn.execute("INSERT OR IGNORE INTO conversations (conversation_id) VALUES (?)", (conversation_id,))
+        conn.execute(
+            "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE conversation_id = ?",
+            (conversation_id,),
+        )
+        conn.execute(
+            "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
+            (conversation_id, "user", "How do I stay motivated?"),
+        )
+    with get_db(readonly=True) as conn:
+        conn.execute(
+            "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC",
+            (conversation_id,),
+        ).fetchall()
+    with get_db() as conn:
+        conn.execute(
+            "INSERT INTO messages (conversation_id, role, content) VALUES (?, ?, ?)",
+            (conversation_id, "assistant", "Start small and celebrate progress. " * 10),
+        )
+        conn.execute(
+            "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE conversation_id = ?",
+            (conversation_id,),
+        )
+
+
+def run(get_db, turns: int, threads: int, conversations: int) -> float:
+    ids = [f"bench-{random.randrange(conversations)}" for _ in range(turns)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda cid: chat_turn(get_db, cid), ids))
+    return turns / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=3000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--synchronous", default="NORMAL", help="PRAGMA synchronous for the pooled run")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="coach-bench-")
+    legacy_path = os.path.join(workdir, "legacy.db")
+    pooled_path = os.path.join(workdir, "pooled.db")
+    for path in (legacy_path, pooled_path):
+        with sqlite3.connect(path) as conn:
+            conn.executescript(SCHEMA)
+
+    pool = ConnectionPool(pooled_path, size=args.threads, pragmas={"synchronous": args.synchronous})
+    legacy = run(legacy_db(legacy_path), args.turns, args.threads, args.conversations)
+    pooled = run(pooled_db(pool), args.turns, args.threads, args.conversations)
+    pool.close()
+
+    print(f"{args.turns} chat turns on {args.threads} threads")
+    print(f"  per-call connect, rollback journal: {legacy:>8.0f} turns/s")
+    print(f"  pooled, WAL (synchronous={args.synchronous}): {pooled:>8.0f} turns/s")
+    print(f"  speedup: {pooled / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Load test for the Discord bot: many simultaneous `!coach chat` commands.
+
+Runs a stub chatbot API (answering after `--delay` seconds) in a child
+process, then invokes the bot's `chat_command` directly with fake command
+contexts, spread over `--guilds` servers. A heartbeat task on the same event
+loop measures how long the loop is blocked, which is what makes discord.py
+miss gateway heartbeats.
+
+Compares the original command (synchronous `requests.post` inside the
+coroutine) with the current one (AsyncChatbotClient).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_discord_bot --commands 100 --guilds 10 --delay 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import requests
+from fastapi import FastAPI
+
+from benchmarks.common import percentile, run_server
+
+INTEGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "integrations")
+
+
+def create_stub_app(delay: float) -> FastAPI:
+    app = FastAPI(title="Stub chatbot API")
+    state = {"in_flight": 0, "peak": 0}
+
+    @app.post("/api/webhook")
+    async def webhook(payload: dict):
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            state["in_flight"] -= 1
+        return {"response": "stub reply", "conversation_id": payload.get("conversation_id")}
+
+    @app.get("/api/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/stats")
+    async def stats():
+        peak, state["peak"] = state["peak"], 0
+        return {"peak": peak}
+
+    return app
+
+
+class FakeContext:
+    """The parts of a discord.py command context that chat_command uses"""
+
+    def __init__(self, user_id: int, guild_id: int):
+        self.author = SimpleNamespace(id=user_id)
+        self.guild = SimpleNamespace(id=guild_id)
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+    def typing(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def legacy_chat_command(base_url: str):
+    """The original chat_command: a blocking requests.post inside the coroutine"""
+    async def chat_command(ctx, *, message: str = None):
+        async with ctx.typing():
+            response = requests.post(
+                f"{base_url}/api/webhook",
+                json={"message": message, "conversation_id": f"discord-{ctx.author.id}"},
+                headers={"Content-Type": "application/json"},
+                timeout=30,
+            )
+            await ctx.send(response.json().get("response"))
+    return chat_command
+
+
+async def drive(command, commands: int, guilds: int):
+    """Run `commands` parallel invocations; return (seconds, latencies ms, max loop stall ms)"""
+    stalls = []
+    running = True
+
+    async def heartbeat():
+        while running:
+            began = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalls.append((time.perf_counter() - began - 0.01) * 1000)
+
+    async def one(i: int):
+        # Latency counts from when the whole burst arrived, as users would see it
+        ctx = FakeContext(user_id=i, guild_id=i % guilds)
+        await command(ctx, message=f"message {i}: how do I stay focused?")
+        assert ctx.sent, "command sent no reply"
+        return (time.perf_counter() - began) * 1000
+
+    monitor = asyncio.create_task(heartbeat())
+    began = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(commands)))
+    elapsed = time.perf_counter() - began
+    running = False
+    await monitor
+    return elapsed, latencies, max(stalls, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=100)
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.2, help="Stub API response time in seconds")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only run the async client")
+    args = parser.parse_args()
+
+    with run_server(create_stub_app, args.delay) as base_url:
+        os.environ.setdefault("DISCORD_BOT_TOKEN", "bench-token")
+        os.environ["CHATBOT_API_URL"] = base_url
+        sys.path.insert(0, INTEGRATIONS_DIR)
+        import discord_bot
+
+        async def run_all():
+            variants = [("async client", discord_bot.chat_command.callback)]
+            if not args.skip_legacy:
+                variants.insert(0, ("blocking requests", legacy_chat_command(base_url)))
+            print(f"{args.commands} parallel commands over {args.guilds} guilds, stub API delay {args.delay}s")
+            for name, command in variants:
+                elapsed, latencies, stall = await drive(command, args.commands, args.guilds)
+                peak = requests.get(f"{base_url}/stats").json()["peak"]
+                print(
+                    f"  {name:<18} total {elapsed:6.2f} s  p50 {percentile(latencies, 50):7.0f} ms  "
+                    f"p99 {percentile(latencies, 99):7.0f} ms  max loop stall {stall:7.0f} ms  "
+                    f"peak API concurrency {peak}"
+                )
+            await discord_bot.chatbot.close()
+
+        asyncio.run(run_all())
+
+
+if __name__ == "__main__":
+    main()
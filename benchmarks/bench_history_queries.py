@@ -0,0 +1,142 @@
+"""
+History query latency before and after schema v2, at scale.
+
+Builds a database in the original (pre-versioning) layout with `--messages`
+rows spread over `--conversations` conversations, times the history queries
+against the single-column index with `ORDER BY timestamp`, migrates it to the
+current schema with `api.migrations.migrate` (timing the rebuild), and times
+the same reads again on the (conversation_id, id) index. Query plans are
+printed for both, and a plan that scans or sorts fails the run.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_history_queries --messages 10000000 --conversations 100000
+    python -m benchmarks.bench_history_queries --messages 200000 --db /tmp/history.db --keep
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from api.migrations import _v1_initial, explain, explain_hot_queries, migrate
+from benchmarks.common import percentile
+
+LEGACY_GET_CONVERSATION = (
+    "SELECT id, role, content, timestamp FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC"
+)
+GET_CONVERSATION = "SELECT id, role, content, timestamp FROM messages WHERE conversation_id = ? ORDER BY id ASC"
+LOAD_CONTEXT = (
+    "SELECT id, role, content, token_count FROM messages WHERE conversation_id = ? AND id > ? ORDER BY id DESC"
+)
+BUILD_BATCH = 100_000
+
+
+def build(conn: sqlite3.Connection, messages: int, conversations: int, seed: int):
+    """Original schema filled with interleaved conversations, as concurrent users would write them"""
+    _v1_initial(conn)
+    rng = random.Random(seed)
+    conn.executemany(
+        "INSERT INTO conversations (conversation_id) VALUES (?)",
+        ((f"conv-{i:07d}",) for i in range(conversations)),
+    )
+    began = time.perf_counter()
+    written = 0
+    while written < messages:
+        count = min(BUILD_BATCH, messages - written)
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, role, content, token_count) VALUES (?, ?, ?, ?)",
+            (
+                (f"conv-{rng.randrange(conversations):07d}", "user" if (written + i) % 2 else "assistant",
+                 f"message {written + i} about staying focused and rested", 12)
+                for i in range(count)
+            ),
+        )
+        conn.commit()
+        written += count
+        print(f"\r  inserted {written:,} / {messages:,} messages ({time.perf_counter() - began:.0f} s)", end="")
+    print()
+
+
+def time_queries(conn: sqlite3.Connection, sql: str, params, samples: int) -> dict:
+    latencies = []
+    misordered = 0
+    for args in params[:samples]:
+        began = time.perf_counter()
+        rows = conn.execute(sql, args).fetchall()
+        latencies.append((time.perf_counter() - began) * 1000)
+        ids = [row[0] for row in rows]
+        if ids != sorted(ids) and ids != sorted(ids, reverse=True):
+            misordered += 1
+    return {
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "misordered": misordered,
+    }
+
+
+def report(label: str, conn: sqlite3.Connection, queries, samples: int):
+    """Time and explain each (name, sql, params list)"""
+    print(f"\n{label}")
+    for name, sql, params in queries:
+        stats = time_queries(conn, sql, params, samples)
+        print(f"  {name:<18} p50 {stats['p50']:8.3f} ms  p99 {stats['p99']:8.3f} ms  "
+              f"misordered results {stats['misordered']}")
+        for line in explain(conn, sql, params[0]):
+            print(f"      plan: {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--conversations", type=int, default=100_000)
+    parser.add_argument("--samples", type=int, default=2000, help="Conversations queried per measurement")
+    parser.add_argument("--db", help="Database file (default: a temporary file)")
+    parser.add_argument("--keep", action="store_true", help="Keep the database file afterwards")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="coach-bench-"), "history.db")
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -16000")
+
+    print(f"Building {args.messages:,} messages over {args.conversations:,} conversations in {path}")
+    build(conn, args.messages, args.conversations, args.seed)
+    conn.execute("ANALYZE")
+
+    rng = random.Random(args.seed + 1)
+    conversation_ids = [f"conv-{rng.randrange(args.conversations):07d}" for _ in range(args.samples)]
+    by_conversation = [(cid,) for cid in conversation_ids]
+    context_params = [(cid, 0) for cid in conversation_ids]
+    report("Original schema (idx_conversation_id, ORDER BY timestamp)", conn, [
+        ("get_conversation", LEGACY_GET_CONVERSATION, by_conversation),
+        ("load_context", LOAD_CONTEXT, context_params),
+    ], args.samples)
+
+    began = time.perf_counter()
+    version = migrate(conn)
+    print(f"\nMigrated to schema version {version} in {time.perf_counter() - began:.1f} s")
+    conn.execute("ANALYZE")
+
+    report("Schema v2 (idx_messages_conversation, ORDER BY id)", conn, [
+        ("get_conversation", GET_CONVERSATION, by_conversation),
+        ("load_context", LOAD_CONTEXT, context_params),
+    ], args.samples)
+
+    failed = [(name, problems) for name, _, problems in explain_hot_queries(conn) if problems]
+    for name, problems in failed:
+        print(f"\nPlan check failed for {name}: {'; '.join(problems)}")
+    conn.close()
+    if not args.keep and not args.db:
+        os.remove(path)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Cost and payoff of the maintenance sweep in api/maintenance.py.
+
+Fills a database with `--conversations` conversations of `--messages`
+messages each, ages `--idle` of them past ARCHIVE_AFTER_DAYS, runs one sweep,
+and reports how long it took, the compression ratio, the space handed back
+to the filesystem, and the latency of reading an archived conversation (which
+rehydrates it) against reading a hot one.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_maintenance --conversations 5000 --messages 40 --idle 0.8
+"""
+
+import argparse
+import os
+import random
+import time
+
+from benchmarks.common import percentile, prepare_env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=40, help="Messages per conversation")
+    parser.add_argument("--idle", type=float, default=0.8, help="Fraction of conversations past the archive age")
+    parser.add_argument("--samples", type=int, default=200, help="Reads timed per kind")
+    args = parser.parse_args()
+
+    db_path = prepare_env(MAINTENANCE_ENABLED="false", ARCHIVE_AFTER_DAYS="30")
+    from api import maintenance
+    from api.db import ConnectionPool
+    from api.migrations import migrate
+    from api.persistence import write_messages
+    from api.storage import SQLiteStorage
+
+    pool = ConnectionPool(db_path)
+    with pool.writer() as conn:
+        migrate(conn)
+    rng = random.Random(0)
+    phrases = ["I slept badly again", "Work is piling up", "Try a ten minute walk", "Write down three wins"]
+    began = time.perf_counter()
+    for start in range(0, args.conversations, 500):
+        with pool.writer() as conn:
+            write_messages(conn, [
+                (f"conv-{c}", "user" if i % 2 else "assistant", f"{rng.choice(phrases)}. " * rng.randint(3, 30), 40)
+                for c in range(start, min(start + 500, args.conversations)) for i in range(args.messages)
+            ])
+    idle = int(args.conversations * args.idle)
+    with pool.writer() as conn:
+        conn.execute(
+            "UPDATE conversations SET updated_at = datetime('now', '-60 days') "
+            "WHERE CAST(substr(conversation_id, 6) AS INTEGER) < ?",
+            (idle,),
+        )
+    print(f"Wrote {args.conversations * args.messages:,} messages in {time.perf_counter() - began:.1f} s; "
+          f"{idle:,} conversations idle")
+
+    report = maintenance.run_maintenance(pool)
+    raw, compressed = report["total_archive_raw_bytes"], report["total_archive_bytes"]
+    print(f"Sweep: {report['duration_ms']} ms, archived {report['archived_conversations']:,} conversations "
+          f"({report['archived_messages']:,} messages)")
+    print(f"  archive {compressed / 2**20:.1f} MiB for {raw / 2**20:.1f} MiB of rows "
+          f"(ratio {raw / max(compressed, 1):.1f}x, codec {maintenance.archive_codec()})")
+    print(f"  database {report['db_bytes'] / 2**20:.1f} MiB, {report['reclaimed_bytes'] / 2**20:.1f} MiB reclaimed, "
+          f"file {os.path.getsize(db_path) / 2**20:.1f} MiB before checkpoint")
+
+    storage = SQLiteStorage(pool)
+    hot_ids = [f"conv-{c}" for c in rng.sample(range(idle, args.conversations), min(args.samples, args.conversations - idle))]
+    cold_ids = [f"conv-{c}" for c in rng.sample(range(idle), min(args.samples, idle))]
+    for name, ids in (("hot read", hot_ids), ("archived read", cold_ids), ("after rehydration", cold_ids)):
+        latencies = []
+        for conversation_id in ids:
+            began = time.perf_counter()
+            storage._load_history(conversation_id)
+            latencies.append((time.perf_counter() - began) * 1000)
+        print(f"  {name:<18} p50 {percentile(latencies, 50):7.2f} ms  p99 {percentile(latencies, 99):7.2f} ms")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Cost of recording metrics in api/metrics.py.
+
+Times each recording primitive in a tight loop (per-call cost including the
+label lookup) and the cost of rendering a scrape.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_metrics --iterations 1000000
+"""
+
+import argparse
+import time
+
+from api.metrics import Counter, Histogram, Registry
+
+
+def per_call_ns(func, iterations: int) -> float:
+    began = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - began) / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    registry = Registry()
+    counter = Counter("bench_total", "Benchmark counter", registry=registry)
+    labeled = Counter("bench_labeled_total", "Benchmark counter", ("method", "path", "status"), registry=registry)
+    histogram = Histogram("bench_seconds", "Benchmark histogram", registry=registry)
+    labeled_histogram = Histogram("bench_labeled_seconds", "Benchmark histogram", ("operation",), registry=registry)
+
+    def timer():
+        with histogram.time():
+            pass
+
+    baseline = per_call_ns(lambda: None, args.iterations)
+    cases = [
+        ("counter.inc()", counter.inc),
+        ("counter.labels(...).inc()", lambda: labeled.labels("POST", "/api/chat", "200").inc()),
+        ("histogram.observe()", lambda: histogram.observe(0.0123)),
+        ("histogram.labels(...).observe()", lambda: labeled_histogram.labels("load_history").observe(0.0123)),
+        ("with histogram.time()", timer),
+    ]
+    print(f"{args.iterations:,} calls each (empty-call overhead {baseline:.0f} ns subtracted)")
+    for name, func in cases:
+        print(f"  {name:<34} {per_call_ns(func, args.iterations) - baseline:7.0f} ns")
+
+    began = time.perf_counter()
+    for _ in range(100):
+        registry.render()
+    print(f"  render scrape                      {(time.perf_counter() - began) / 100 * 1e6:7.0f} us")
+
+
+if __name__ == "__main__":
+    main()
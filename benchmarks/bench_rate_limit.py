@@ -0,0 +1,216 @@
+"""
+Per-check cost and memory of the rate limiter at many distinct clients, and
+accuracy of the shared backends under contention.
+
+Compares the original timestamp-list limiter with the sliding-window counter
+in api/rate_limit.py. Requests are spread over `--clients` distinct keys, each
+making several requests inside the window (the worst case for the list-based
+version, which rebuilds the client's list on every check). The same traffic
+then runs through each backend in `--backends`.
+
+The contention test starts `--workers` processes that all check the same
+`--hot-keys` keys as fast as they can, far beyond the limit. A shared backend
+must allow exactly `--limit` requests per key in total however the checks
+interleave; the memory backend allows up to `--limit` per worker. Reported:
+requests allowed per key and per-check latency percentiles across workers.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_rate_limit --clients 100000
+    python -m benchmarks.bench_rate_limit --backends memory shm --workers 16
+    python -m benchmarks.bench_rate_limit --backends shm redis --redis-url redis://localhost:6379/0
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+from api.rate_limit import (
+    RedisRateLimiter,
+    SharedMemoryRateLimiter,
+    SlidingWindowRateLimiter,
+    SQLiteRateLimiter,
+)
+from benchmarks.common import percentile
+
+
+class TimestampListLimiter:
+    """The original check_rate_limit(): one list of timestamps per client, never evicted"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.store = defaultdict(list)
+
+    def allow(self, key: str, now: float) -> bool:
+        self.store[key] = [t for t in self.store[key] if now - t < self.window]
+        if len(self.store[key]) >= self.limit:
+            return False
+        self.store[key].append(now)
+        return True
+
+
+def run(make_limiter, keys, step: float):
+    """Return (ns per check, bytes retained, limiter) for a fresh limiter"""
+    limiter = make_limiter()
+    now = 0.0
+    began = time.perf_counter()
+    for key in keys:
+        limiter.allow(key, now)
+        now += step
+    per_check = (time.perf_counter() - began) / len(keys) * 1e9
+
+    # Measure memory in a second pass; tracing would distort the timing above
+    tracemalloc.start()
+    limiter = make_limiter()
+    now = 0.0
+    for key in keys:
+        limiter.allow(key, now)
+        now += step
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return per_check, memory, limiter
+
+
+def make_backend(backend: str, limit: int, window: float, directory: str, redis_url: str):
+    if backend == "memory":
+        return SlidingWindowRateLimiter(limit, window, sweep_interval=0)
+    if backend == "shm":
+        return SharedMemoryRateLimiter(limit, window, path=os.path.join(directory, "limits.shm"))
+    if backend == "sqlite":
+        return SQLiteRateLimiter(limit, window, path=os.path.join(directory, "limits.db"), sweep_interval=0)
+    if backend == "redis":
+        if redis_url:
+            return RedisRateLimiter(limit, window, url=redis_url)
+        import fakeredis  # in-process stand-in: shared by threads only, not by the workers below
+        return RedisRateLimiter(limit, window, client=fakeredis.FakeRedis())
+    raise ValueError(backend)
+
+
+def backend_cost(make_limiter, keys, step: float) -> float:
+    """ns per check through a backend (clock supplied, as in run())"""
+    limiter = make_limiter()
+    now = 1_000_000.0
+    began = time.perf_counter()
+    for key in keys:
+        limiter.allow(key, now)
+        now += step
+    elapsed = time.perf_counter() - began
+    limiter.close()
+    return elapsed / len(keys) * 1e9
+
+
+def contend(make_limiter, keys, checks: int, now: float, start, results):
+    """One worker: `checks` checks over the hot keys; reports allowed counts and latencies"""
+    limiter = make_limiter()
+    allowed = dict.fromkeys(keys, 0)
+    latencies = []
+    start.wait()
+    for i in range(checks):
+        key = keys[i % len(keys)]
+        began = time.perf_counter()
+        if limiter.allow(key, now):
+            allowed[key] += 1
+        latencies.append((time.perf_counter() - began) * 1e6)
+    limiter.close()
+    results.put((allowed, latencies))
+
+
+def contention(make_limiter, workers: int, keys, checks: int) -> tuple:
+    """(allowed per key, p50 µs, p99 µs, checks/s overall) with `workers` processes on shared keys"""
+    start = multiprocessing.Barrier(workers + 1)
+    results = multiprocessing.Queue()
+    now = 1_000_000.0  # one instant for every worker, so no window rolls over mid-test
+    processes = [
+        multiprocessing.Process(target=contend, args=(make_limiter, keys, checks, now, start, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    start.wait()
+    began = time.perf_counter()
+    totals = dict.fromkeys(keys, 0)
+    latencies = []
+    for _ in processes:
+        allowed, worker_latencies = results.get()
+        for key, count in allowed.items():
+            totals[key] += count
+        latencies.extend(worker_latencies)
+    elapsed = time.perf_counter() - began
+    for process in processes:
+        process.join()
+    return totals, percentile(latencies, 50), percentile(latencies, 99), len(latencies) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=100_000)
+    parser.add_argument("--requests-per-client", type=int, default=30)
+    parser.add_argument("--limit", type=int, default=60)
+    parser.add_argument("--window", type=float, default=60)
+    parser.add_argument("--backends", nargs="+", default=["memory", "shm", "sqlite"],
+                        choices=["memory", "shm", "sqlite", "redis"])
+    parser.add_argument("--backend-checks", type=int, default=200_000, help="Checks timed per backend")
+    parser.add_argument("--workers", type=int, default=8, help="Processes in the contention test")
+    parser.add_argument("--hot-keys", type=int, default=4)
+    parser.add_argument("--contention-checks", type=int, default=20_000, help="Checks per worker")
+    parser.add_argument("--redis-url", help="Redis server for the redis backend (default: in-process fakeredis)")
+    args = parser.parse_args()
+
+    keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(args.clients)]
+    traffic = keys * args.requests_per_client
+    random.shuffle(traffic)
+    # Spread all traffic over one window so nothing expires mid-run
+    step = args.window / len(traffic)
+
+    legacy_ns, legacy_mem, _ = run(lambda: TimestampListLimiter(args.limit, args.window), traffic, step)
+    sliding_ns, sliding_mem, limiter = run(
+        lambda: SlidingWindowRateLimiter(args.limit, args.window, sweep_interval=0), traffic, step
+    )
+
+    print(f"{len(traffic):,} checks over {args.clients:,} clients ({args.requests_per_client} each)")
+    print(f"  timestamp lists:  {legacy_ns:>7.0f} ns/check  {legacy_mem / 1e6:>7.1f} MB")
+    print(f"  sliding window:   {sliding_ns:>7.0f} ns/check  {sliding_mem / 1e6:>7.1f} MB")
+
+    began = time.perf_counter()
+    evicted = limiter.sweep(now=args.window * 3)
+    print(f"  sweep after idle: evicted {evicted:,} clients in {(time.perf_counter() - began) * 1000:.1f} ms")
+
+    workdir = tempfile.mkdtemp(prefix="coach-rate-limit-")
+    sample = traffic[:args.backend_checks]
+    print(f"\nBackends, {len(sample):,} checks over the same clients")
+    for backend in args.backends:
+        directory = tempfile.mkdtemp(dir=workdir)
+        ns = backend_cost(lambda: make_backend(backend, args.limit, args.window, directory, args.redis_url),
+                          sample, step)
+        note = " (fakeredis, in-process)" if backend == "redis" and not args.redis_url else ""
+        print(f"  {backend:<8} {ns / 1000:7.1f} µs/check{note}")
+
+    keys = [f"hot-{i}" for i in range(args.hot_keys)]
+    print(f"\nContention: {args.workers} processes x {args.contention_checks:,} checks on {args.hot_keys} keys, "
+          f"limit {args.limit} per key")
+    print(f"  {'backend':<8} {'allowed per key':>18} {'p50 µs':>8} {'p99 µs':>8} {'checks/s':>10}")
+    for backend in args.backends:
+        if backend == "redis" and not args.redis_url:
+            continue  # fakeredis lives inside one process
+        directory = tempfile.mkdtemp(dir=workdir)
+        if backend == "redis":
+            keys = [f"hot-{time.time_ns()}-{i}" for i in range(args.hot_keys)]  # fresh on a long-lived server
+        totals, p50, p99, rate = contention(
+            lambda: make_backend(backend, args.limit, 3600, directory, args.redis_url),
+            args.workers, keys, args.contention_checks,
+        )
+        expected = args.limit * (args.workers if backend == "memory" else 1)
+        counts = sorted(set(totals.values()))
+        allowed = str(counts[0]) if len(counts) == 1 else f"{counts[0]}-{counts[-1]}"
+        print(f"  {backend:<8} {allowed + f' (expect {expected})':>18} {p50:8.1f} {p99:8.1f} {rate:10,.0f}")
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Full-text search latency at scale (api/search.py).
+
+Builds a schema-version-3 database of `--messages` messages whose words follow
+a Zipf distribution (so some terms are in most messages and others in a
+handful), times the version 4 migration that creates and fills the FTS5
+index, then reports p50/p99 latency of first-page queries across term
+frequencies, both sort orders and a conversation filter, plus the `LIKE`
+scan they replace. It also measures what the index triggers cost each write.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_search --messages 5000000
+    python -m benchmarks.bench_search --messages 200000 --db /tmp/search.db --keep
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from api import migrations
+from api.search import search
+from benchmarks.common import percentile
+
+BUILD_BATCH = 100_000
+VOCABULARY = 20_000
+COMMON = ["sleep", "work", "stress", "focus", "feel", "today", "help", "time", "week", "anxious"]
+
+
+def words(count: int) -> list:
+    """Pseudo-words ranked by frequency, with a few real ones at the top for readable queries"""
+    rng = random.Random(1)
+    letters = "abcdefghijklmnoprstuvw"
+    made = {"".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(count * 2)}
+    return COMMON + sorted(made)[:count - len(COMMON)]
+
+
+def build(conn: sqlite3.Connection, messages: int, conversations: int, seed: int):
+    for version, step in enumerate(migrations.MIGRATIONS[:3], start=1):
+        step(conn)
+        conn.execute(f"PRAGMA user_version = {version}")
+    vocabulary = words(VOCABULARY)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]  # Zipf
+    rng = random.Random(seed)
+    conn.executemany(
+        "INSERT INTO conversations (conversation_id) VALUES (?)",
+        ((f"conv-{i:07d}",) for i in range(conversations)),
+    )
+    began = time.perf_counter()
+    written = 0
+    while written < messages:
+        count = min(BUILD_BATCH, messages - written)
+        texts = [" ".join(rng.choices(vocabulary, weights, k=rng.randint(8, 40))) for _ in range(count)]
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, role, content, token_count) VALUES (?, ?, ?, ?)",
+            ((f"conv-{rng.randrange(conversations):07d}", "user" if i % 2 else "assistant", text, 30)
+             for i, text in enumerate(texts)),
+        )
+        conn.commit()
+        written += count
+        print(f"\r  inserted {written:,} / {messages:,} messages ({time.perf_counter() - began:.0f} s)", end="")
+    print()
+    return vocabulary
+
+
+def insert_rate(conn: sqlite3.Connection, rows: int = 5000, batch: int = 50) -> float:
+    """Messages per second in small transactions, as the write-behind queue commits them (deleted afterwards)"""
+    first = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+    began = time.perf_counter()
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, role, content, token_count) VALUES ('conv-0000000', 'user', ?, 30)",
+            ((f"sleep better tonight by writing down worries {start + i}",) for i in range(batch)),
+        )
+        conn.commit()
+    elapsed = time.perf_counter() - began
+    conn.execute("DELETE FROM messages WHERE id > ?", (first,))
+    conn.commit()
+    return rows / elapsed
+
+
+def timed(func, samples: int) -> tuple:
+    latencies = []
+    for _ in range(samples):
+        began = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - began) * 1000)
+    return percentile(latencies, 50), percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5_000_000)
+    parser.add_argument("--conversations", type=int, default=50_000)
+    parser.add_argument("--samples", type=int, default=50, help="Runs timed per query")
+    parser.add_argument("--db", help="Database file (default: a temporary file)")
+    parser.add_argument("--keep", action="store_true", help="Keep the database file afterwards")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="coach-bench-"), "search.db")
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -64000")
+
+    print(f"Building {args.messages:,} messages over {args.conversations:,} conversations in {path}")
+    vocabulary = build(conn, args.messages, args.conversations, args.seed)
+    before = insert_rate(conn)
+
+    began = time.perf_counter()
+    migrations.migrate(conn)
+    print(f"Schema version 4 (index {args.messages:,} messages) in {time.perf_counter() - began:.1f} s, "
+          f"database {os.path.getsize(path) / 2**20:,.0f} MiB")
+    after = insert_rate(conn)
+    print(f"Inserts in 50-row transactions: {before:,.0f} messages/s without the index, {after:,.0f}/s with it")
+
+    def matches(term: str) -> int:
+        return conn.execute("SELECT count(*) FROM messages_fts WHERE messages_fts MATCH ?", (f'"{term}"',)).fetchone()[0]
+
+    common, middle, rare = vocabulary[0], vocabulary[200], vocabulary[-1]
+    cases = [
+        (f"rare ({matches(rare):,} matches)", rare, {}),
+        (f"medium ({matches(middle):,} matches)", middle, {}),
+        (f"common ({matches(common):,} matches)", common, {}),
+        ("common, recent", common, {"sort": "recent"}),
+        ("two words", f"{vocabulary[1]} {vocabulary[50]}", {}),
+        ("prefix", middle[:3] + "*", {}),
+        ("common, one conversation", common, {"conversation_id": "conv-0000001"}),
+    ]
+    print(f"\n{'query':<34} {'p50 ms':>9} {'p99 ms':>9}")
+    for label, query, options in cases:
+        p50, p99 = timed(lambda: search(conn, query, limit=21, **options), args.samples)
+        print(f"{label:<34} {p50:9.2f} {p99:9.2f}")
+    # Ranking needs every match, so a LIKE search reads the whole table
+    p50, p99 = timed(
+        lambda: conn.execute("SELECT id FROM messages WHERE content LIKE ?", (f"%{rare}%",)).fetchall(),
+        max(3, args.samples // 10),
+    )
+    print(f"{'LIKE scan, rare (before)':<34} {p50:9.2f} {p99:9.2f}")
+
+    conn.close()
+    if not args.keep and not args.db:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
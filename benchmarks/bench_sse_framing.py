@@ -0,0 +1,131 @@
+"""
+Wire cost of the /api/chat SSE framings (api/sse.py).
+
+Runs the API under one uvicorn worker with a fake upstream that streams
+`--tokens` short deltas `--token-delay` seconds apart, opens `--streams`
+concurrent chats and compares one event per token (the original framing)
+with coalesced events at each `--intervals` flush window, in JSON and in the
+compact format. Reported per framing:
+
+  bytes/stream   response body bytes on the wire
+  sends/stream   body messages handed to the server, each one socket write
+  CPU µs/token   server process CPU time per upstream token
+  ttft / total   client-side p50 time to first content and to the end
+
+Usage (from the repository root):
+    python -m benchmarks.bench_sse_framing --streams 100 --tokens 200
+    python -m benchmarks.bench_sse_framing --token-delay 0.002 --intervals 20,50
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+from benchmarks.common import FakeAsyncOpenAI, percentile, prepare_env, run_server
+
+
+def create_app(framing: str, interval_ms: float, tokens: int, token_delay: float, first_token_delay: float):
+    """The API with a fake upstream, counting chat response bytes and sends (runs in the server process)"""
+    os.environ["SSE_FRAMING"] = framing
+    os.environ["SSE_FLUSH_INTERVAL_MS"] = str(interval_ms)
+    logging.getLogger("api").setLevel(logging.WARNING)  # one INFO line per chat otherwise
+    from api import index
+
+    index.client = FakeAsyncOpenAI(tokens, token_delay, first_token_delay)
+    counters = {"sends": 0, "bytes": 0}
+
+    async def app(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/bench/stats":
+            body = f'{{"sends": {counters["sends"]}, "bytes": {counters["bytes"]}, ' \
+                   f'"cpu": {time.process_time()}}}'.encode()
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        if scope["type"] != "http" or scope["path"] != "/api/chat":
+            await index.app(scope, receive, send)
+            return
+
+        async def counted(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                counters["sends"] += 1
+                counters["bytes"] += len(message["body"])
+            await send(message)
+
+        await index.app(scope, receive, counted)
+
+    return app
+
+
+async def one_stream(http: httpx.AsyncClient, base_url: str, compact: bool, index: int) -> tuple:
+    """(ttft, total) seconds for one chat; TTFT is the first content event"""
+    started = time.perf_counter()
+    ttft = None
+    event = None
+    async with http.stream(
+        "POST",
+        f"{base_url}/api/chat",
+        params={"format": "compact" if compact else "json"},
+        json={"message": f"benchmark message {index}"},
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                event = None
+            elif line.startswith("event:"):
+                event = line[6:].strip()
+            elif ttft is None and line.startswith("data:"):
+                if (compact and event is None) or (not compact and '"content"' in line):
+                    ttft = time.perf_counter() - started
+    return ttft or 0.0, time.perf_counter() - started
+
+
+async def run(base_url: str, streams: int, compact: bool) -> dict:
+    limits = httpx.Limits(max_connections=streams, max_keepalive_connections=streams)
+    async with httpx.AsyncClient(limits=limits, timeout=300) as http:
+        before = (await http.get(f"{base_url}/bench/stats")).json()
+        results = await asyncio.gather(*(one_stream(http, base_url, compact, i) for i in range(streams)))
+        after = (await http.get(f"{base_url}/bench/stats")).json()
+    return {
+        "sends": (after["sends"] - before["sends"]) / streams,
+        "bytes": (after["bytes"] - before["bytes"]) / streams,
+        "cpu": after["cpu"] - before["cpu"],
+        "ttft": percentile([r[0] for r in results], 50),
+        "total": percentile([r[1] for r in results], 50),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=100, help="Concurrent chats")
+    parser.add_argument("--tokens", type=int, default=200, help="Deltas per fake completion")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between fake deltas")
+    parser.add_argument("--first-token-delay", type=float, default=0.1)
+    parser.add_argument("--intervals", default="20,50", help="Comma-separated flush windows in ms")
+    args = parser.parse_args()
+
+    prepare_env()
+    framings = [("token", "token", 0, False)]
+    for interval in (float(x) for x in args.intervals.split(",")):
+        framings.append((f"coalesced {interval:.0f} ms", "coalesced", interval, False))
+        framings.append((f"compact {interval:.0f} ms", "coalesced", interval, True))
+
+    print(f"{args.streams} streams x {args.tokens} deltas, {args.token_delay * 1000:.0f} ms apart")
+    print(f"{'framing':<18} {'bytes/stream':>13} {'sends/stream':>13} {'CPU µs/token':>13} "
+          f"{'ttft p50':>9} {'total p50':>10}")
+    for label, framing, interval, compact in framings:
+        with run_server(create_app, framing, interval, args.tokens, args.token_delay,
+                        args.first_token_delay) as base_url:
+            asyncio.run(run(base_url, min(args.streams, 10), compact))  # warm up
+            r = asyncio.run(run(base_url, args.streams, compact))
+        per_token = r["cpu"] / (args.streams * args.tokens) * 1e6
+        print(f"{label:<18} {r['bytes']:>13,.0f} {r['sends']:>13,.1f} {per_token:>13.1f} "
+              f"{r['ttft'] * 1000:>7.0f}ms {r['total'] * 1000:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks run from the repository root as modules, e.g.:
+    python -m benchmarks.bench_concurrent_streams
+
+They never call the real OpenAI API: the upstream client is replaced with an
+in-process fake so results measure this service, not the network.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import List, Optional
+
+
+def prepare_env(db_path: Optional[str] = None, **overrides) -> str:
+    """
+    Configure environment variables before `api.index` is imported.
+
+    Returns the database path in use.
+    """
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="coach-bench-"), "bench.db")
+    os.environ["DB_PATH"] = db_path
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    for key, value in overrides.items():
+        os.environ[key] = str(value)
+    return db_path
+
+
+class FakeAsyncOpenAI:
+    """
+    Minimal stand-in for `openai.AsyncOpenAI` covering chat completions.
+
+    Streams `tokens` deltas, sleeping `first_token_delay` before the first one
+    and `token_delay` between the rest, without ever blocking the event loop.
+    """
+
+    def __init__(self, tokens: int = 50, token_delay: float = 0.01, first_token_delay: float = 0.2):
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        self.calls += 1
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.first_token_delay + self.token_delay * self.tokens)
+        message = SimpleNamespace(content="word " * self.tokens)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message)],
+            usage=SimpleNamespace(prompt_tokens=0, completion_tokens=self.tokens),
+        )
+
+    async def _stream(self):
+        await asyncio.sleep(self.first_token_delay)
+        for i in range(self.tokens):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            delta = SimpleNamespace(content="word ")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    async def close(self):
+        pass
+
+
+def free_port() -> int:
+    """Return an unused localhost TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(app_factory, factory_args: tuple, port: int):
+    import uvicorn
+
+    app = app_factory(*factory_args)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+@contextmanager
+def run_server(app_factory, *factory_args, port: Optional[int] = None):
+    """
+    Run an ASGI app under a single uvicorn worker in a child process.
+
+    `app_factory(*factory_args)` is called in the child and must return the
+    app; it has to be a module-level function so it can be pickled. Running
+    the server in its own process keeps the load generator off its GIL.
+    """
+    port = port or free_port()
+    process = multiprocessing.get_context("spawn").Process(
+        target=_serve, args=(app_factory, factory_args, port), daemon=True
+    )
+    process.start()
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                break
+        except OSError:
+            if time.monotonic() > deadline or not process.is_alive():
+                process.terminate()
+                raise RuntimeError("uvicorn did not start in time")
+            time.sleep(0.05)
+    try:
+        yield base_url
+    finally:
+        process.terminate()
+        process.join(timeout=10)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `values` (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
@@ -0,0 +1,138 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Serves `POST /v1/chat/completions` in both streaming (SSE chunks ending with
+`data: [DONE]`) and non-streaming modes, with a configurable first-token
+delay, token rate and error injection, so the real `AsyncOpenAI` client and
+HTTP path can be exercised without spending tokens. Point the API at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Usage (from the repository root):
+    python -m benchmarks.fake_openai --port 9100 --first-token-delay 0.2 --token-rate 50 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_app(
+    tokens: int = 50,
+    first_token_delay: float = 0.2,
+    token_rate: float = 50.0,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    seed: int = 0,
+) -> FastAPI:
+    """
+    Build the fake API.
+
+    `token_rate` is tokens per second after the first (0 sends them all at
+    once). `error_rate` and `rate_limit_rate` are the fractions of requests
+    answered with 500 and 429.
+    """
+    app = FastAPI(title="Fake OpenAI")
+    rng = random.Random(seed)
+    state = {"requests": 0, "streams": 0, "errors": 0, "rate_limited": 0, "tokens": 0}
+    token_gap = 1 / token_rate if token_rate > 0 else 0.0
+
+    def error_response():
+        roll = rng.random()
+        if roll < rate_limit_rate:
+            state["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"Retry-After": "1"},
+                content={"error": {"message": "Rate limit reached (injected)", "type": "requests", "code": "rate_limit_exceeded"}},
+            )
+        if roll < rate_limit_rate + error_rate:
+            state["errors"] += 1
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "Internal error (injected)", "type": "server_error", "code": None}},
+            )
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        state["requests"] += 1
+        error = error_response()
+        if error is not None:
+            return error
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = body.get("model", "fake-model")
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 + 4 for m in body.get("messages", []))
+        state["tokens"] += tokens
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_token_delay + token_gap * max(tokens - 1, 0))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "word " * tokens},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": tokens, "total_tokens": prompt_tokens + tokens},
+            }
+
+        state["streams"] += 1
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+        async def stream():
+            await asyncio.sleep(first_token_delay)
+            yield chunk({"role": "assistant", "content": ""})
+            for i in range(tokens):
+                if i and token_gap:
+                    await asyncio.sleep(token_gap)
+                yield chunk({"content": "word "})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return state
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per completion")
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=50, help="Tokens per second after the first")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    args = parser.parse_args()
+    app = create_app(args.tokens, args.first_token_delay, args.token_rate, args.error_rate, args.rate_limit_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+End-to-end load test: the real API against a local fake OpenAI server.
+
+Starts benchmarks.fake_openai and the API (one uvicorn worker, temporary
+database, rate limiting off) in child processes, with OPENAI_BASE_URL pointing
+at the fake, so the whole path runs: HTTP, the AsyncOpenAI client, SSE
+streaming, history loads and group-committed writes.
+
+Each scenario runs a closed loop of `--concurrency` clients until
+`--requests` requests are done:
+
+  chat           POST /api/chat, streamed (TTFT = first content event)
+  webhook        POST /api/webhook
+  conversations  GET /api/conversations/{id} over the conversations used above
+
+Requests rotate over `--conversations` conversation IDs, so reads and writes
+contend on the same rows. Reported per run: p50/p95/p99 latency, TTFT,
+requests (streams) per second, errors, and SQLite operation timings taken
+from the API's /metrics as a measure of database contention.
+
+Results are written as JSON (`--output`) and can be compared with an earlier
+run, e.g. one from another commit (`--compare`).
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --scenarios chat,webhook,conversations --concurrency 10,50 \\
+        --requests 500 --output results.json
+    python -m benchmarks.load_test --compare results.json --output results-new.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks import fake_openai
+from benchmarks.common import percentile, prepare_env, run_server
+
+SCENARIOS = ("chat", "webhook", "conversations")
+
+_METRIC_LINE = re.compile(r'^db_query_duration_seconds_(bucket|sum|count)\{operation="([^"]+)"(?:,le="([^"]+)")?\} (\S+)$')
+
+
+def create_api_app():
+    """Build the real API app (runs in the server process, configured through the environment)"""
+    from api import index
+
+    # Per-request INFO lines from the HTTP clients would dominate the output
+    logging.getLogger().setLevel(logging.WARNING)
+    return index.app
+
+
+def summarize_ms(values: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 50) * 1000, 2),
+        "p95": round(percentile(values, 95) * 1000, 2),
+        "p99": round(percentile(values, 99) * 1000, 2),
+        "mean": round(sum(values) / len(values) * 1000, 2),
+        "max": round(max(values) * 1000, 2),
+    }
+
+
+# Database timings from /metrics
+
+def parse_db_metrics(text: str) -> Dict[str, dict]:
+    """operation -> {"buckets": {le: cumulative count}, "sum": s, "count": n}"""
+    operations: Dict[str, dict] = defaultdict(lambda: {"buckets": {}, "sum": 0.0, "count": 0})
+    for line in text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if not match:
+            continue
+        kind, operation, le, value = match.groups()
+        if kind == "bucket":
+            operations[operation]["buckets"][float(le)] = float(value)
+        else:
+            operations[operation][kind] = float(value)
+    return operations
+
+
+def db_delta(before: Dict[str, dict], after: Dict[str, dict]) -> Dict[str, dict]:
+    """Count, mean and approximate p95 (bucket upper bound) per operation during a run"""
+    result = {}
+    for operation, end in after.items():
+        start = before.get(operation, {"buckets": {}, "sum": 0.0, "count": 0})
+        count = end["count"] - start["count"]
+        if count <= 0:
+            continue
+        p95 = None
+        for bound in sorted(end["buckets"]):
+            if end["buckets"][bound] - start["buckets"].get(bound, 0) >= 0.95 * count:
+                p95 = bound
+                break
+        result[operation] = {
+            "count": int(count),
+            "mean_ms": round((end["sum"] - start["sum"]) / count * 1000, 3),
+            "p95_ms": None if p95 in (None, float("inf")) else round(p95 * 1000, 3),
+        }
+    return result
+
+
+# Scenarios
+
+async def chat_request(http: httpx.AsyncClient, conversation_id: str, index: int) -> dict:
+    started = time.perf_counter()
+    ttft = None
+    error = False
+    async with http.stream(
+        "POST", "/api/chat", json={"message": f"load test message {index}", "conversation_id": conversation_id}
+    ) as response:
+        if response.status_code != 200:
+            await response.aread()
+            error = True
+        else:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                if "error" in event:
+                    error = True
+                elif ttft is None and event.get("content"):
+                    ttft = time.perf_counter() - started
+    return {"latency": time.perf_counter() - started, "ttft": ttft, "error": error}
+
+
+async def webhook_request(http: httpx.AsyncClient, conversation_id: str, index: int) -> dict:
+    started = time.perf_counter()
+    response = await http.post(
+        "/api/webhook", json={"message": f"load test message {index}", "conversation_id": conversation_id}
+    )
+    return {"latency": time.perf_counter() - started, "error": response.status_code != 200}
+
+
+async def conversation_request(http: httpx.AsyncClient, conversation_id: str, index: int) -> dict:
+    started = time.perf_counter()
+    response = await http.get(f"/api/conversations/{conversation_id}")
+    return {"latency": time.perf_counter() - started, "error": response.status_code != 200}
+
+
+REQUESTS = {"chat": chat_request, "webhook": webhook_request, "conversations": conversation_request}
+
+
+async def run_scenario(base_url: str, scenario: str, concurrency: int, requests: int, conversations: List[str]) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    send = REQUESTS[scenario]
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as http:
+        before = parse_db_metrics((await http.get("/metrics")).text)
+        results = []
+        next_index = 0
+
+        async def client():
+            nonlocal next_index
+            while next_index < requests:
+                index = next_index
+                next_index += 1
+                try:
+                    results.append(await send(http, conversations[index % len(conversations)], index))
+                except httpx.HTTPError:
+                    results.append({"latency": 0.0, "error": True})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        duration = time.perf_counter() - started
+        after = parse_db_metrics((await http.get("/metrics")).text)
+
+    ok = [r for r in results if not r["error"]]
+    summary = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(ok) / duration, 2),
+        "latency_ms": summarize_ms([r["latency"] for r in ok]),
+        "db": db_delta(before, after),
+    }
+    if scenario == "chat":
+        summary["ttft_ms"] = summarize_ms([r["ttft"] for r in ok if r["ttft"] is not None])
+    return summary
+
+
+async def seed_conversations(base_url: str, conversations: List[str]):
+    """Give every conversation a first exchange so reads have something to load"""
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as http:
+        for start in range(0, len(conversations), 20):
+            await asyncio.gather(*(
+                webhook_request(http, conversation_id, 0) for conversation_id in conversations[start:start + 20]
+            ))
+
+
+# Reporting
+
+def print_result(result: dict):
+    latency = result["latency_ms"]
+    line = (
+        f"{result['scenario']:<14} {result['concurrency']:>5} {result['requests']:>7} {result['errors']:>6} "
+        f"{result['throughput_rps']:>9.1f} {latency.get('p50', 0):>9.1f} {latency.get('p95', 0):>9.1f} "
+        f"{latency.get('p99', 0):>9.1f}"
+    )
+    if result.get("ttft_ms"):
+        line += f" {result['ttft_ms']['p50']:>9.1f} {result['ttft_ms']['p95']:>9.1f}"
+    print(line)
+    for operation, stats in sorted(result["db"].items()):
+        p95 = f"{stats['p95_ms']} ms" if stats["p95_ms"] is not None else "n/a"
+        print(f"{'':<16}db {operation:<20} n={stats['count']:<7} mean {stats['mean_ms']:.3f} ms  p95 <= {p95}")
+
+
+def compare(baseline: dict, current: dict):
+    """Print relative changes against an earlier results file"""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} ({baseline['meta'].get('timestamp')}):")
+    print(f"{'scenario':<14} {'conc':>5} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'ttft p50':>9}")
+
+    def change(old: Optional[float], new: Optional[float]) -> str:
+        if not old or new is None:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    for result in current["results"]:
+        old = previous.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+        cells = [change(old["throughput_rps"], result["throughput_rps"])]
+        cells += [change(old["latency_ms"].get(p), result["latency_ms"].get(p)) for p in ("p50", "p95", "p99")]
+        cells.append(change(old.get("ttft_ms", {}).get("p50"), result.get("ttft_ms", {}).get("p50")))
+        print(f"{result['scenario']:<14} {result['concurrency']:>5} " + " ".join(f"{c:>9}" for c in cells))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated: chat,webhook,conversations")
+    parser.add_argument("--concurrency", default="10,50", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario and level")
+    parser.add_argument("--conversations", type=int, default=50, help="Distinct conversation IDs to rotate over")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens per fake completion")
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="Fake upstream TTFT in seconds")
+    parser.add_argument("--token-rate", type=float, default=100, help="Fake upstream tokens per second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream calls failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of upstream calls failing with 429")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+    conversations = [f"load-{i}" for i in range(args.conversations)]
+
+    fake_config = (args.tokens, args.first_token_delay, args.token_rate, args.error_rate, args.rate_limit_rate)
+    results = []
+    with run_server(fake_openai.create_app, *fake_config) as fake_url:
+        db_path = prepare_env(
+            OPENAI_BASE_URL=f"{fake_url}/v1",
+            OPENAI_API_KEY="sk-load-test",
+            WEBHOOK_CACHE_ENABLED="false",  # measure upstream calls, not cache hits
+        )
+        with run_server(create_api_app) as base_url:
+            asyncio.run(seed_conversations(base_url, conversations))
+            print(f"{'scenario':<14} {'conc':>5} {'reqs':>7} {'errors':>6} {'req/s':>9} {'p50 ms':>9} "
+                  f"{'p95 ms':>9} {'p99 ms':>9} {'ttft p50':>9} {'ttft p95':>9}")
+            for scenario in scenarios:
+                for level in levels:
+                    result = asyncio.run(run_scenario(base_url, scenario, level, args.requests, conversations))
+                    print_result(result)
+                    results.append(result)
+            upstream = httpx.get(f"{fake_url}/stats").json()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": db_path,
+            "config": vars(args),
+            "upstream": upstream,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
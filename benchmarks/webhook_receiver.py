@@ -0,0 +1,57 @@
+"""
+Local stand-in for an integration's webhook endpoint.
+
+Accepts job results POSTed by the API's webhook job workers and prints them.
+`--fail-first N` answers the first N deliveries with 503 to exercise the
+retry/backoff path.
+
+Usage (from the repository root):
+    python -m benchmarks.webhook_receiver --port 9000 --fail-first 2
+
+then submit a job:
+    curl -X POST http://localhost:8000/api/webhook -H "Content-Type: application/json" \\
+      -d '{"message": "Hi", "webhook_url": "http://localhost:9000/hook"}'
+"""
+
+import argparse
+import json
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_app(fail_first: int = 0) -> FastAPI:
+    app = FastAPI(title="Webhook receiver")
+    state = {"calls": 0, "deliveries": []}
+
+    @app.post("/hook")
+    async def hook(request: Request):
+        state["calls"] += 1
+        if state["calls"] <= fail_first:
+            print(f"[{time.strftime('%X')}] attempt {state['calls']}: answering 503")
+            return JSONResponse(status_code=503, content={"error": "try again"})
+        payload = await request.json()
+        state["deliveries"].append(payload)
+        print(f"[{time.strftime('%X')}] delivery: {json.dumps(payload)}")
+        return {"received": True}
+
+    @app.get("/deliveries")
+    async def deliveries():
+        return state
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer the first N deliveries with 503")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.fail_first), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
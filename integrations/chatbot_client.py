@@ -0,0 +1,366 @@
+"""
+Shared Mental Coach AI API client for the integrations.
+
+Every bot message used to open a fresh TCP/TLS connection to CHATBOT_API_URL
+through a bare `requests.post`. `ChatbotClient` keeps one `requests.Session`
+with a keep-alive connection pool for the life of the process, applies
+separate connect/read timeouts, and caps how many API calls run at once so a
+burst of events cannot pile up unbounded requests on the API.
+
+`AsyncChatbotClient` is the asyncio counterpart for bots running on an
+event loop (Discord): blocking calls there would freeze the gateway
+connection. It also limits concurrent calls per guild, so one busy server
+cannot take every slot.
+
+Usage:
+    from chatbot_client import ChatbotClient
+
+    chatbot = ChatbotClient()
+    reply = chatbot.reply("I'm feeling stressed", "slack-U123")
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # only needed by AsyncChatbotClient (installed with discord.py)
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CHATBOT_API_URL = os.getenv("CHATBOT_API_URL", "http://localhost:8000")
+CHATBOT_API_KEY = os.getenv("CHATBOT_API_KEY")  # Optional
+CHATBOT_CONNECT_TIMEOUT = float(os.getenv("CHATBOT_CONNECT_TIMEOUT", "5"))
+CHATBOT_READ_TIMEOUT = float(os.getenv("CHATBOT_READ_TIMEOUT", "30"))
+CHATBOT_POOL_SIZE = int(os.getenv("CHATBOT_POOL_SIZE", "10"))  # keep-alive connections
+CHATBOT_MAX_CONCURRENCY = int(os.getenv("CHATBOT_MAX_CONCURRENCY", "10"))  # API calls in flight
+CHATBOT_MAX_CONCURRENCY_PER_GUILD = int(os.getenv("CHATBOT_MAX_CONCURRENCY_PER_GUILD", "4"))  # per Discord server
+
+# Replies shown to users when the API cannot answer
+NO_RESPONSE = "I'm sorry, I couldn't generate a response."
+RATE_LIMITED = "I'm receiving too many requests right now. Please try again in a moment."
+API_ERROR = "I'm experiencing some technical difficulties. Please try again later."
+TIMEOUT = "The request took too long. Please try again with a shorter message."
+CONNECTION_ERROR = "I'm having trouble connecting right now. Please try again later."
+UNEXPECTED_ERROR = "An unexpected error occurred. Please try again later."
+
+
+class ChatbotClient:
+    """Thread-safe client for the chatbot API over a pooled keep-alive session"""
+
+    def __init__(
+        self,
+        base_url: str = CHATBOT_API_URL,
+        api_key: Optional[str] = CHATBOT_API_KEY,
+        connect_timeout: float = CHATBOT_CONNECT_TIMEOUT,
+        read_timeout: float = CHATBOT_READ_TIMEOUT,
+        pool_size: int = CHATBOT_POOL_SIZE,
+        max_concurrency: int = CHATBOT_MAX_CONCURRENCY,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Content-Type"] = "application/json"
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def reply(self, message: str, conversation_id: str) -> str:
+        """
+        Get the coach's reply to a message.
+
+        Never raises: API failures are logged and turned into a short
+        user-facing explanation.
+        """
+        try:
+            with self._slots:
+                # Use webhook endpoint for synchronous responses
+                response = self.session.post(
+                    f"{self.base_url}/api/webhook",
+                    json={
+                        "message": message,
+                        "conversation_id": conversation_id
+                    },
+                    timeout=self.timeout
+                )
+
+            if response.status_code == 200:
+                return response.json().get("response", NO_RESPONSE)
+            elif response.status_code == 429:
+                return RATE_LIMITED
+            else:
+                logger.error(f"Chatbot API error: {response.status_code} - {response.text}")
+                return API_ERROR
+
+        except requests.exceptions.Timeout:
+            logger.error("Chatbot API timeout")
+            return TIMEOUT
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Chatbot API request error: {e}")
+            return CONNECTION_ERROR
+        except Exception as e:
+            logger.error(f"Unexpected error calling chatbot API: {e}")
+            return UNEXPECTED_ERROR
+
+    def stream_reply(self, message: str, conversation_id: str) -> Iterator[str]:
+        """
+        Yield the coach's reply in pieces as `/api/chat` streams it.
+
+        Like `reply()`, never raises: on failure the user-facing explanation
+        is yielded as the last piece.
+        """
+        received = False
+        error = None
+        try:
+            with self._slots:
+                with self.session.post(
+                    f"{self.base_url}/api/chat",
+                    json={
+                        "message": message,
+                        "conversation_id": conversation_id
+                    },
+                    headers={"Accept": "text/event-stream"},
+                    timeout=self.timeout,
+                    stream=True
+                ) as response:
+                    if response.status_code == 429:
+                        error = RATE_LIMITED
+                    elif response.status_code != 200:
+                        logger.error(f"Chatbot API error: {response.status_code} - {response.text}")
+                        error = API_ERROR
+                    else:
+                        for event in _sse_events(response):
+                            if event.get("error"):
+                                logger.error(f"Chatbot API stream error: {event['error']}")
+                                error = API_ERROR
+                                break
+                            if event.get("content"):
+                                received = True
+                                yield event["content"]
+                            if event.get("done"):
+                                break
+
+        except requests.exceptions.Timeout:
+            logger.error("Chatbot API timeout")
+            error = TIMEOUT
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Chatbot API request error: {e}")
+            error = CONNECTION_ERROR
+        except Exception as e:
+            logger.error(f"Unexpected error calling chatbot API: {e}")
+            error = UNEXPECTED_ERROR
+
+        if error:
+            yield f"\n\n{error}" if received else error
+        elif not received:
+            yield NO_RESPONSE
+
+    def health(self) -> Optional[int]:
+        """Status code of the API health check, or None if it is unreachable"""
+        try:
+            return self.session.get(f"{self.base_url}/api/health", timeout=(self.timeout[0], 5)).status_code
+        except requests.exceptions.RequestException:
+            return None
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+
+class AsyncChatbotClient:
+    """Asyncio client for the chatbot API over a pooled aiohttp session"""
+
+    def __init__(
+        self,
+        base_url: str = CHATBOT_API_URL,
+        api_key: Optional[str] = CHATBOT_API_KEY,
+        connect_timeout: float = CHATBOT_CONNECT_TIMEOUT,
+        read_timeout: float = CHATBOT_READ_TIMEOUT,
+        pool_size: int = CHATBOT_POOL_SIZE,
+        max_concurrency: int = CHATBOT_MAX_CONCURRENCY,
+        max_concurrency_per_guild: int = CHATBOT_MAX_CONCURRENCY_PER_GUILD,
+    ):
+        if aiohttp is None:
+            raise RuntimeError("AsyncChatbotClient requires aiohttp")
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.max_concurrency_per_guild = max_concurrency_per_guild
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # guild id -> (semaphore, calls holding or waiting for it)
+        self._guild_slots: Dict[str, list] = {}
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    @property
+    def session(self) -> "aiohttp.ClientSession":
+        """Shared session, created on first use inside the running event loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+            )
+        return self._session
+
+    @asynccontextmanager
+    async def _slot(self, guild_id: Optional[str]):
+        """Hold a per-guild slot (if any) and then a global one"""
+        if guild_id is None:
+            async with self._slots:
+                yield
+            return
+        entry = self._guild_slots.setdefault(guild_id, [asyncio.Semaphore(self.max_concurrency_per_guild), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._guild_slots[guild_id]
+
+    async def reply(self, message: str, conversation_id: str, guild_id: Optional[str] = None) -> str:
+        """
+        Get the coach's reply to a message.
+
+        Never raises: API failures are logged and turned into a short
+        user-facing explanation.
+        """
+        try:
+            async with self._slot(guild_id):
+                # Use webhook endpoint for synchronous responses
+                async with self.session.post(
+                    f"{self.base_url}/api/webhook",
+                    json={
+                        "message": message,
+                        "conversation_id": conversation_id
+                    }
+                ) as response:
+                    if response.status == 200:
+                        return (await response.json()).get("response", NO_RESPONSE)
+                    elif response.status == 429:
+                        return RATE_LIMITED
+                    else:
+                        logger.error(f"Chatbot API error: {response.status} - {await response.text()}")
+                        return API_ERROR
+
+        except asyncio.TimeoutError:
+            logger.error("Chatbot API timeout")
+            return TIMEOUT
+        except aiohttp.ClientError as e:
+            logger.error(f"Chatbot API request error: {e}")
+            return CONNECTION_ERROR
+        except Exception as e:
+            logger.error(f"Unexpected error calling chatbot API: {e}")
+            return UNEXPECTED_ERROR
+
+    async def stream_reply(
+        self,
+        message: str,
+        conversation_id: str,
+        guild_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield the coach's reply in pieces as `/api/chat` streams it.
+
+        Like `reply()`, never raises: on failure the user-facing explanation
+        is yielded as the last piece.
+        """
+        received = False
+        error = None
+        try:
+            async with self._slot(guild_id):
+                async with self.session.post(
+                    f"{self.base_url}/api/chat",
+                    json={
+                        "message": message,
+                        "conversation_id": conversation_id
+                    },
+                    headers={"Accept": "text/event-stream"}
+                ) as response:
+                    if response.status == 429:
+                        error = RATE_LIMITED
+                    elif response.status != 200:
+                        logger.error(f"Chatbot API error: {response.status} - {await response.text()}")
+                        error = API_ERROR
+                    else:
+                        async for line in response.content:
+                            event = _parse_sse_line(line.decode("utf-8"))
+                            if event is None:
+                                continue
+                            if event.get("error"):
+                                logger.error(f"Chatbot API stream error: {event['error']}")
+                                error = API_ERROR
+                                break
+                            if event.get("content"):
+                                received = True
+                                yield event["content"]
+                            if event.get("done"):
+                                break
+
+        except asyncio.TimeoutError:
+            logger.error("Chatbot API timeout")
+            error = TIMEOUT
+        except aiohttp.ClientError as e:
+            logger.error(f"Chatbot API request error: {e}")
+            error = CONNECTION_ERROR
+        except Exception as e:
+            logger.error(f"Unexpected error calling chatbot API: {e}")
+            error = UNEXPECTED_ERROR
+
+        if error:
+            yield f"\n\n{error}" if received else error
+        elif not received:
+            yield NO_RESPONSE
+
+    async def health(self) -> Optional[int]:
+        """Status code of the API health check, or None if it is unreachable"""
+        try:
+            async with self.session.get(
+                f"{self.base_url}/api/health",
+                timeout=aiohttp.ClientTimeout(total=self.connect_timeout + 5)
+            ) as response:
+                return response.status
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            return None
+
+    async def close(self):
+        """Close pooled connections"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def _parse_sse_line(line: str) -> Optional[dict]:
+    """JSON payload of a Server-Sent Events `data:` line, None for any other line"""
+    line = line.strip()
+    if not line.startswith("data:"):
+        return None
+    return json.loads(line[5:].strip())
+
+
+def _sse_events(response: requests.Response) -> Iterator[dict]:
+    """Decode the JSON payloads of a Server-Sent Events response"""
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        event = _parse_sse_line(line or "")
+        if event is not None:
+            yield event
@@ -16,14 +16,17 @@ Usage:
 
 import os
 import logging
-import requests
-import asyncio
-from discord import Intents, Client, Message
+import re
+import time
+from typing import List, Optional, Tuple
+from discord import HTTPException, Intents, Client, Message
 from discord.ext import commands
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from chatbot_client import CHATBOT_API_KEY, CHATBOT_API_URL, AsyncChatbotClient
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -33,9 +36,16 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
-CHATBOT_API_URL = os.getenv("CHATBOT_API_URL", "http://localhost:8000")
-CHATBOT_API_KEY = os.getenv("CHATBOT_API_KEY")  # Optional
 BOT_PREFIX = os.getenv("BOT_PREFIX", "!coach")  # Command prefix
+# Streaming goes through /api/chat, which rate-limits per end user only for
+# authenticated callers; without an API key every user would share the bot's IP limit
+DISCORD_STREAMING = os.getenv("DISCORD_STREAMING", "true" if CHATBOT_API_KEY else "false").lower() == "true"
+DISCORD_EDIT_INTERVAL = float(os.getenv("DISCORD_EDIT_INTERVAL", "1.0"))  # seconds between message edits
+
+# Discord has a 2000 character limit per message
+DISCORD_MESSAGE_LIMIT = 2000
+PLACEHOLDER_MESSAGE = "💭 Thinking…"
+CURSOR = " …"  # shown after text that is still streaming
 
 # Validate configuration
 if not DISCORD_BOT_TOKEN:
@@ -46,11 +56,28 @@ intents = Intents.default()
 intents.message_content = True  # Required to read message content
 intents.members = True
 
-# Initialize Discord bot
-bot = commands.Bot(command_prefix=BOT_PREFIX, intents=intents)
+# Shared non-blocking client for the chatbot API
+chatbot = AsyncChatbotClient()
+
+
+class CoachBot(commands.Bot):
+    """Bot that releases the chatbot API connections on shutdown"""
+    
+    async def close(self):
+        await chatbot.close()
+        await super().close()
+
+
+# Initialize Discord bot (the built-in help command would clash with the chat command's "help" alias)
+bot = CoachBot(command_prefix=BOT_PREFIX, intents=intents, help_command=None)
 
 
-def call_chatbot_api(message: str, user_id: str, conversation_id: str = None) -> str:
+async def call_chatbot_api(
+    message: str,
+    user_id: str,
+    conversation_id: str = None,
+    guild_id: Optional[str] = None
+) -> str:
     """
     Call the Mental Coach AI API to get a response.
     
@@ -58,6 +85,8 @@ def call_chatbot_api(message: str, user_id: str, conversation_id: str = None) ->
         message: User's message
         user_id: Discord user ID for conversation tracking
         conversation_id: Optional conversation ID for context
+        guild_id: Discord server the message came from (None for DMs),
+            used to share API capacity fairly between servers
     
     Returns:
         AI assistant's response
@@ -65,42 +94,87 @@ def call_chatbot_api(message: str, user_id: str, conversation_id: str = None) ->
     if not conversation_id:
         conversation_id = f"discord-{user_id}"
     
-    try:
-        headers = {
-            "Content-Type": "application/json"
-        }
-        if CHATBOT_API_KEY:
-            headers["Authorization"] = f"Bearer {CHATBOT_API_KEY}"
-        
-        # Use webhook endpoint for synchronous responses
-        response = requests.post(
-            f"{CHATBOT_API_URL}/api/webhook",
-            json={
-                "message": message,
-                "conversation_id": conversation_id
-            },
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("response", "I'm sorry, I couldn't generate a response.")
-        elif response.status_code == 429:
-            return "I'm receiving too many requests right now. Please try again in a moment."
-        else:
-            logger.error(f"Chatbot API error: {response.status_code} - {response.text}")
-            return "I'm experiencing some technical difficulties. Please try again later."
+    return await chatbot.reply(message, conversation_id, guild_id)
+
+
+# Preferred places to split a long reply, best first
+SPLIT_PATTERNS = [
+    re.compile(r"\n\s*\n"),  # paragraph
+    re.compile(r"\n"),  # line (list items, headings)
+    re.compile(r"[.!?][)\]\"'*_]*\s"),  # sentence
+    re.compile(r"\s"),  # word
+]
+
+
+def split_once(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> Tuple[str, str]:
+    """
+    Split `text` into a head of at most `limit` characters and the rest.
     
-    except requests.exceptions.Timeout:
-        logger.error("Chatbot API timeout")
-        return "The request took too long. Please try again with a shorter message."
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Chatbot API request error: {e}")
-        return "I'm having trouble connecting right now. Please try again later."
-    except Exception as e:
-        logger.error(f"Unexpected error calling chatbot API: {e}")
-        return "An unexpected error occurred. Please try again later."
+    Cuts at the last paragraph, line, sentence or word boundary in the second
+    half of the allowed length (a hard cut if there is none). A code block left
+    open by the cut is closed in the head and reopened in the rest.
+    """
+    if len(text) <= limit:
+        return text, ""
+    window = limit - 4  # room to close a code block
+    cut = window
+    for pattern in SPLIT_PATTERNS:
+        ends = [m.end() for m in pattern.finditer(text, 0, window) if m.end() >= window // 2]
+        if ends:
+            cut = ends[-1]
+            break
+    head, rest = text[:cut].rstrip(), text[cut:].lstrip(" ")
+    if head.count("```") % 2:
+        head += "\n```"
+        rest = "```\n" + rest
+    return head, rest
+
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> List[str]:
+    """Split a reply into messages that fit Discord's length limit"""
+    parts = []
+    while text:
+        head, text = split_once(text, limit)
+        parts.append(head)
+    return parts
+
+
+async def stream_reply(ctx, message: str, user_id: str, guild_id: Optional[str] = None):
+    """
+    Post a placeholder, then edit it in place as the answer streams in.
+    
+    Edits are throttled to one per DISCORD_EDIT_INTERVAL with tokens in
+    between coalesced (the first tokens show immediately). When the text
+    would pass 2000 characters, the message is finished at a paragraph or
+    sentence boundary and the reply continues in a new message.
+    """
+    sent = await ctx.send(PLACEHOLDER_MESSAGE)
+    text = ""  # text of the message currently being written
+    next_edit = 0.0
+    
+    async def edit(content: str):
+        try:
+            await sent.edit(content=content)
+        except HTTPException as e:
+            logger.error(f"Failed to edit streaming reply: {e}")
+    
+    async for chunk in chatbot.stream_reply(message, f"discord-{user_id}", guild_id):
+        text += chunk
+        # Roll over to a new message before passing the length limit
+        while len(text) + len(CURSOR) > DISCORD_MESSAGE_LIMIT:
+            head, text = split_once(text, DISCORD_MESSAGE_LIMIT - len(CURSOR))
+            await edit(head)
+            sent = await ctx.send(text + CURSOR if text.strip() else PLACEHOLDER_MESSAGE)
+            next_edit = time.monotonic() + DISCORD_EDIT_INTERVAL
+        now = time.monotonic()
+        if now >= next_edit and text.strip():
+            await edit(text + CURSOR)
+            next_edit = now + DISCORD_EDIT_INTERVAL
+    
+    if text.strip():
+        await edit(text)
+    else:
+        await sent.delete()
 
 
 @bot.event
@@ -110,14 +184,13 @@ async def on_ready():
     logger.info(f"📡 Chatbot API: {CHATBOT_API_URL}")
     
     # Test chatbot API connection
-    try:
-        health_response = requests.get(f"{CHATBOT_API_URL}/api/health", timeout=5)
-        if health_response.status_code == 200:
-            logger.info("✅ Chatbot API is accessible")
-        else:
-            logger.warning(f"⚠️ Chatbot API returned status {health_response.status_code}")
-    except Exception as e:
-        logger.error(f"❌ Cannot connect to chatbot API at {CHATBOT_API_URL}: {e}")
+    health_status = await chatbot.health()
+    if health_status == 200:
+        logger.info("✅ Chatbot API is accessible")
+    elif health_status is not None:
+        logger.warning(f"⚠️ Chatbot API returned status {health_status}")
+    else:
+        logger.error(f"❌ Cannot connect to chatbot API at {CHATBOT_API_URL}")
         logger.error("Make sure the chatbot API is running and accessible")
     
     # Set bot status
@@ -155,20 +228,21 @@ async def chat_command(ctx, *, message: str = None):
         )
         return
     
+    user_id = str(ctx.author.id)
+    guild_id = str(ctx.guild.id) if ctx.guild else None
+    
+    if DISCORD_STREAMING:
+        await stream_reply(ctx, message, user_id, guild_id)
+        return
+    
     # Show typing indicator
     async with ctx.typing():
         # Get response from chatbot
-        user_id = str(ctx.author.id)
-        response = call_chatbot_api(message, user_id)
+        response = await call_chatbot_api(message, user_id, guild_id=guild_id)
         
-        # Discord has a 2000 character limit per message
-        if len(response) > 2000:
-            # Split into chunks
-            chunks = [response[i:i+2000] for i in range(0, len(response), 2000)]
-            for chunk in chunks:
-                await ctx.send(chunk)
-        else:
-            await ctx.send(response)
+        # Split long replies at paragraph or sentence boundaries
+        for part in split_message(response):
+            await ctx.send(part)
 
 
 @bot.command(name="clear", aliases=["reset"])
@@ -196,11 +270,11 @@ async def info_command(ctx):
         !coach info
     """
     # Check chatbot API health
-    try:
-        health_response = requests.get(f"{CHATBOT_API_URL}/api/health", timeout=5)
-        api_status = "✅ Online" if health_response.status_code == 200 else "⚠️ Issues"
-    except:
+    health_status = await chatbot.health()
+    if health_status is None:
         api_status = "❌ Offline"
+    else:
+        api_status = "✅ Online" if health_status == 200 else "⚠️ Issues"
     
     embed = {
         "title": "🧠 Mental Coach AI",
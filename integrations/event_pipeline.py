@@ -0,0 +1,114 @@
+"""
+Ack-then-process helpers for chat platform events.
+
+Slack redelivers an event that is not acknowledged within 3 seconds, while a
+coach reply can take much longer. Handlers therefore acknowledge straight away
+and hand the slow part to `WorkerPool`, a fixed set of worker threads behind a
+bounded queue. `IdempotencyCache` remembers recently seen event IDs so a
+redelivered event is dropped instead of answered twice.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+EVENT_WORKERS = int(os.getenv("EVENT_WORKERS", "8"))
+EVENT_MAX_PENDING = int(os.getenv("EVENT_MAX_PENDING", "100"))  # queued jobs before new ones are refused
+EVENT_DEDUP_TTL = float(os.getenv("EVENT_DEDUP_TTL", "900"))  # seconds an event ID is remembered
+EVENT_DEDUP_MAX_ENTRIES = int(os.getenv("EVENT_DEDUP_MAX_ENTRIES", "10000"))
+
+
+class WorkerPool:
+    """Bounded queue of jobs drained by a fixed number of daemon threads"""
+
+    def __init__(self, workers: int = EVENT_WORKERS, max_pending: int = EVENT_MAX_PENDING, name: str = "event"):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"{name}-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, func: Callable, *args, **kwargs) -> bool:
+        """Queue `func(*args, **kwargs)`; returns False if the queue is full"""
+        try:
+            self._queue.put_nowait((func, args, kwargs))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth and worker saturation for monitoring"""
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "saturation": round(self.busy / self.workers, 2) if self.workers else 0,
+            "queue_depth": self._queue.qsize(),
+            "max_pending": self.max_pending,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def _worker(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            with self._lock:
+                self.busy += 1
+            try:
+                func(*args, **kwargs)
+                ok = True
+            except Exception as e:
+                logger.error(f"Background job {getattr(func, '__name__', func)} failed: {e}", exc_info=True)
+                ok = False
+            finally:
+                with self._lock:
+                    self.busy -= 1
+                    self.processed += 1
+                    self.failed += not ok
+                self._queue.task_done()
+
+
+class IdempotencyCache:
+    """Thread-safe set of recently seen keys with a TTL and a size cap"""
+
+    def __init__(self, ttl: float = EVENT_DEDUP_TTL, max_entries: int = EVENT_DEDUP_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[str, float]" = OrderedDict()  # key -> first seen (monotonic)
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def seen(self, key: str) -> bool:
+        """Record `key`; returns True if it was already recorded within the TTL"""
+        now = time.monotonic()
+        with self._lock:
+            # Entries are in insertion order, so expired ones sit at the front
+            while self._seen and next(iter(self._seen.values())) < now - self.ttl:
+                self._seen.popitem(last=False)
+            if key in self._seen:
+                self.duplicates += 1
+                return True
+            self._seen[key] = now
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            return False
+
+    def __len__(self) -> int:
+        return len(self._seen)
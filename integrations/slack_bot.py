@@ -17,14 +17,20 @@ Usage:
 
 import os
 import logging
-import requests
+import re
+import time
+from typing import Optional
 from flask import Flask, request, jsonify
-from slack_bolt import App
+from slack_bolt import App, BoltResponse
 from slack_bolt.adapter.flask import SlackRequestHandler
+from slack_sdk.errors import SlackApiError
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from chatbot_client import CHATBOT_API_KEY, CHATBOT_API_URL, ChatbotClient
+from event_pipeline import IdempotencyCache, WorkerPool
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -32,8 +38,10 @@ logger = logging.getLogger(__name__)
 # Configuration
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
-CHATBOT_API_URL = os.getenv("CHATBOT_API_URL", "http://localhost:8000")
-CHATBOT_API_KEY = os.getenv("CHATBOT_API_KEY")  # Optional
+# Streaming goes through /api/chat, which rate-limits per end user only for
+# authenticated callers; without an API key every user would share the bot's IP limit
+SLACK_STREAMING = os.getenv("SLACK_STREAMING", "true" if CHATBOT_API_KEY else "false").lower() == "true"
+SLACK_UPDATE_INTERVAL = float(os.getenv("SLACK_UPDATE_INTERVAL", "1.0"))  # seconds between chat.update calls
 
 # Validate configuration
 if not SLACK_BOT_TOKEN:
@@ -52,6 +60,32 @@ flask_app = Flask(__name__)
 handler = SlackRequestHandler(app)
 
 
+# Shared keep-alive client for the chatbot API
+chatbot = ChatbotClient()
+
+# Handlers acknowledge Slack immediately; chatbot calls run on these workers
+workers = WorkerPool(name="slack")
+seen_events = IdempotencyCache()
+
+BUSY_MESSAGE = "I'm handling a lot of conversations right now. Please try again in a minute."
+PLACEHOLDER_MESSAGE = "_Thinking…_"
+
+
+def resolve_bot_user_id() -> Optional[str]:
+    """Look up the bot's own user ID once, at startup"""
+    try:
+        return app.client.auth_test()["user_id"]
+    except Exception as e:
+        logger.warning(f"Could not resolve bot user ID: {e}")
+        return None
+
+
+BOT_USER_ID = resolve_bot_user_id()
+
+# Pattern removing the bot's mention (any mention if the bot ID is unknown)
+MENTION_PATTERN = re.compile(rf"<@{BOT_USER_ID}>" if BOT_USER_ID else r"<@[A-Z0-9]+>")
+
+
 def call_chatbot_api(message: str, user_id: str, conversation_id: str = None) -> str:
     """
     Call the Mental Coach AI API to get a response.
@@ -67,80 +101,112 @@ def call_chatbot_api(message: str, user_id: str, conversation_id: str = None) ->
     if not conversation_id:
         conversation_id = f"slack-{user_id}"
     
+    return chatbot.reply(message, conversation_id)
+
+
+def update_message(client, channel: str, ts: str, text: str) -> float:
+    """
+    Replace the text of a posted message.
+    
+    Returns the seconds to wait before the next update: 0 normally, or
+    Slack's Retry-After when rate limited.
+    """
     try:
-        headers = {
-            "Content-Type": "application/json"
-        }
-        if CHATBOT_API_KEY:
-            headers["Authorization"] = f"Bearer {CHATBOT_API_KEY}"
-        
-        # Use webhook endpoint for synchronous responses
-        response = requests.post(
-            f"{CHATBOT_API_URL}/api/webhook",
-            json={
-                "message": message,
-                "conversation_id": conversation_id
-            },
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("response", "I'm sorry, I couldn't generate a response.")
+        client.chat_update(channel=channel, ts=ts, text=text)
+        return 0.0
+    except SlackApiError as e:
+        if e.response.status_code == 429:
+            return float(e.response.headers.get("Retry-After", 1))
+        logger.error(f"chat.update failed: {e}")
+        return SLACK_UPDATE_INTERVAL
+
+
+def stream_reply(client, channel: str, message: str, user_id: str, thread_ts: str = None):
+    """
+    Post a placeholder, then edit it in place as the answer streams in.
+    
+    Updates are throttled to one per SLACK_UPDATE_INTERVAL; tokens arriving
+    in between are coalesced into the next update. The first tokens are
+    shown as soon as they arrive.
+    """
+    placeholder = client.chat_postMessage(channel=channel, text=PLACEHOLDER_MESSAGE, thread_ts=thread_ts)
+    channel, ts = placeholder["channel"], placeholder["ts"]
+    
+    text = ""
+    next_update = 0.0
+    for chunk in chatbot.stream_reply(message, f"slack-{user_id}"):
+        text += chunk
+        now = time.monotonic()
+        if now >= next_update and text.strip():
+            next_update = now + max(SLACK_UPDATE_INTERVAL, update_message(client, channel, ts, text + " …"))
+    
+    # Final update with the complete answer, waiting out any rate limit
+    for _ in range(3):
+        time.sleep(max(0.0, next_update - time.monotonic()))
+        delay = update_message(client, channel, ts, text)
+        if not delay:
+            break
+        next_update = time.monotonic() + delay
+
+
+def reply_in_background(say, message: str, user_id: str, client=None, channel: str = None, **kwargs):
+    """
+    Queue a chatbot call whose answer is sent with `say`.
+    
+    With `client` and `channel` (and SLACK_STREAMING on), the answer is
+    streamed into a message that is edited as tokens arrive.
+    """
+    def job():
+        if SLACK_STREAMING and client is not None:
+            stream_reply(client, channel, message, user_id, **kwargs)
         else:
-            logger.error(f"Chatbot API error: {response.status_code} - {response.text}")
-            return "I'm experiencing some technical difficulties. Please try again later."
-    
-    except requests.exceptions.Timeout:
-        logger.error("Chatbot API timeout")
-        return "The request took too long. Please try again with a shorter message."
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Chatbot API request error: {e}")
-        return "I'm having trouble connecting right now. Please try again later."
-    except Exception as e:
-        logger.error(f"Unexpected error calling chatbot API: {e}")
-        return "An unexpected error occurred. Please try again later."
+            say(call_chatbot_api(message, user_id), **kwargs)
+    
+    if not workers.submit(job):
+        logger.warning(f"Worker queue full, dropping message from {user_id}")
+        say(BUSY_MESSAGE, **kwargs)
+
+
+@app.middleware
+def skip_redelivered_events(body, request, next):
+    """
+    Acknowledge Slack retries without handling them again.
+    
+    Events are deduplicated by their event_id. A retried request without an
+    event_id (X-Slack-Retry-Num set) was already acknowledged, so it is
+    dropped as well.
+    """
+    event_id = body.get("event_id")
+    retry_num = request.headers.get("x-slack-retry-num", [None])[0]
+    if (event_id and seen_events.seen(event_id)) or (not event_id and retry_num):
+        reason = request.headers.get("x-slack-retry-reason", ["unknown"])[0]
+        logger.info(f"Skipping redelivered event {event_id} (retry {retry_num}, reason: {reason})")
+        return BoltResponse(status=200, body="")
+    next()
 
 
 @app.event("app_mention")
-def handle_mentions(event, say):
+def handle_mentions(event, say, client):
     """
     Handle when the bot is mentioned in a channel.
     Responds in the same channel.
     """
     user_id = event.get("user")
     text = event.get("text", "")
-    channel = event.get("channel")
-    
-    # Get bot user ID
-    try:
-        bot_user_id = app.client.auth_test()["user_id"]
-    except Exception:
-        # Fallback: try to extract from event
-        bot_user_id = None
     
     # Remove the mention from the message
-    if bot_user_id:
-        message = text.replace(f"<@{bot_user_id}>", "").strip()
-    else:
-        # Fallback: remove any mention pattern
-        import re
-        message = re.sub(r"<@[A-Z0-9]+>", "", text).strip()
+    message = MENTION_PATTERN.sub("", text).strip()
     
     if not message:
         say("Hi! I'm here to help. What's on your mind?")
         return
     
-    # Get response from chatbot
-    response = call_chatbot_api(message, user_id)
-    
-    # Send response in thread
-    say(response, thread_ts=event.get("ts"))
+    # Answer in thread once the chatbot responds
+    reply_in_background(say, message, user_id, client, event.get("channel"), thread_ts=event.get("ts"))
 
 
 @app.message("")
-def handle_direct_messages(message, say):
+def handle_direct_messages(message, say, client):
     """
     Handle direct messages to the bot.
     Only responds to DMs, not channel messages (unless mentioned).
@@ -160,11 +226,8 @@ def handle_direct_messages(message, say):
     # Show typing indicator
     app.client.conversations_mark(channel=message.get("channel"))
     
-    # Get response from chatbot
-    response = call_chatbot_api(text, user_id)
-    
-    # Send response
-    say(response)
+    # Send response once the chatbot responds
+    reply_in_background(say, text, user_id, client, message.get("channel"))
 
 
 @app.command("/coach")
@@ -182,11 +245,8 @@ def handle_coach_command(ack, respond, command):
         respond("Please provide a message. Usage: `/coach I need help with stress`")
         return
     
-    # Get response from chatbot
-    response = call_chatbot_api(text, user_id)
-    
-    # Send response
-    respond(response)
+    # Send response once the chatbot responds
+    reply_in_background(respond, text, user_id)
 
 
 @app.event("message")
@@ -222,20 +282,21 @@ def health():
     return jsonify({
         "status": "ok",
         "service": "slack-bot",
-        "chatbot_api": CHATBOT_API_URL
+        "chatbot_api": CHATBOT_API_URL,
+        "workers": workers.stats(),
+        "duplicate_events": seen_events.duplicates
     })
 
 
 if __name__ == "__main__":
     # Test chatbot API connection
-    try:
-        health_response = requests.get(f"{CHATBOT_API_URL}/api/health", timeout=5)
-        if health_response.status_code == 200:
-            logger.info("✅ Chatbot API is accessible")
-        else:
-            logger.warning(f"⚠️ Chatbot API returned status {health_response.status_code}")
-    except Exception as e:
-        logger.error(f"❌ Cannot connect to chatbot API at {CHATBOT_API_URL}: {e}")
+    health_status = chatbot.health()
+    if health_status == 200:
+        logger.info("✅ Chatbot API is accessible")
+    elif health_status is not None:
+        logger.warning(f"⚠️ Chatbot API returned status {health_status}")
+    else:
+        logger.error(f"❌ Cannot connect to chatbot API at {CHATBOT_API_URL}")
         logger.error("Make sure the chatbot API is running and accessible")
     
     # Start Flask server
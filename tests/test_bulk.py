@@ -0,0 +1,93 @@
+"""Bulk import: record validation and what a batch writes"""
+
+import json
+
+import pytest
+
+from api.bulk import ImportConflictError, InvalidRecordError, import_lines, parse_record
+from api.db import ConnectionPool
+from api.migrations import migrate
+
+
+def line(**fields) -> str:
+    return json.dumps(fields)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "import.db"))
+    with pool.writer() as conn:
+        migrate(conn)
+    yield pool
+    pool.close()
+
+
+def messages(pool):
+    with pool.reader() as conn:
+        rows = conn.execute("SELECT id, conversation_id, content FROM messages ORDER BY id").fetchall()
+    return [tuple(row) for row in rows]
+
+
+def test_parses_records_and_skips_blank_lines():
+    record = parse_record(line(type="message", conversation_id="c1", id=7, role="user", content="hi"), 1)
+    assert record["id"] == 7
+    assert parse_record("   ", 2) is None
+    assert parse_record(line(type="done", count=1), 3) is None
+
+
+@pytest.mark.parametrize("fields, problem", [
+    ({"type": "message", "conversation_id": "c1", "id": "x", "role": "user", "content": "hi"}, "id must be an integer"),
+    ({"type": "message", "conversation_id": "c1", "id": True, "role": "user", "content": "hi"}, "id must be an integer"),
+    ({"type": "message", "conversation_id": "c1", "role": "user", "content": {"text": "hi"}}, "content must be a string"),
+    ({"type": "message", "conversation_id": ["c1"], "role": "user", "content": "hi"}, "conversation_id must be a string"),
+    ({"type": "message", "conversation_id": "c1", "role": 1, "content": "hi"}, "role must be a string"),
+    ({"type": "summary", "conversation_id": "c1", "summary": ["s"], "summarized_through_id": 2}, "summary must be"),
+    ({"type": "summary", "conversation_id": "c1", "summary": "s", "summarized_through_id": 2.5}, "summarized_through_id"),
+    ({"type": "message", "conversation_id": "c1", "role": "user", "content": "hi", "token_count": "3"}, "token_count"),
+    ({"type": "conversation", "conversation_id": "c1", "created_at": 12}, "created_at is not an ISO 8601"),
+    ({"type": "message", "conversation_id": "c1", "role": "user"}, "message record is missing content"),
+])
+def test_rejects_invalid_records(fields, problem):
+    with pytest.raises(InvalidRecordError, match=f"Line 4: {problem}"):
+        parse_record(json.dumps(fields), 4)
+
+
+def test_bad_line_stops_import_after_committed_batches(pool):
+    lines = [
+        line(type="message", conversation_id="c1", id=1, role="user", content="kept"),
+        line(type="message", conversation_id="c1", id="x", role="user", content="bad"),
+    ]
+    with pytest.raises(InvalidRecordError, match="Line 2"):
+        import_lines(pool, lines, batch_size=1)
+    assert messages(pool) == [(1, "c1", "kept")]
+
+
+def test_reimport_skips_ids_the_conversation_already_has(pool):
+    lines = [line(type="message", conversation_id="c1", id=i, role="user", content=f"m{i}") for i in (1, 2)]
+    import_lines(pool, lines)
+    stats = import_lines(pool, lines)
+    assert (stats["messages"], stats["skipped"]) == (0, 2)
+    assert messages(pool) == [(1, "c1", "m1"), (2, "c1", "m2")]
+
+
+def test_ids_of_other_conversations_are_refused(pool):
+    import_lines(pool, [line(type="message", conversation_id="c1", id=1, role="user", content="mine")])
+    lines = [
+        line(type="message", conversation_id="c2", id=1, role="user", content="theirs"),
+        line(type="message", conversation_id="c2", id=2, role="user", content="fine"),
+    ]
+    with pytest.raises(ImportConflictError) as raised:
+        import_lines(pool, lines)
+    assert raised.value.ids == [1]
+    # The whole batch is rolled back, nothing is silently dropped
+    assert messages(pool) == [(1, "c1", "mine")]
+    # New ids keep both messages
+    import_lines(pool, lines, preserve_ids=False)
+    assert [content for _, _, content in messages(pool)] == ["mine", "theirs", "fine"]
+
+
+def test_conflicting_ids_within_a_batch_are_refused(pool):
+    lines = [line(type="message", conversation_id=cid, id=5, role="user", content=cid) for cid in ("c1", "c2")]
+    with pytest.raises(ImportConflictError, match="ids already used by other conversations: 5"):
+        import_lines(pool, lines)
+    assert messages(pool) == []
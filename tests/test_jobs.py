@@ -0,0 +1,102 @@
+"""Webhook delivery: URL checks and connections pinned to the checked address"""
+
+import asyncio
+import socket
+
+import httpcore
+import httpx
+import pytest
+
+from api import jobs
+from api.jobs import InvalidWebhookURLError, check_webhook_url, webhook_transport
+
+PUBLIC = "93.184.216.34"
+
+
+def resolver(monkeypatch, *answers):
+    """Make getaddrinfo return each answer in turn (the last one from then on)"""
+    answers = list(answers)
+    looked_up = []
+
+    async def getaddrinfo(self, host, port, *args, **kwargs):
+        looked_up.append(host)
+        address = answers.pop(0) if len(answers) > 1 else answers[0]
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+
+    monkeypatch.setattr(asyncio.base_events.BaseEventLoop, "getaddrinfo", getaddrinfo)
+    return looked_up
+
+
+class RecordingStream(httpcore.AsyncNetworkStream):
+    def __init__(self):
+        self.sent = b""
+        self.replied = False
+
+    async def read(self, max_bytes, timeout=None):
+        if self.replied:
+            return b""
+        self.replied = True
+        return b"HTTP/1.1 204 No Content\r\n\r\n"
+
+    async def write(self, buffer, timeout=None):
+        self.sent += buffer
+
+    async def aclose(self):
+        pass
+
+
+class RecordingBackend(httpcore.AsyncNetworkBackend):
+    """Stands in for the socket layer: records where it was asked to connect"""
+
+    def __init__(self):
+        self.connections = []
+        self.stream = RecordingStream()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.connections.append((host, port))
+        return self.stream
+
+
+def post(url: str, backend: RecordingBackend):
+    async def main():
+        async with httpx.AsyncClient(transport=webhook_transport(httpx.Limits(), backend)) as client:
+            return await client.post(url, json={"ok": True})
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "10.0.0.5", "169.254.169.254", "::ffff:127.0.0.1"])
+def test_refuses_non_public_addresses(monkeypatch, address):
+    resolver(monkeypatch, address)
+    with pytest.raises(InvalidWebhookURLError, match="non-public"):
+        asyncio.run(check_webhook_url("http://hooks.example.com/in"))
+
+
+def test_connects_to_the_checked_address(monkeypatch):
+    looked_up = resolver(monkeypatch, PUBLIC)
+    backend = RecordingBackend()
+    assert post("http://hooks.example.com:8080/in", backend).status_code == 204
+    assert looked_up == ["hooks.example.com"]
+    assert backend.connections == [(PUBLIC, 8080)]
+    # The request itself still names the host
+    assert b"Host: hooks.example.com:8080\r\n" in backend.stream.sent
+
+
+def test_dns_rebinding_is_refused(monkeypatch):
+    # Public while the URL is checked, loopback by the time the delivery connects
+    looked_up = resolver(monkeypatch, PUBLIC, "127.0.0.1")
+    asyncio.run(check_webhook_url("http://rebind.example.com/in"))
+    backend = RecordingBackend()
+    with pytest.raises(InvalidWebhookURLError, match="non-public"):
+        post("http://rebind.example.com/in", backend)
+    assert looked_up == ["rebind.example.com"] * 2
+    assert backend.connections == []
+
+
+def test_allowed_hosts_skip_the_address_check(monkeypatch):
+    monkeypatch.setattr(jobs, "WEBHOOK_ALLOWED_HOSTS", {"hooks.internal"})
+    looked_up = resolver(monkeypatch, "10.0.0.5")
+    backend = RecordingBackend()
+    assert post("http://hooks.internal/in", backend).status_code == 204
+    assert looked_up == []
+    assert backend.connections == [("hooks.internal", 80)]
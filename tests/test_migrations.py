@@ -0,0 +1,134 @@
+"""Schema migrations: upgrading a pre-versioning database to the latest schema"""
+
+import sqlite3
+
+import pytest
+
+from api import migrations, search
+from api.migrations import SCHEMA_VERSION, explain_hot_queries, migrate, schema_version
+
+
+def legacy_database(path) -> sqlite3.Connection:
+    """A database as the original init_db() left it (version 0), with some history"""
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE conversations (
+            conversation_id TEXT PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id)
+        );
+        CREATE INDEX idx_conversation_id ON messages(conversation_id);
+
+        INSERT INTO conversations (conversation_id) VALUES ('c1');
+        INSERT INTO messages (conversation_id, role, content) VALUES ('c1', 'user', 'hello there');
+        INSERT INTO messages (conversation_id, role, content) VALUES ('c1', 'assistant', 'general kenobi');
+        -- The original schema never enforced its foreign key
+        INSERT INTO messages (conversation_id, role, content) VALUES ('ghost', 'user', 'who am i');
+        INSERT INTO messages (conversation_id, role, content) VALUES ('c1', 'user', 'deleted later');
+        DELETE FROM messages WHERE id = 4;
+    """)
+    conn.commit()
+    return conn
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    conn = legacy_database(tmp_path / "legacy.db")
+    yield conn
+    conn.close()
+
+
+def test_upgrades_legacy_database_to_latest(legacy):
+    assert schema_version(legacy) == 0
+    assert migrate(legacy) == SCHEMA_VERSION
+    assert schema_version(legacy) == SCHEMA_VERSION == len(migrations.MIGRATIONS)
+
+    rows = legacy.execute("SELECT id, conversation_id, role, content FROM messages ORDER BY id").fetchall()
+    assert rows == [
+        (1, "c1", "user", "hello there"),
+        (2, "c1", "assistant", "general kenobi"),
+        (3, "ghost", "user", "who am i"),
+    ]
+    # Orphaned messages get a conversation instead of being dropped
+    assert legacy.execute("SELECT 1 FROM conversations WHERE conversation_id = 'ghost'").fetchone()
+    assert legacy.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_rebuild_keeps_autoincrement_sequence(legacy):
+    migrate(legacy)
+    legacy.execute("INSERT INTO messages (conversation_id, role, content) VALUES ('c1', 'user', 'new')")
+    assert legacy.execute("SELECT MAX(id) FROM messages").fetchone()[0] == 5  # not 4, which was deleted
+
+
+def test_deleting_conversation_cascades(legacy):
+    migrate(legacy)
+    legacy.execute("PRAGMA foreign_keys = ON")  # outside a transaction, or it is ignored
+    legacy.execute(
+        "INSERT INTO conversation_summaries (conversation_id, summary, summarized_through_id, token_count) "
+        "VALUES ('c1', 'greetings', 2, 3)"
+    )
+    legacy.execute("DELETE FROM conversations WHERE conversation_id = 'c1'")
+    assert legacy.execute("SELECT count(*) FROM messages WHERE conversation_id = 'c1'").fetchone()[0] == 0
+    assert legacy.execute("SELECT count(*) FROM conversation_summaries").fetchone()[0] == 0
+
+
+def test_existing_messages_are_searchable(legacy):
+    migrate(legacy)
+    assert search.check(legacy)
+    results = search.search(legacy, "kenobi")
+    assert [r["message_id"] for r in results] == [2]
+    # Triggers keep the index in step with new rows
+    legacy.execute("INSERT INTO messages (conversation_id, role, content) VALUES ('c1', 'user', 'kenobi again')")
+    assert {r["message_id"] for r in search.search(legacy, "kenobi")} == {2, 5}
+
+
+def test_hot_queries_use_indexes(legacy):
+    migrate(legacy)
+    problems = {name: found for name, _, found in explain_hot_queries(legacy) if found}
+    assert problems == {}
+
+
+def test_migrate_is_idempotent(legacy):
+    migrate(legacy)
+    tables = legacy.execute("SELECT name FROM sqlite_master ORDER BY name").fetchall()
+    assert migrate(legacy) == SCHEMA_VERSION
+    assert legacy.execute("SELECT name FROM sqlite_master ORDER BY name").fetchall() == tables
+
+
+def test_new_database_matches_upgraded_one(tmp_path, legacy):
+    migrate(legacy)
+    fresh = sqlite3.connect(tmp_path / "fresh.db")
+    try:
+        assert migrate(fresh) == SCHEMA_VERSION
+
+        def schema(conn):
+            return conn.execute(
+                "SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY type, name"
+            ).fetchall()
+
+        assert schema(fresh) == schema(legacy)
+    finally:
+        fresh.close()
+
+
+def test_failed_step_leaves_previous_version(legacy, monkeypatch):
+    migrate(legacy)
+
+    def broken(conn):
+        conn.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [broken])
+    monkeypatch.setattr(migrations, "SCHEMA_VERSION", SCHEMA_VERSION + 1)
+    with pytest.raises(RuntimeError):
+        migrate(legacy)
+    assert schema_version(legacy) == SCHEMA_VERSION
+    assert legacy.execute("SELECT 1 FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
@@ -0,0 +1,113 @@
+"""Rate limiter backends: sliding-window accounting and limits shared across processes"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from api.rate_limit import (
+    RedisRateLimiter,
+    SQLiteRateLimiter,
+    SharedMemoryRateLimiter,
+    SlidingWindowRateLimiter,
+    create_rate_limiter,
+    seconds_until_allowed,
+)
+
+LIMIT = 3
+WINDOW = 10.0
+T0 = 1_000_000 * WINDOW  # a window boundary, so every backend numbers windows alike
+
+BACKENDS = ["memory", "shm", "sqlite", "redis"]
+
+
+def make_limiter(backend: str, tmp_path, limit: int = LIMIT, window: float = WINDOW):
+    if backend == "memory":
+        return SlidingWindowRateLimiter(limit, window, sweep_interval=0)
+    if backend == "shm":
+        return SharedMemoryRateLimiter(limit, window, path=str(tmp_path / "rate-limit.shm"), slots=1024)
+    if backend == "sqlite":
+        return SQLiteRateLimiter(limit, window, path=str(tmp_path / "rate-limit.db"), sweep_interval=0)
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # fakeredis runs the Lua script with it
+    return RedisRateLimiter(limit, window, client=fakeredis.FakeRedis())
+
+
+@pytest.fixture(params=BACKENDS)
+def limiter(request, tmp_path):
+    limiter = make_limiter(request.param, tmp_path)
+    yield limiter
+    limiter.close()
+
+
+def test_allows_up_to_limit(limiter):
+    assert [limiter.allow("client", T0 + i * 0.1) for i in range(LIMIT + 2)] == [True] * LIMIT + [False, False]
+    assert limiter.rejections == 2
+
+
+def test_keys_are_independent(limiter):
+    for _ in range(LIMIT):
+        limiter.allow("a", T0)
+    assert not limiter.allow("a", T0)
+    assert limiter.allow("b", T0)
+
+
+def test_previous_window_counts_in_proportion(limiter):
+    for _ in range(LIMIT):
+        assert limiter.allow("client", T0)
+    # Right after the boundary the previous window still weighs in full
+    assert not limiter.allow("client", T0 + WINDOW)
+    # Half way through it counts for 1.5 of 3: two requests fit (1.5 + 0, 1.5 + 1), a third does not
+    assert [limiter.allow("client", T0 + 1.5 * WINDOW) for _ in range(3)] == [True, True, False]
+
+
+def test_idle_windows_reset(limiter):
+    for _ in range(LIMIT):
+        limiter.allow("client", T0)
+    assert all(limiter.allow("client", T0 + 2 * WINDOW) for _ in range(LIMIT))
+
+
+def test_retry_after(limiter):
+    assert limiter.retry_after("client", T0) == 0
+    for _ in range(LIMIT):
+        limiter.allow("client", T0 + 2)
+    assert limiter.retry_after("client", T0 + 2) == pytest.approx(WINDOW - 2)
+    assert limiter.retry_after("client", T0 + 2 * WINDOW) == 0
+
+
+def test_tracks_clients(limiter):
+    limiter.allow("a")
+    limiter.allow("b")
+    assert len(limiter) == 2
+
+
+def test_seconds_until_allowed():
+    # 3 of 3 used in the previous window: it must fade to below 3 - current = 2
+    assert seconds_until_allowed(T0, 1, 3, 3, WINDOW, T0) == pytest.approx(WINDOW / 3)
+    assert seconds_until_allowed(T0, 0, 0, 3, WINDOW, T0) == 0
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_rate_limiter(LIMIT, WINDOW, backend="carrier-pigeon")
+
+
+def _hammer(backend: str, path: str, checks: int) -> int:
+    """Requests allowed out of `checks` in a fresh limiter on the shared file (runs in a worker process)"""
+    if backend == "shm":
+        limiter = SharedMemoryRateLimiter(20, WINDOW, path=path, slots=1024)
+    else:
+        limiter = SQLiteRateLimiter(20, WINDOW, path=path, sweep_interval=0)
+    try:
+        return sum(limiter.allow(key, T0) for key in ("hot", "other") * (checks // 2))
+    finally:
+        limiter.close()
+
+
+@pytest.mark.parametrize("backend", ["shm", "sqlite"])
+def test_limit_is_shared_across_processes(backend, tmp_path):
+    path = str(tmp_path / f"shared.{backend}")
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context("spawn")) as pool:
+        allowed = list(pool.map(_hammer, [backend] * 4, [path] * 4, [100] * 4))
+    # 20 per key, however the four processes interleave
+    assert sum(allowed) == 2 * 20
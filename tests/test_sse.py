@@ -0,0 +1,132 @@
+"""SSE framing: delta coalescing and event formatting"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from api.sse import EventStream, coalesce
+
+
+async def timed_deltas(*steps):
+    """Yield each (delay, delta) after sleeping `delay`; an exception delta is raised"""
+    for delay, delta in steps:
+        await asyncio.sleep(delay)
+        if isinstance(delta, Exception):
+            raise delta
+        yield delta
+
+
+async def collect(pieces):
+    return [piece async for piece in pieces]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_first_delta_goes_out_at_once_then_batches():
+    deltas = timed_deltas((0, "a"), (0.01, "b"), (0.01, "c"), (0.3, "d"))
+    assert run(collect(coalesce(deltas, interval=0.1, max_bytes=1000))) == ["a", "bc", "d"]
+
+
+def test_flushes_when_buffer_is_full():
+    async def main():
+        started = time.perf_counter()
+        deltas = timed_deltas((0, "ab"), (0.01, "cd"), (0.01, "ef"), (5, "gh"))
+        pieces = coalesce(deltas, interval=10, max_bytes=4)
+        first_two = [await pieces.__anext__() for _ in range(2)]
+        elapsed = time.perf_counter() - started
+        await pieces.aclose()
+        return first_two, elapsed
+
+    pieces, elapsed = run(main())
+    assert pieces == ["ab", "cdef"]
+    assert elapsed < 1  # the full buffer went out without waiting for the 10 s interval
+
+
+def test_end_of_stream_flushes_without_waiting():
+    async def main():
+        started = time.perf_counter()
+        pieces = await collect(coalesce(timed_deltas((0, "a"), (0, "b"), (0, "c")), interval=10))
+        return pieces, time.perf_counter() - started
+
+    pieces, elapsed = run(main())
+    assert "".join(pieces) == "abc"
+    assert pieces[0] == "a"
+    assert elapsed < 1
+
+
+def test_empty_stream():
+    assert run(collect(coalesce(timed_deltas(), interval=0.01))) == []
+
+
+def test_error_is_raised_after_buffered_text():
+    async def main():
+        received = []
+        deltas = timed_deltas((0, "a"), (0.01, "b"), (0.01, "c"), (0, RuntimeError("upstream failed")))
+        with pytest.raises(RuntimeError, match="upstream failed"):
+            async for piece in coalesce(deltas, interval=10):
+                received.append(piece)
+        return received
+
+    assert run(main()) == ["a", "bc"]
+
+
+def test_closing_early_stops_reading():
+    async def main():
+        read = []
+
+        async def deltas():
+            for i in range(1000):
+                read.append(i)
+                await asyncio.sleep(0.001)
+                yield str(i)
+
+        pieces = coalesce(deltas(), interval=0.01)
+        await pieces.__anext__()
+        await pieces.aclose()
+        count = len(read)
+        await asyncio.sleep(0.05)
+        return count, len(read)
+
+    before, after = run(main())
+    assert after == before
+
+
+def parse(events: str):
+    """(event name, data lines) of each SSE event"""
+    parsed = []
+    for block in events.strip("\n").split("\n\n"):
+        name, data = None, []
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                name = line[len("event: "):]
+            elif line.startswith("data: "):
+                data.append(line[len("data: "):])
+        parsed.append((name, data))
+    return parsed
+
+
+def test_token_framing_keeps_original_format():
+    events = EventStream("conv-1", framing="token")
+    assert events.start() is None
+    assert events.content("Hi") == 'data: {"content": "Hi", "conversation_id": "conv-1"}\n\n'
+    assert json.loads(events.done()[len("data: "):]) == {"done": True, "conversation_id": "conv-1"}
+
+
+def test_coalesced_framing_sends_conversation_id_once():
+    events = EventStream("conv-1", framing="coalesced")
+    stream = events.start() + events.content("Hello") + events.done()
+    parsed = parse(stream)
+    assert parsed[0] == ("meta", ['{"conversation_id":"conv-1"}'])
+    assert json.loads(parsed[1][1][0]) == {"content": "Hello"}
+    assert json.loads(parsed[2][1][0]) == {"done": True, "conversation_id": "conv-1"}
+    assert [line for line in stream.split("\n") if line.startswith("id: ")] == ["id: 1", "id: 2", "id: 3"]
+
+
+def test_compact_content_splits_lines():
+    events = EventStream("conv-1", compact=True)
+    assert parse(events.content("one\r\ntwo\n\nthree")) == [(None, ["one", "two", "", "three"])]
+    assert parse(events.error("boom"))[0][0] == "error"